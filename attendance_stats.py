@@ -0,0 +1,137 @@
+"""
+Attendance analytics over the AttendanceMonth bitmaps.
+
+Each AttendanceMonth row is one student's BS month in one class as present, absent
+and late day masks (bit d-1 = day d), so rates, streaks and heatmaps are popcounts
+and bit tests over a handful of rows instead of scans of the daily Attendance table.
+Late counts as attended.
+
+attendance_rates() answers arbitrary BS date ranges instead, grouping the daily
+records in SQL over the covering (date_ord, class_id, student_id, status) index.
+"""
+from database import db, Attendance, AttendanceMonth, Student, Class, Instructor
+from bs_calendar import days_in_month
+
+def _days(mask):
+    """Days (1-based) set in a month mask, in order."""
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length()
+        mask ^= lowest
+
+def summarize(rows):
+    """Totals and attendance rate (percent, or None when nothing is marked) over AttendanceMonth rows."""
+    present = sum(r.present_mask.bit_count() for r in rows)
+    late = sum(r.late_mask.bit_count() for r in rows)
+    absent = sum(r.absent_mask.bit_count() for r in rows)
+    marked = present + late + absent
+    return {
+        'present': present,
+        'late': late,
+        'absent': absent,
+        'marked': marked,
+        'rate': round((present + late) * 100.0 / marked, 1) if marked else None,
+    }
+
+def month_rates(class_id, period):
+    """{student_id: attendance rate} for one class in one BS month."""
+    return {
+        row.student_id: summarize([row])['rate']
+        for row in AttendanceMonth.query.filter_by(class_id=class_id, period=period)
+    }
+
+def attendance_streaks(rows):
+    """
+    Streaks over one student's AttendanceMonth rows for one class, in date order: the
+    current run of attended or absent classes (one of them is 0) and the longest attended run.
+    """
+    current_attended = current_absent = longest = 0
+    for row in sorted(rows, key=lambda r: r.period):
+        for day in _days(row.present_mask | row.late_mask | row.absent_mask):
+            if row.absent_mask >> (day - 1) & 1:
+                current_absent += 1
+                current_attended = 0
+            else:
+                current_attended += 1
+                current_absent = 0
+                longest = max(longest, current_attended)
+    return {'current_attended': current_attended, 'current_absent': current_absent, 'longest_attended': longest}
+
+def class_month_heatmap(class_id, year, month):
+    """Per day of a BS month: how many of the class's students were present, late and absent."""
+    rows = AttendanceMonth.query.filter_by(class_id=class_id, period=year * 100 + month).all()
+    heatmap = []
+    for day in range(1, days_in_month(year, month) + 1):
+        bit = 1 << (day - 1)
+        present = sum(1 for r in rows if r.present_mask & bit)
+        late = sum(1 for r in rows if r.late_mask & bit)
+        absent = sum(1 for r in rows if r.absent_mask & bit)
+        marked = present + late + absent
+        heatmap.append({
+            'day': day,
+            'present': present,
+            'late': late,
+            'absent': absent,
+            'rate': round((present + late) * 100.0 / marked, 1) if marked else None,
+        })
+    return heatmap
+
+RATE_GROUPS = ('student', 'class', 'instructor')
+RATE_SORTS = {
+    'rate': lambda c: c.rate,
+    '-rate': lambda c: c.rate.desc(),
+    'name': lambda c: c.name,
+    'records': lambda c: c.records.desc(),
+}
+
+def _rate_query(group, start_ord, end_ord, min_records):
+    attended = db.func.sum(db.case((Attendance.status.in_(('Present', 'Late')), 1), else_=0))
+    records = db.func.count(Attendance.id)
+    if group == 'student':
+        key, name = Student.id, Student.name
+        query = db.select().select_from(Attendance).join(Student, Student.id == Attendance.student_id)
+    elif group == 'class':
+        key, name = Class.id, Class.name
+        query = db.select().select_from(Attendance).join(Class, Class.id == Attendance.class_id)
+    else:
+        key, name = Class.instructor_id, db.func.coalesce(Instructor.name, 'Unassigned')
+        query = (db.select().select_from(Attendance).join(Class, Class.id == Attendance.class_id)
+                 .outerjoin(Instructor, Instructor.id == Class.instructor_id))
+    return (query.add_columns(
+                key.label('id'), name.label('name'), attended.label('attended'), records.label('records'),
+                db.func.sum(db.case((Attendance.status == 'Absent', 1), else_=0)).label('absent'),
+                (attended * 100.0 / records).label('rate'))
+            .where(Attendance.date_ord.between(start_ord, end_ord))
+            .group_by(key, name)
+            .having(records >= min_records))
+
+def attendance_rates(group, start_ord, end_ord, page=1, per_page=50, sort='rate', min_records=1):
+    """
+    One page of attendance rates per student, class or instructor over an inclusive BS
+    day-ordinal range, lowest rate first by default. Grouping, sorting and paging all
+    happen in SQL. Returns {'total', 'page', 'per_page', 'rows'}.
+    """
+    if group not in RATE_GROUPS:
+        raise ValueError(f"Unknown group: {group!r}")
+    if sort not in RATE_SORTS:
+        raise ValueError(f"Unknown sort: {sort!r}")
+    grouped = _rate_query(group, start_ord, end_ord, min_records).subquery()
+    total = db.session.execute(db.select(db.func.count()).select_from(grouped)).scalar()
+    rows = db.session.execute(
+        db.select(grouped)
+        .order_by(RATE_SORTS[sort](grouped.c), grouped.c.name, grouped.c.id)
+        .limit(per_page).offset((page - 1) * per_page)
+    ).all()
+    return {
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'rows': [{
+            'id': row.id,
+            'name': row.name,
+            'records': row.records,
+            'attended': row.attended,
+            'absent': row.absent,
+            'rate': round(row.rate, 1),
+        } for row in rows],
+    }
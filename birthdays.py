@@ -0,0 +1,35 @@
+"""
+Birthday lookups over the indexed BS (dob_month, dob_day) columns of Student.
+
+Shared by the dashboard's birthday panel and the notification feed.
+"""
+from database import db, Student
+from bs_calendar import ordinal_to_ymd, days_in_month, today_ordinal
+
+def upcoming_birthdays(within_days, today_ord=None):
+    """
+    Active students whose BS birthday falls in the next `within_days` days (0 = today),
+    nearest first. Uses the (dob_month, dob_day) index: the window is turned into
+    one day range per calendar month it touches, so year wrap needs no special case.
+    A day the month lacks this year (e.g. Asar 32) counts on the month's last day.
+    """
+    today_ord = today_ord or today_ordinal()
+    days_until = {}
+    for offset in range(within_days + 1):
+        year, month, day = ordinal_to_ymd(today_ord + offset)
+        last_day = day == days_in_month(year, month)
+        for d in range(day, 33 if last_day else day + 1):
+            days_until.setdefault((month, d), offset)
+
+    ranges = {}
+    for month, day in days_until:
+        low, high = ranges.get(month, (day, day))
+        ranges[month] = (min(low, day), max(high, day))
+    students = Student.query.filter(
+        Student.status == 'Active',
+        db.or_(*[db.and_(Student.dob_month == month, Student.dob_day.between(low, high))
+                 for month, (low, high) in ranges.items()])
+    ).all()
+    # A window over a year long can touch a month twice; drop days outside it
+    students = [s for s in students if (s.dob_month, s.dob_day) in days_until]
+    return sorted(students, key=lambda s: days_until[(s.dob_month, s.dob_day)])
@@ -0,0 +1,119 @@
+"""
+Bikram Sambat (BS) calendar.
+
+Dates are stored as 'YYYY-MM-DD' BS strings. Next to each one the models keep
+an integer day ordinal (days since 1975-01-01 BS, as nepali_datetime counts them)
+so ranges can be compared and indexed numerically.
+
+The ordinal of every month's first day is precomputed once at import, so month
+lengths, month arithmetic and BS <-> ordinal <-> AD conversion are table lookups
+instead of constructing nepali_datetime.date objects and catching ValueError.
+"""
+import bisect
+from datetime import timedelta
+import nepali_datetime
+
+MINYEAR = nepali_datetime.MINYEAR
+MAXYEAR = nepali_datetime.MAXYEAR
+
+def _build_month_starts():
+    starts = [nepali_datetime.date(year, month, 1).toordinal()
+              for year in range(MINYEAR, MAXYEAR + 1) for month in range(1, 13)]
+    starts.append(nepali_datetime.date.max.toordinal() + 1)
+    return starts
+
+# _MONTH_STARTS[(year - MINYEAR) * 12 + month - 1] is the ordinal of day 1 of that
+# month; the trailing sentinel closes the last month.
+_MONTH_STARTS = _build_month_starts()
+# AD date of ordinal 0, so ordinal n is _AD_EPOCH + n days
+_AD_EPOCH = nepali_datetime.date.fromordinal(1).to_datetime_date() - timedelta(days=1)
+
+def _month_index(year, month):
+    if not (MINYEAR <= year <= MAXYEAR and 1 <= month <= 12):
+        raise ValueError(f"BS month out of range: {year}-{month}")
+    return (year - MINYEAR) * 12 + month - 1
+
+def days_in_month(year, month):
+    index = _month_index(year, month)
+    return _MONTH_STARTS[index + 1] - _MONTH_STARTS[index]
+
+def year_end(year):
+    """'YYYY-MM-DD' of the last day of a BS year."""
+    return format_bs(year, 12, days_in_month(year, 12))
+
+def is_valid(year, month, day):
+    return MINYEAR <= year <= MAXYEAR and 1 <= month <= 12 and 1 <= day <= days_in_month(year, month)
+
+def parse_bs(value):
+    """'YYYY-M-D' (padded or not) -> (year, month, day), or None if not a valid BS date."""
+    if not value:
+        return None
+    try:
+        year, month, day = (int(p) for p in str(value).strip().split('-'))
+    except ValueError:
+        return None
+    return (year, month, day) if is_valid(year, month, day) else None
+
+def format_bs(year, month, day):
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+def normalize_bs(value):
+    """Zero-pads a valid BS date string; returns other values unchanged."""
+    parsed = parse_bs(value)
+    return format_bs(*parsed) if parsed else value
+
+def ymd_to_ordinal(year, month, day):
+    return _MONTH_STARTS[_month_index(year, month)] + day - 1
+
+def ordinal_to_ymd(ordinal):
+    index = bisect.bisect_right(_MONTH_STARTS, ordinal) - 1
+    if index < 0 or index >= len(_MONTH_STARTS) - 1:
+        raise ValueError(f"BS ordinal out of range: {ordinal}")
+    return MINYEAR + index // 12, index % 12 + 1, ordinal - _MONTH_STARTS[index] + 1
+
+def to_ordinal(value):
+    """BS date string or nepali_datetime.date -> day ordinal, or None."""
+    if isinstance(value, nepali_datetime.date):
+        return ymd_to_ordinal(value.year, value.month, value.day)
+    parsed = parse_bs(value)
+    return ymd_to_ordinal(*parsed) if parsed else None
+
+def from_ordinal(ordinal):
+    """Day ordinal -> 'YYYY-MM-DD' BS string."""
+    return format_bs(*ordinal_to_ymd(ordinal))
+
+def to_ad(ordinal):
+    """Day ordinal -> datetime.date (AD)."""
+    return _AD_EPOCH + timedelta(days=ordinal)
+
+def from_ad(ad_date):
+    """datetime.date (AD) -> day ordinal."""
+    return (ad_date - _AD_EPOCH).days
+
+def today_ordinal():
+    return to_ordinal(nepali_datetime.date.today())
+
+def add_months(year, month, count):
+    """(year, month) shifted by `count` months (may be negative)."""
+    index = _month_index(year, month) + count
+    return MINYEAR + index // 12, index % 12 + 1
+
+def add_months_to_date(value, count):
+    """BS date string shifted by `count` months, clamping the day to the target month's length."""
+    parsed = parse_bs(value)
+    if not parsed:
+        raise ValueError(f"Invalid BS date: {value!r}")
+    year, month = add_months(parsed[0], parsed[1], count)
+    return format_bs(year, month, min(parsed[2], days_in_month(year, month)))
+
+def iter_months(start, end):
+    """Yields (year, month) from `start` to `end` inclusive; both are (year, month) pairs."""
+    index, last = _month_index(*start), _month_index(*end)
+    while index <= last:
+        yield MINYEAR + index // 12, index % 12 + 1
+        index += 1
+
+def month_bounds(year, month):
+    """(first, last) day ordinals of a BS month."""
+    index = _month_index(year, month)
+    return _MONTH_STARTS[index], _MONTH_STARTS[index + 1] - 1
@@ -0,0 +1,59 @@
+"""
+Process-local cache for derived read models (the alert list, dashboard sections).
+
+Each cached topic declares the tables it is computed from. database.py reports
+the tables written by every committed transaction, which bumps the version of
+the dependent topics; entries stored under an older version are never served
+again. The TTL only bounds staleness from writes made outside this process
+(migration scripts, a second worker).
+"""
+import threading
+import time
+
+DEFAULT_TTL = 300
+
+_changed = threading.Condition()
+_versions = {}      # topic -> int
+_dependencies = {}  # topic -> set of table names
+_entries = {}       # (topic, key) -> (version, expires_at, value)
+
+def depends_on(topic, *tables):
+    """Declares that `topic` is derived from the given tables."""
+    _dependencies.setdefault(topic, set()).update(tables)
+
+def version(topic):
+    return _versions.get(topic, 0)
+
+def invalidate(*topics):
+    with _changed:
+        for topic in topics:
+            _versions[topic] = _versions.get(topic, 0) + 1
+            for entry_key in [k for k in _entries if k[0] == topic]:
+                del _entries[entry_key]
+        _changed.notify_all()
+
+def tables_changed(tables):
+    """Called after a commit with the names of the tables it wrote."""
+    topics = [topic for topic, deps in _dependencies.items() if deps & set(tables)]
+    if topics:
+        invalidate(*topics)
+
+def get_or_compute(topic, key, compute, ttl=DEFAULT_TTL):
+    """Cached value of compute() for (topic, key), recomputed after invalidation or TTL expiry."""
+    with _changed:
+        current = _versions.get(topic, 0)
+        entry = _entries.get((topic, key))
+        if entry and entry[0] == current and entry[1] > time.monotonic():
+            return entry[2]
+    value = compute()
+    with _changed:
+        # Don't store a value computed while a write was committing
+        if _versions.get(topic, 0) == current:
+            _entries[(topic, key)] = (current, time.monotonic() + ttl, value)
+    return value
+
+def wait_for_change(topic, seen_version, timeout):
+    """Blocks until `topic` moves past `seen_version` or `timeout` seconds pass; returns the current version."""
+    with _changed:
+        _changed.wait_for(lambda: _versions.get(topic, 0) != seen_version, timeout)
+        return _versions.get(topic, 0)
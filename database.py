@@ -1,6 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from datetime import datetime
 from flask_login import UserMixin
+from bs_calendar import parse_bs, format_bs, to_ordinal, month_bounds
+import cache
 
 db = SQLAlchemy()
 
@@ -8,7 +12,12 @@ class Student(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20), nullable=False)
+    # Digits-only key of `phone` (and reversed, for ends-with lookups); filled on every save
+    phone_digits = db.Column(db.String(20), nullable=True, index=True)
+    phone_digits_rev = db.Column(db.String(20), nullable=True, index=True)
     dob = db.Column(db.String(20), nullable=True)
+    dob_month = db.Column(db.Integer, nullable=True) # BS month/day of `dob`, for indexed birthday lookups
+    dob_day = db.Column(db.Integer, nullable=True)
     guardian_name = db.Column(db.String(100), nullable=True)
     emergency_contact = db.Column(db.String(20), nullable=True)
     status = db.Column(db.String(20), default='Active') # Active, Inactive
@@ -29,11 +38,17 @@ class Student(db.Model):
     workshop_enrollments = db.relationship('WorkshopEnrollment', backref='student', lazy=True, cascade="all, delete-orphan")
     package_enrollments = db.relationship('PackageEnrollment', backref='student', lazy=True, cascade="all, delete-orphan")
     product_sales = db.relationship('ProductSale', backref='student', lazy=True, cascade="all, delete-orphan")
+    # Materialized balance, joined in with every student load (maintained by sync_student_balances)
+    balance_entry = db.relationship('StudentBalance', uselist=False, lazy='joined', viewonly=True)
+
+    __table_args__ = (
+        db.Index('ix_student_birthday', 'dob_month', 'dob_day'),
+        db.Index('ix_student_name', 'name', 'id'), # Keyset order of the student list
+    )
 
     def get_balance(self):
-        # Calculate balance dynamically or use the last transaction's balance_after
-        last_txn = LedgerTransaction.query.filter_by(student_id=self.id, is_void=False).order_by(LedgerTransaction.date.desc(), LedgerTransaction.id.desc()).first()
-        return last_txn.balance_after if last_txn else 0.0
+        # Read the materialized balance instead of querying the ledger per student
+        return self.balance_entry.balance if self.balance_entry else 0.0
 
 class Instructor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -51,11 +66,29 @@ class Instructor(db.Model):
 class Class(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False) # e.g., Jazz Batch A
-    instructor_id = db.Column(db.Integer, db.ForeignKey('instructor.id'), nullable=True)
+    instructor_id = db.Column(db.Integer, db.ForeignKey('instructor.id'), nullable=True, index=True)
     schedule = db.Column(db.String(200), nullable=True) # e.g., "Mon, Wed, Fri 6PM"
     capacity = db.Column(db.Integer, nullable=True)
+    room = db.Column(db.String(50), nullable=True) # Copied onto each ClassSession by sync_sessions
     
     enrollments = db.relationship('Enrollment', backref='class_info', lazy=True)
+    sessions = db.relationship('ClassSession', back_populates='class_info', cascade='all, delete-orphan',
+                               order_by='[ClassSession.weekday, ClassSession.start_time]')
+
+class ClassSession(db.Model):
+    # One weekly slot of a class, parsed from Class.schedule (see timetable.py)
+    id = db.Column(db.Integer, primary_key=True)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False, index=True)
+    weekday = db.Column(db.Integer, nullable=False) # 0 = Monday, as datetime.weekday()
+    start_time = db.Column(db.String(5), nullable=True) # 'HH:MM', 24-hour
+    end_time = db.Column(db.String(5), nullable=True)
+    room = db.Column(db.String(50), nullable=True)
+
+    class_info = db.relationship('Class', back_populates='sessions')
+
+    __table_args__ = (
+        db.Index('ix_class_session_day', 'weekday', 'start_time'),
+    )
 
 class Enrollment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -70,11 +103,23 @@ class Attendance(db.Model):
     date = db.Column(db.String(20), nullable=False, default=lambda: datetime.now().strftime('%Y-%m-%d'))
     status = db.Column(db.String(20), nullable=False) # Present, Absent, Late
     remarks = db.Column(db.Text, nullable=True)
+    date_ord = db.Column(db.Integer, nullable=True) # BS day ordinal of `date`
+
+    __table_args__ = (
+        db.Index('ix_attendance_student_date', 'student_id', 'date_ord'),
+        db.Index('ix_attendance_class_date', 'class_id', 'date_ord'),
+        # Covers the date-range GROUP BYs of the attendance rate report
+        db.Index('ix_attendance_date_range', 'date_ord', 'class_id', 'student_id', 'status'),
+        # One record per student per class per day; attendance saves upsert against it
+        db.Index('uq_attendance_class_student_date', 'class_id', 'student_id', 'date', unique=True),
+    )
 
 class LedgerTransaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
-    date = db.Column(db.String(20), default=lambda: datetime.now().strftime('%Y-%m-%d'))
+    # active_history: the rollup hook needs the old month when a date is edited
+    date = db.column_property(db.Column(db.String(20), default=lambda: datetime.now().strftime('%Y-%m-%d'), index=True), active_history=True)
+    date_ord = db.Column(db.Integer, nullable=True, index=True) # BS day ordinal of `date`
     description = db.Column(db.String(200), nullable=False)
     debit = db.Column(db.Float, default=0.0) # Charge (Increases what they owe)
     credit = db.Column(db.Float, default=0.0) # Payment (Decreases what they owe)
@@ -82,6 +127,27 @@ class LedgerTransaction(db.Model):
     txn_type = db.Column(db.String(20), default='FEE') # FEE, PAYMENT, ADJUSTMENT
     is_void = db.Column(db.Boolean, default=False)
 
+    # Structured fee key (replaces description matching for billing-period lookups)
+    fee_kind = db.Column(db.String(20), nullable=True) # MONTHLY, ADMISSION, PACKAGE, WORKSHOP, PRODUCT
+    period_year = db.Column(db.Integer, nullable=True) # BS year billed (MONTHLY only)
+    period_month = db.Column(db.Integer, nullable=True) # BS month billed (MONTHLY only)
+
+    # Source entity that created the row (at most one is set). Deleting the source clears the id
+    # (SQLite reuses freed ids), so the removal is noted in the description instead; see removal_note()
+    workshop_enrollment_id = db.Column(db.Integer, db.ForeignKey('workshop_enrollment.id'), nullable=True, index=True)
+    package_enrollment_id = db.Column(db.Integer, db.ForeignKey('package_enrollment.id'), nullable=True, index=True)
+    product_sale_id = db.Column(db.Integer, db.ForeignKey('product_sale.id'), nullable=True, index=True)
+
+    __table_args__ = (
+        db.Index('ix_ledger_fee_period', 'fee_kind', 'period_year', 'period_month', 'student_id'),
+    )
+
+class StudentBalance(db.Model):
+    # One row per student with ledger history: balance_after of the latest non-void transaction
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    balance = db.Column(db.Float, nullable=False, default=0.0)
+    last_txn_id = db.Column(db.Integer, nullable=True)
+
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(100), unique=True, nullable=False)
@@ -102,7 +168,9 @@ class User(db.Model, UserMixin):
 
 class Expense(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.String(20), default=lambda: datetime.now().strftime('%Y-%m-%d'))
+    # active_history: the rollup hook needs the old month when a date is edited
+    date = db.column_property(db.Column(db.String(20), default=lambda: datetime.now().strftime('%Y-%m-%d'), index=True), active_history=True)
+    date_ord = db.Column(db.Integer, nullable=True, index=True) # BS day ordinal of `date`
     amount = db.Column(db.Float, nullable=False)
     category = db.Column(db.String(50), nullable=False) # Rent, Utility, Salary, Misc
     description = db.Column(db.String(200), nullable=True)
@@ -120,6 +188,73 @@ class Settings(db.Model):
     currency = db.Column(db.String(10), default='Rs')
     default_admission_fee = db.Column(db.Float, default=1000.0)
     default_monthly_fee = db.Column(db.Float, default=5000.0)
+    absence_alert_threshold = db.Column(db.Integer, default=3) # Consecutive absences before an alert
+    due_alert_threshold = db.Column(db.Float, default=5000.0) # Balance above which a due alert is raised
+    notifications_generated_ord = db.Column(db.Integer, nullable=True) # BS day of the last daily notification pass
+
+class MonthlyFinanceSummary(db.Model):
+    # Per BS month totals for the dashboard chart and reports (maintained by sync_monthly_summaries)
+    period = db.Column(db.Integer, primary_key=True) # BS year * 100 + month, e.g. 208107
+    ledger_credit = db.Column(db.Float, default=0.0) # Non-void payments received
+    ledger_debit = db.Column(db.Float, default=0.0) # Non-void charges billed
+    guest_income = db.Column(db.Float, default=0.0) # Guest workshop payments (not in ledger)
+    expense_total = db.Column(db.Float, default=0.0) # Non-void expenses
+
+class AttendanceMonth(db.Model):
+    # One BS month of a student's attendance in one class as day bitmasks: bit d-1 set
+    # means a record on day d. Maintained by sync_attendance_months; read by attendance_stats.py
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
+    period = db.Column(db.Integer, nullable=False) # BS year * 100 + month
+    present_mask = db.Column(db.Integer, nullable=False, default=0)
+    absent_mask = db.Column(db.Integer, nullable=False, default=0)
+    late_mask = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('uq_attendance_month', 'student_id', 'class_id', 'period', unique=True),
+        db.Index('ix_attendance_month_class', 'class_id', 'period'),
+    )
+
+class AbsenceStreak(db.Model):
+    # Trailing run of 'Absent' records per student: across all classes (class_id NULL)
+    # and per class. Only students currently on a streak have rows (maintained by sync_absence_streaks)
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False, index=True)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=True)
+    streak = db.Column(db.Integer, nullable=False)
+    last_class_id = db.Column(db.Integer, nullable=True) # Class of the most recent absence
+
+    student = db.relationship('Student', lazy='joined')
+
+    __table_args__ = (
+        db.Index('ix_absence_streak_lookup', 'class_id', 'streak'),
+    )
+
+class Notification(db.Model):
+    # Alert feed for the bell and dashboard panels (maintained by notifications.py)
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False) # birthday, absence, due, package_expiry, admission_renewal
+    key = db.Column(db.String(100), unique=True, nullable=False) # Dedupe key, e.g. 'due:12'
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=True, index=True)
+    ref_id = db.Column(db.Integer, nullable=True) # Class for absences, package for expiries
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.String(300), nullable=True)
+    value = db.Column(db.Float, nullable=True) # Streak length or balance, for sorting and panels
+    finance_only = db.Column(db.Boolean, default=False) # Only shown to users who can view finance
+    active = db.Column(db.Boolean, default=True)
+    created_ord = db.Column(db.Integer, nullable=True) # BS day ordinal when (re)raised
+
+    student = db.relationship('Student', lazy='joined')
+
+    __table_args__ = (
+        db.Index('ix_notification_feed', 'active', 'kind'),
+    )
+
+class NotificationDismissal(db.Model):
+    # Per-user "read" state; cleared when the notification is raised again
+    notification_id = db.Column(db.Integer, db.ForeignKey('notification.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
 
 class ProgressReport(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -136,6 +271,8 @@ class Workshop(db.Model):
     name = db.Column(db.String(100), nullable=False)
     start_date = db.Column(db.String(20), nullable=False) # BS Date
     end_date = db.Column(db.String(20), nullable=False) # BS Date
+    start_ord = db.Column(db.Integer, nullable=True, index=True) # BS day ordinals of the dates
+    end_ord = db.Column(db.Integer, nullable=True)
     fee = db.Column(db.Float, nullable=False)
     description = db.Column(db.Text, nullable=True)
     
@@ -148,7 +285,11 @@ class WorkshopEnrollment(db.Model):
     guest_name = db.Column(db.String(100), nullable=True) # For outside students
     guest_phone = db.Column(db.String(20), nullable=True) # For outside students
     amount_paid = db.Column(db.Float, default=0.0)
-    date = db.Column(db.String(20), default=lambda: datetime.now().strftime('%Y-%m-%d'))
+    # active_history: the rollup hook needs the old month when a date is edited
+    date = db.column_property(db.Column(db.String(20), default=lambda: datetime.now().strftime('%Y-%m-%d'), index=True), active_history=True)
+    date_ord = db.Column(db.Integer, nullable=True, index=True) # BS day ordinal of `date`
+
+    ledger_entries = db.relationship('LedgerTransaction', backref='workshop_enrollment', lazy=True)
 
 class Package(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -163,11 +304,19 @@ class PackageEnrollment(db.Model):
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
     start_date = db.Column(db.String(20), nullable=False) # BS Date
     end_date = db.Column(db.String(20), nullable=False) # BS Date
+    start_ord = db.Column(db.Integer, nullable=True) # BS day ordinals of the dates
+    end_ord = db.Column(db.Integer, nullable=True)
     total_price = db.Column(db.Float, nullable=False)
     amount_paid = db.Column(db.Float, default=0.0)
     payment_deadline = db.Column(db.String(20), nullable=True) # BS Date
     
+    __table_args__ = (
+        db.Index('ix_package_enrollment_student_range', 'student_id', 'start_ord', 'end_ord'),
+        db.Index('ix_package_enrollment_range', 'start_ord', 'end_ord'),
+    )
+
     package = db.relationship('Package', backref='enrollments', lazy=True)
+    ledger_entries = db.relationship('LedgerTransaction', backref='package_enrollment', lazy=True)
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -184,4 +333,392 @@ class ProductSale(db.Model):
     price_sold = db.Column(db.Float, nullable=False) # Can be discounted
     
     product = db.relationship('Product', backref='sales', lazy=True)
+    ledger_entries = db.relationship('LedgerTransaction', backref='product_sale', lazy=True)
+
+
+# --- Materialized Balances ---
+def sync_student_balances(connection, student_ids=None):
+    """
+    Rewrites StudentBalance rows from the ledger.
+    student_ids: iterable of ids to refresh, or None to rebuild every row.
+    Runs on the given connection so it shares the caller's transaction.
+    """
+    if student_ids is None:
+        chunks = [None]
+    else:
+        ids = sorted(set(student_ids))
+        if not ids:
+            return
+        chunks = [ids[i:i + 500] for i in range(0, len(ids), 500)]
+
+    for chunk in chunks:
+        ranked = db.select(
+            LedgerTransaction.student_id,
+            LedgerTransaction.balance_after,
+            LedgerTransaction.id,
+            db.func.row_number().over(
+                partition_by=LedgerTransaction.student_id,
+                order_by=(LedgerTransaction.date.desc(), LedgerTransaction.id.desc())
+            ).label('rn')
+        ).where(LedgerTransaction.is_void == False)
+        clear = db.delete(StudentBalance)
+        if chunk is not None:
+            ranked = ranked.where(LedgerTransaction.student_id.in_(chunk))
+            clear = clear.where(StudentBalance.student_id.in_(chunk))
+        ranked = ranked.subquery()
+
+        connection.execute(clear)
+        connection.execute(
+            db.insert(StudentBalance).from_select(
+                ['student_id', 'balance', 'last_txn_id'],
+                db.select(ranked.c.student_id, ranked.c.balance_after, ranked.c.id).where(ranked.c.rn == 1)
+            )
+        )
+
+def rebuild_student_balances():
+    """Regenerates the whole StudentBalance table from LedgerTransaction."""
+    sync_student_balances(db.session.connection())
+    db.session.commit()
+
+@event.listens_for(Session, 'after_flush')
+def _sync_balances_after_flush(session, flush_context):
+    # new/dirty/deleted still describe the flushed objects at this point
+    touched = {
+        obj.student_id
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if isinstance(obj, LedgerTransaction) and obj.student_id is not None
+    }
+    if touched:
+        sync_student_balances(session.connection(), touched)
+        session.info.setdefault('stale_balances', set()).update(touched)
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _expire_stale_balances(session, flush_context):
+    # Loaded Student objects still hold the pre-flush balance row
+    for student_id in session.info.pop('stale_balances', ()):
+        student = session.identity_map.get(session.identity_key(Student, student_id))
+        if student is not None:
+            session.expire(student, ['balance_entry'])
+        balance = session.identity_map.get(session.identity_key(StudentBalance, student_id))
+        if balance is not None:
+            session.expire(balance)
+
+# --- Monthly Finance Rollup ---
+def bs_period(date_str):
+    """'YYYY-MM-DD' BS string -> YYYYMM integer, or None if unparseable."""
+    parsed = parse_bs(date_str)
+    return parsed[0] * 100 + parsed[1] if parsed else None
+
+def sync_monthly_summaries(connection, periods=None):
+    """
+    Recomputes MonthlyFinanceSummary rows for the given YYYYMM periods from the
+    source tables (indexed date range per month), or every month when periods is None.
+    """
+    sources = [
+        ('ledger_credit', LedgerTransaction.date, LedgerTransaction.date_ord, LedgerTransaction.credit, LedgerTransaction.is_void == False),
+        ('ledger_debit', LedgerTransaction.date, LedgerTransaction.date_ord, LedgerTransaction.debit, LedgerTransaction.is_void == False),
+        ('guest_income', WorkshopEnrollment.date, WorkshopEnrollment.date_ord, WorkshopEnrollment.amount_paid, WorkshopEnrollment.student_id == None),
+        ('expense_total', Expense.date, Expense.date_ord, Expense.amount, Expense.is_void == False),
+    ]
+
+    if periods is None:
+        totals = {}
+        for field, date_col, ord_col, amount_col, condition in sources:
+            month = db.func.substr(date_col, 1, 7)
+            for month_str, total in connection.execute(
+                db.select(month, db.func.sum(amount_col)).where(condition).group_by(month)
+            ):
+                period = bs_period(f"{month_str}-01")
+                if period:
+                    month_totals = totals.setdefault(period, {})
+                    month_totals[field] = month_totals.get(field, 0.0) + (total or 0.0)
+        connection.execute(db.delete(MonthlyFinanceSummary))
+    else:
+        periods = {p for p in periods if p}
+        if not periods:
+            return
+        totals = {}
+        for period in periods:
+            low, high = month_bounds(*divmod(period, 100))
+            totals[period] = {
+                field: connection.execute(
+                    db.select(db.func.sum(amount_col)).where(condition, ord_col.between(low, high))
+                ).scalar() or 0.0
+                for field, date_col, ord_col, amount_col, condition in sources
+            }
+        connection.execute(db.delete(MonthlyFinanceSummary).where(MonthlyFinanceSummary.period.in_(periods)))
+
+    rows = []
+    for period, values in totals.items():
+        if any(values.values()):
+            row = {'period': period, 'ledger_credit': 0.0, 'ledger_debit': 0.0, 'guest_income': 0.0, 'expense_total': 0.0}
+            row.update(values)
+            rows.append(row)
+    if rows:
+        connection.execute(db.insert(MonthlyFinanceSummary), rows)
+
+def rebuild_monthly_summaries():
+    """Regenerates the whole MonthlyFinanceSummary table."""
+    sync_monthly_summaries(db.session.connection())
+    db.session.commit()
+
+@event.listens_for(Session, 'after_flush')
+def _sync_summaries_after_flush(session, flush_context):
+    periods = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (LedgerTransaction, Expense, WorkshopEnrollment)):
+            periods.add(bs_period(obj.date))
+            # An edited date moves the amount out of its old month too
+            periods.update(bs_period(old) for old in db.inspect(obj).attrs.date.history.deleted or ())
+    periods.discard(None)
+    if periods:
+        sync_monthly_summaries(session.connection(), periods)
+
+# --- Consecutive Absences ---
+def sync_absence_streaks(connection, student_ids=None):
+    """
+    Rewrites AbsenceStreak rows from Attendance: for each student (and each of their
+    classes) the number of 'Absent' records since the latest non-absent one.
+    student_ids: iterable of ids to refresh, or None to rebuild every row.
+    """
+    if student_ids is None:
+        chunks = [None]
+    else:
+        ids = sorted(set(student_ids))
+        if not ids:
+            return
+        chunks = [ids[i:i + 500] for i in range(0, len(ids), 500)]
+
+    order = (Attendance.date_ord.desc(), Attendance.id.desc())
+    for chunk in chunks:
+        clear = db.delete(AbsenceStreak)
+        if chunk is not None:
+            clear = clear.where(AbsenceStreak.student_id.in_(chunk))
+        connection.execute(clear)
+
+        for partition in [(Attendance.student_id,), (Attendance.student_id, Attendance.class_id)]:
+            # breaks = non-absent records at or after this one, newest first
+            ranked = db.select(
+                Attendance.student_id,
+                Attendance.class_id,
+                db.func.row_number().over(partition_by=partition, order_by=order).label('rn'),
+                db.func.sum(db.case((Attendance.status == 'Absent', 0), else_=1)).over(
+                    partition_by=partition, order_by=order).label('breaks')
+            )
+            if chunk is not None:
+                ranked = ranked.where(Attendance.student_id.in_(chunk))
+            ranked = ranked.subquery()
+
+            per_class = len(partition) == 2
+            group = [ranked.c.student_id, ranked.c.class_id] if per_class else [ranked.c.student_id]
+            connection.execute(
+                db.insert(AbsenceStreak).from_select(
+                    ['student_id', 'class_id', 'streak', 'last_class_id'],
+                    db.select(
+                        ranked.c.student_id,
+                        ranked.c.class_id if per_class else db.null(),
+                        db.func.count(),
+                        db.func.max(db.case((ranked.c.rn == 1, ranked.c.class_id)))
+                    ).where(ranked.c.breaks == 0).group_by(*group)
+                )
+            )
+
+def rebuild_absence_streaks():
+    """Regenerates the whole AbsenceStreak table from Attendance."""
+    sync_absence_streaks(db.session.connection())
+    db.session.commit()
+
+@event.listens_for(Session, 'after_flush')
+def _sync_streaks_after_flush(session, flush_context):
+    touched = {
+        obj.student_id
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if isinstance(obj, Attendance) and obj.student_id is not None
+    }
+    if touched:
+        sync_absence_streaks(session.connection(), touched)
+
+# --- Attendance Bitmaps ---
+def _attendance_period():
+    # Dates are stored zero-padded ('YYYY-MM-DD'), so the month and day are fixed substrings
+    return (db.cast(db.func.substr(Attendance.date, 1, 4), db.Integer) * 100
+            + db.cast(db.func.substr(Attendance.date, 6, 2), db.Integer))
+
+def sync_attendance_months(connection, keys=None):
+    """
+    Rewrites AttendanceMonth rows from Attendance (one grouped query per chunk).
+    keys: iterable of (student_id, class_id, period) to refresh, or None to rebuild every row.
+    """
+    period = _attendance_period()
+    day_bit = db.literal(1).op('<<', return_type=db.Integer)(db.cast(db.func.substr(Attendance.date, 9, 2), db.Integer) - 1)
+
+    def mask(status):
+        # The unique (class, student, date) index means each bit is summed at most once
+        return db.func.coalesce(db.func.sum(db.case((Attendance.status == status, day_bit), else_=0)), 0)
+
+    select_months = (
+        db.select(Attendance.student_id, Attendance.class_id, period,
+                  mask('Present'), mask('Absent'), mask('Late'))
+        .where(Attendance.date_ord != None)
+        .group_by(Attendance.student_id, Attendance.class_id, period)
+    )
+
+    if keys is None:
+        chunks = [None]
+    else:
+        keys = sorted({k for k in keys if None not in k})
+        if not keys:
+            return
+        chunks = [keys[i:i + 300] for i in range(0, len(keys), 300)]
+
+    for chunk in chunks:
+        query, clear = select_months, db.delete(AttendanceMonth)
+        if chunk is not None:
+            query = query.where(Attendance.student_id.in_({k[0] for k in chunk}),
+                                db.tuple_(Attendance.student_id, Attendance.class_id, period).in_(chunk))
+            clear = clear.where(db.tuple_(AttendanceMonth.student_id, AttendanceMonth.class_id,
+                                          AttendanceMonth.period).in_(chunk))
+        rows = [
+            dict(student_id=student_id, class_id=class_id, period=month,
+                 present_mask=present, absent_mask=absent, late_mask=late)
+            for student_id, class_id, month, present, absent, late in connection.execute(query)
+        ]
+        connection.execute(clear)
+        if rows:
+            connection.execute(db.insert(AttendanceMonth), rows)
+
+def rebuild_attendance_months():
+    """Regenerates the whole AttendanceMonth table from Attendance."""
+    sync_attendance_months(db.session.connection())
+    db.session.commit()
+
+@event.listens_for(Session, 'after_flush')
+def _sync_attendance_months_after_flush(session, flush_context):
+    keys = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Attendance):
+            keys.add((obj.student_id, obj.class_id, bs_period(obj.date)))
+            # A record moved to another day, class or student leaves its old month too
+            state = db.inspect(obj).attrs
+            old = [state[attr].history.deleted or [getattr(obj, attr)] for attr in ('student_id', 'class_id', 'date')]
+            keys.add((old[0][0], old[1][0], bs_period(old[2][0])))
+    if keys:
+        sync_attendance_months(session.connection(), keys)
+
+# --- BS Date Ordinals ---
+# (string column, ordinal column) pairs kept in step on every ORM insert/update
+DATE_ORDINAL_COLUMNS = {
+    LedgerTransaction: [('date', 'date_ord')],
+    Attendance: [('date', 'date_ord')],
+    Expense: [('date', 'date_ord')],
+    WorkshopEnrollment: [('date', 'date_ord')],
+    Workshop: [('start_date', 'start_ord'), ('end_date', 'end_ord')],
+    PackageEnrollment: [('start_date', 'start_ord'), ('end_date', 'end_ord')],
+}
+
+def _fill_date_ordinals(mapper, connection, target):
+    for date_attr, ord_attr in DATE_ORDINAL_COLUMNS[type(target)]:
+        parsed = parse_bs(getattr(target, date_attr))
+        if parsed:
+            # Zero-pad so string comparisons agree with the ordinal
+            setattr(target, date_attr, format_bs(*parsed))
+            setattr(target, ord_attr, to_ordinal(getattr(target, date_attr)))
+        else:
+            setattr(target, ord_attr, None)
+
+for _model in DATE_ORDINAL_COLUMNS:
+    event.listen(_model, 'before_insert', _fill_date_ordinals)
+    event.listen(_model, 'before_update', _fill_date_ordinals)
+
+@event.listens_for(Student, 'before_insert')
+@event.listens_for(Student, 'before_update')
+def _fill_birthday(mapper, connection, target):
+    parsed = parse_bs(target.dob)
+    target.dob_month, target.dob_day = parsed[1:] if parsed else (None, None)
+
+def normalize_phone(phone):
+    """Digits only, without a leading 977 country code on longer numbers ('+977 980-1234567' -> '9801234567')."""
+    digits = ''.join(filter(str.isdigit, phone or ''))
+    if len(digits) > 10 and digits.startswith('977'):
+        digits = digits[3:]
+    return digits or None
+
+@event.listens_for(Student, 'before_insert')
+@event.listens_for(Student, 'before_update')
+def _fill_phone_digits(mapper, connection, target):
+    target.phone_digits = normalize_phone(target.phone)
+    target.phone_digits_rev = target.phone_digits[::-1] if target.phone_digits else None
+
+# --- Full-Text Search ---
+# Contentless FTS5 indexes (rowid = source row id) maintained by SQLite triggers, so ORM,
+# bulk and raw SQL writes all reach them. Queries live in search.py.
+SEARCH_INDEXES = {
+    # fts table -> (source table, indexed columns); phones go in as the normalized phone_digits key
+    'student_fts': ('student', ['name', 'phone_digits']),
+    'class_fts': ('class', ['name']),
+    'ledger_fts': ('ledger_transaction', ['description']),
+}
+
+def _search_values(row, columns):
+    return ', '.join(f'{row}.{column}' for column in columns)
+
+def search_index_ddl(fts):
+    """CREATE statements for one FTS5 table and the triggers that keep it in step."""
+    source, columns = SEARCH_INDEXES[fts]
+    names = ', '.join(columns)
+    insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {_search_values('new', columns)});"
+    delete = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {_search_values('old', columns)});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='', prefix='2 3')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{source}" BEGIN {insert} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{source}" BEGIN {delete} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} ON "{source}" BEGIN {delete} {insert} END',
+    ]
+
+def rebuild_search_index(connection=None):
+    """Recreates every FTS5 table and its triggers from the current definitions, then refills it."""
+    conn = connection or db.session.connection()
+    for fts, (source, columns) in SEARCH_INDEXES.items():
+        # Drop first so an index built with older columns or triggers is replaced
+        for suffix in ('ai', 'ad', 'au'):
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {fts}")
+        for statement in search_index_ddl(fts):
+            conn.exec_driver_sql(statement)
+        table = f'"{source}"'
+        conn.exec_driver_sql(
+            f"INSERT INTO {fts}(rowid, {', '.join(columns)}) SELECT id, {_search_values(table, columns)} FROM {table}"
+        )
+    if connection is None:
+        db.session.commit()
+
+for _fts, (_source, _) in SEARCH_INDEXES.items():
+    _table = db.metadata.tables[_source]
+    for _statement in search_index_ddl(_fts):
+        event.listen(_table, 'after_create', db.DDL(_statement))
+    event.listen(_table, 'before_drop', db.DDL(f"DROP TABLE IF EXISTS {_fts}"))
+
+# --- Cache Invalidation ---
+# Tables written in the current transaction, reported to cache.py once it commits
+@event.listens_for(Session, 'after_flush')
+def _note_flushed_tables(session, flush_context):
+    session.info.setdefault('written_tables', set()).update(
+        obj.__table__.name for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+    )
+
+@event.listens_for(Session, 'do_orm_execute')
+def _note_bulk_tables(orm_execute_state):
+    # Query.delete()/update() and bulk inserts bypass the flush
+    state = orm_execute_state
+    if (state.is_insert or state.is_update or state.is_delete) and state.bind_mapper is not None:
+        state.session.info.setdefault('written_tables', set()).add(state.bind_mapper.local_table.name)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_caches(session):
+    tables = session.info.pop('written_tables', None)
+    if tables:
+        cache.tables_changed(tables)
 
+@event.listens_for(Session, 'after_rollback')
+def _forget_written_tables(session):
+    session.info.pop('written_tables', None)
@@ -0,0 +1,14 @@
+"""
+Daily notification pass (birthdays, absence streaks, dues, package expiries,
+admission renewals). Idempotent: schedule it once a day, e.g. from cron:
+
+    5 0 * * * cd /path/to/app && python generate_notifications.py
+"""
+from app import app
+from database import Notification
+from notifications import generate_notifications
+
+if __name__ == '__main__':
+    with app.app_context():
+        generate_notifications()
+        print(f"{Notification.query.filter_by(active=True).count()} active notifications.")
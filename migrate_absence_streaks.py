@@ -0,0 +1,31 @@
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app import app
+from database import db, AbsenceStreak, rebuild_absence_streaks
+
+def migrate():
+    """
+    Adds settings.absence_alert_threshold, creates the absence_streak table and
+    rebuilds it from attendance. The rebuild is the "recompute everything"
+    command: safe to re-run any time the streaks need regenerating.
+    """
+    with app.app_context():
+        try:
+            db.session.execute(text("ALTER TABLE settings ADD COLUMN absence_alert_threshold INTEGER DEFAULT 3"))
+            db.session.commit()
+            print("Added absence_alert_threshold column to settings.")
+        except OperationalError as e:
+            db.session.rollback()
+            if 'duplicate column name' in str(e).lower():
+                print("absence_alert_threshold already exists in settings.")
+            else:
+                print(f"Error migrating settings: {e}")
+
+        db.create_all()
+        print("Rebuilding absence streaks from attendance...")
+        rebuild_absence_streaks()
+        print(f"{AbsenceStreak.query.filter_by(class_id=None).count()} students currently on an absence streak.")
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
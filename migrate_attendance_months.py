@@ -0,0 +1,17 @@
+from app import app
+from database import db, AttendanceMonth, rebuild_attendance_months
+
+def migrate():
+    """
+    Creates the attendance_month table and rebuilds it from attendance. Safe to
+    re-run any time the bitmaps need regenerating.
+    """
+    with app.app_context():
+        db.create_all()
+        print("Rebuilding attendance bitmaps from attendance...")
+        rebuild_attendance_months()
+        print(f"{AttendanceMonth.query.count()} student-class months stored.")
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
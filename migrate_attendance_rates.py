@@ -0,0 +1,24 @@
+import sqlite3
+import os
+
+def migrate():
+    """Adds the covering index behind the attendance rate report."""
+    db_path = 'instance/dance_academy.db'
+    if not os.path.exists(db_path):
+        if os.path.exists('dance_academy.db'):
+            db_path = 'dance_academy.db'
+        else:
+            print("Database not found.")
+            return
+
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS ix_attendance_date_range "
+        "ON attendance (date_ord, class_id, student_id, status)"
+    )
+    conn.commit()
+    conn.close()
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
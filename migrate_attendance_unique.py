@@ -0,0 +1,31 @@
+from sqlalchemy import text
+from app import app
+from database import db, rebuild_absence_streaks
+from notifications import generate_notifications
+
+def migrate():
+    """
+    Removes duplicate attendance records (keeping the latest per student, class
+    and day), adds the unique index the attendance upsert relies on, and rebuilds
+    the streaks and alerts derived from attendance.
+    """
+    with app.app_context():
+        removed = db.session.execute(text(
+            "DELETE FROM attendance WHERE id NOT IN "
+            "(SELECT MAX(id) FROM attendance GROUP BY class_id, student_id, date)"
+        )).rowcount
+        print(f"Removed {removed} duplicate attendance records.")
+        db.session.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_attendance_class_student_date "
+            "ON attendance (class_id, student_id, date)"
+        ))
+        db.session.commit()
+
+        if removed:
+            print("Rebuilding absence streaks and notifications...")
+            rebuild_absence_streaks()
+            generate_notifications()
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,43 @@
+import sqlite3
+import os
+from bs_calendar import parse_bs
+
+def migrate():
+    db_path = 'instance/dance_academy.db'
+    if not os.path.exists(db_path):
+        if os.path.exists('dance_academy.db'):
+            db_path = 'dance_academy.db'
+        else:
+            print("Database not found.")
+            return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    for column in ['dob_month', 'dob_day']:
+        try:
+            cursor.execute(f"ALTER TABLE student ADD COLUMN {column} INTEGER")
+            print(f"Added {column} column to student.")
+        except sqlite3.OperationalError as e:
+            if 'duplicate column name' in str(e).lower():
+                print(f"{column} already exists in student.")
+            else:
+                print(f"Error migrating student: {e}")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_student_birthday ON student (dob_month, dob_day)")
+
+    # Backfill month/day from the BS date of birth
+    rows = cursor.execute("SELECT id, dob FROM student").fetchall()
+    updates = []
+    for student_id, dob in rows:
+        parsed = parse_bs(dob)
+        updates.append((parsed[1], parsed[2], student_id) if parsed else (None, None, student_id))
+    cursor.executemany("UPDATE student SET dob_month = ?, dob_day = ? WHERE id = ?", updates)
+    print(f"Backfilled birthdays for {sum(1 for u in updates if u[0])} of {len(rows)} students.")
+
+    conn.commit()
+    conn.close()
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,43 @@
+import sqlite3
+import os
+
+def migrate():
+    db_path = 'instance/dance_academy.db'
+    if not os.path.exists(db_path):
+        if os.path.exists('dance_academy.db'):
+            db_path = 'dance_academy.db'
+        else:
+            print("Database not found.")
+            return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("ALTER TABLE class ADD COLUMN room VARCHAR(50)")
+        print("Added room column to class.")
+    except sqlite3.OperationalError as e:
+        if 'duplicate column name' in str(e).lower():
+            print("room already exists in class.")
+        else:
+            print(f"Error migrating class: {e}")
+
+    # Rooms were only stored on the sessions; take each class's back from them
+    cursor.execute("""
+        UPDATE class SET room = (
+            SELECT s.room FROM class_session s
+            WHERE s.class_id = class.id AND s.room IS NOT NULL
+            ORDER BY s.weekday LIMIT 1
+        )
+        WHERE room IS NULL AND EXISTS (
+            SELECT 1 FROM class_session s WHERE s.class_id = class.id AND s.room IS NOT NULL
+        )
+    """)
+    print(f"Restored the room of {cursor.rowcount} classes from their sessions.")
+
+    conn.commit()
+    conn.close()
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,30 @@
+from sqlalchemy import text
+from app import app
+from database import db, Class
+from timetable import sync_sessions
+
+def migrate():
+    """
+    Creates the class_session table and parses every class's schedule text
+    into weekly sessions (once; later edits resync through the class form).
+    """
+    with app.app_context():
+        db.create_all()
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_class_instructor_id ON class (instructor_id)"))
+
+        parsed = unparsed = 0
+        for cls in Class.query.all():
+            if cls.sessions:
+                continue
+            sync_sessions(cls)
+            if cls.sessions:
+                parsed += 1
+            else:
+                unparsed += 1
+                print(f"Could not find weekdays in schedule of '{cls.name}': {cls.schedule!r}")
+        db.session.commit()
+        print(f"Parsed {parsed} schedules, {unparsed} left without sessions.")
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
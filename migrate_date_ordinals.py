@@ -0,0 +1,85 @@
+import sqlite3
+import os
+from bs_calendar import parse_bs, format_bs, to_ordinal
+
+# table -> [(date column, ordinal column)]
+DATE_COLUMNS = {
+    'ledger_transaction': [('date', 'date_ord')],
+    'attendance': [('date', 'date_ord')],
+    'expense': [('date', 'date_ord')],
+    'workshop_enrollment': [('date', 'date_ord')],
+    'workshop': [('start_date', 'start_ord'), ('end_date', 'end_ord')],
+    'package_enrollment': [('start_date', 'start_ord'), ('end_date', 'end_ord')],
+}
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_ledger_transaction_date_ord ON ledger_transaction (date_ord)",
+    "CREATE INDEX IF NOT EXISTS ix_attendance_student_date ON attendance (student_id, date_ord)",
+    "CREATE INDEX IF NOT EXISTS ix_attendance_class_date ON attendance (class_id, date_ord)",
+    "CREATE INDEX IF NOT EXISTS ix_expense_date_ord ON expense (date_ord)",
+    "CREATE INDEX IF NOT EXISTS ix_workshop_enrollment_date_ord ON workshop_enrollment (date_ord)",
+    "CREATE INDEX IF NOT EXISTS ix_workshop_start_ord ON workshop (start_ord)",
+    "CREATE INDEX IF NOT EXISTS ix_package_enrollment_student_range ON package_enrollment (student_id, start_ord, end_ord)",
+    "CREATE INDEX IF NOT EXISTS ix_package_enrollment_range ON package_enrollment (start_ord, end_ord)",
+]
+
+def migrate():
+    db_path = 'instance/dance_academy.db'
+    if not os.path.exists(db_path):
+        if os.path.exists('dance_academy.db'):
+            db_path = 'dance_academy.db'
+        else:
+            print("Database not found.")
+            return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    for table, columns in DATE_COLUMNS.items():
+        for date_col, ord_col in columns:
+            try:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {ord_col} INTEGER")
+                print(f"Added {ord_col} column to {table}.")
+            except sqlite3.OperationalError as e:
+                if 'duplicate column name' in str(e).lower():
+                    print(f"{ord_col} already exists in {table}.")
+                else:
+                    print(f"Error migrating {table}: {e}")
+
+            # Backfill ordinals and zero-pad the strings so both orderings agree
+            rows = cursor.execute(f"SELECT id, {date_col} FROM {table}").fetchall()
+            updates = []
+            skipped = 0
+            for row_id, value in rows:
+                parsed = parse_bs(value)
+                if not parsed:
+                    skipped += 1
+                    continue
+                updates.append((format_bs(*parsed), to_ordinal(value), row_id))
+            cursor.executemany(
+                f"UPDATE {table} SET {date_col} = ?, {ord_col} = ? WHERE id = ?", updates
+            )
+            print(f"{table}.{ord_col}: filled {len(updates)} rows, {skipped} unparseable.")
+
+    for statement in INDEXES:
+        cursor.execute(statement)
+
+    conn.commit()
+    conn.close()
+
+    # Re-padded dates can reorder a ledger or move rows to another month, so rebuild
+    # the running balances and the rollups derived from them
+    from app import app
+    from database import db, Student, rebuild_student_balances, rebuild_monthly_summaries
+    from routes.finance import recalculate_balances_bulk
+    with app.app_context():
+        db.create_all()
+        student_ids = [student_id for (student_id,) in db.session.query(Student.id)]
+        print(f"Recalculating balances for {len(student_ids)} students...")
+        recalculate_balances_bulk(student_ids)
+        rebuild_student_balances()
+        rebuild_monthly_summaries()
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,73 @@
+import sqlite3
+import os
+import re
+import nepali_datetime
+
+# Month names exactly as strftime('%B') writes them into fee descriptions
+MONTH_NUMBERS = {nepali_datetime.date(2080, m, 1).strftime('%B'): m for m in range(1, 13)}
+MONTHLY_PATTERN = re.compile(r"Monthly Fee.* - (\w+) (\d{4})")
+
+def classify(description):
+    """Returns (fee_kind, period_year, period_month) parsed from a FEE description."""
+    match = MONTHLY_PATTERN.search(description)
+    if match and match.group(1) in MONTH_NUMBERS:
+        return 'MONTHLY', int(match.group(2)), MONTH_NUMBERS[match.group(1)]
+    if 'Admission' in description:
+        return 'ADMISSION', None, None
+    if description.startswith('Package:'):
+        return 'PACKAGE', None, None
+    if description.startswith('Workshop:'):
+        return 'WORKSHOP', None, None
+    if description.startswith('Purchase:'):
+        return 'PRODUCT', None, None
+    return None, None, None
+
+def migrate():
+    db_path = 'instance/dance_academy.db'
+    if not os.path.exists(db_path):
+        if os.path.exists('dance_academy.db'):
+            db_path = 'dance_academy.db'
+        else:
+            print("Database not found.")
+            return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    for column, col_type in [('fee_kind', 'VARCHAR(20)'), ('period_year', 'INTEGER'), ('period_month', 'INTEGER')]:
+        try:
+            cursor.execute(f"ALTER TABLE ledger_transaction ADD COLUMN {column} {col_type}")
+            print(f"Added {column} column to ledger_transaction.")
+        except sqlite3.OperationalError as e:
+            if 'duplicate column name' in str(e).lower():
+                print(f"{column} already exists in ledger_transaction.")
+            else:
+                print(f"Error migrating ledger_transaction: {e}")
+
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS ix_ledger_fee_period
+        ON ledger_transaction (fee_kind, period_year, period_month, student_id)
+    """)
+
+    # One-time backfill from descriptions
+    print("Backfilling fee periods from descriptions...")
+    rows = cursor.execute(
+        "SELECT id, description FROM ledger_transaction WHERE txn_type = 'FEE' AND fee_kind IS NULL"
+    ).fetchall()
+    updates = []
+    for txn_id, description in rows:
+        fee_kind, year, month = classify(description or '')
+        if fee_kind:
+            updates.append((fee_kind, year, month, txn_id))
+    cursor.executemany(
+        "UPDATE ledger_transaction SET fee_kind = ?, period_year = ?, period_month = ? WHERE id = ?",
+        updates
+    )
+    print(f"Classified {len(updates)} of {len(rows)} fee transactions.")
+
+    conn.commit()
+    conn.close()
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,21 @@
+from app import app
+from database import db, LedgerTransaction, Expense, WorkshopEnrollment, MonthlyFinanceSummary, rebuild_monthly_summaries
+
+def migrate():
+    """
+    Creates the monthly_finance_summary table and the date indexes it is
+    maintained through, then rebuilds every month from the source tables.
+    Safe to re-run any time the rollup needs regenerating.
+    """
+    with app.app_context():
+        db.create_all()
+        for model in (LedgerTransaction, Expense, WorkshopEnrollment):
+            for index in model.__table__.indexes:
+                index.create(bind=db.engine, checkfirst=True)
+        print("Rebuilding monthly finance summaries...")
+        rebuild_monthly_summaries()
+        print(f"Stored totals for {MonthlyFinanceSummary.query.count()} months.")
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,81 @@
+import sqlite3
+import os
+
+LINK_COLUMNS = [
+    ('workshop_enrollment_id', 'workshop_enrollment'),
+    ('package_enrollment_id', 'package_enrollment'),
+    ('product_sale_id', 'product_sale'),
+]
+
+def link_first_unlinked(cursor, column, source_id, student_id, txn_type, description_like, date=None):
+    """Links the oldest unlinked ledger row matching the description pattern."""
+    query = f"""
+        SELECT id FROM ledger_transaction
+        WHERE student_id = ? AND txn_type = ? AND description LIKE ?
+          AND workshop_enrollment_id IS NULL AND package_enrollment_id IS NULL AND product_sale_id IS NULL
+    """
+    params = [student_id, txn_type, description_like]
+    if date:
+        query += " AND date = ?"
+        params.append(date)
+    row = cursor.execute(query + " ORDER BY id LIMIT 1", params).fetchone()
+    if row:
+        cursor.execute(f"UPDATE ledger_transaction SET {column} = ? WHERE id = ?", (source_id, row[0]))
+        return 1
+    return 0
+
+def migrate():
+    db_path = 'instance/dance_academy.db'
+    if not os.path.exists(db_path):
+        if os.path.exists('dance_academy.db'):
+            db_path = 'dance_academy.db'
+        else:
+            print("Database not found.")
+            return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    for column, table in LINK_COLUMNS:
+        try:
+            cursor.execute(f"ALTER TABLE ledger_transaction ADD COLUMN {column} INTEGER REFERENCES {table}(id)")
+            print(f"Added {column} column to ledger_transaction.")
+        except sqlite3.OperationalError as e:
+            if 'duplicate column name' in str(e).lower():
+                print(f"{column} already exists in ledger_transaction.")
+            else:
+                print(f"Error migrating ledger_transaction: {e}")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS ix_ledger_transaction_{column} ON ledger_transaction ({column})")
+
+    # One-time heuristic backfill: match descriptions written by the enroll/sell routes,
+    # oldest enrollment first, each ledger row linked at most once.
+    linked = 0
+    print("Linking workshop enrollments...")
+    for enrollment_id, student_id, name in cursor.execute("""
+        SELECT e.id, e.student_id, w.name FROM workshop_enrollment e JOIN workshop w ON w.id = e.workshop_id
+        WHERE e.student_id IS NOT NULL ORDER BY e.id
+    """).fetchall():
+        linked += link_first_unlinked(cursor, 'workshop_enrollment_id', enrollment_id, student_id, 'FEE', f"Workshop: {name}")
+        linked += link_first_unlinked(cursor, 'workshop_enrollment_id', enrollment_id, student_id, 'PAYMENT', f"Payment for Workshop: {name}")
+
+    print("Linking package enrollments...")
+    for enrollment_id, student_id, name in cursor.execute("""
+        SELECT e.id, e.student_id, p.name FROM package_enrollment e JOIN package p ON p.id = e.package_id ORDER BY e.id
+    """).fetchall():
+        linked += link_first_unlinked(cursor, 'package_enrollment_id', enrollment_id, student_id, 'FEE', f"Package: {name} (%")
+        linked += link_first_unlinked(cursor, 'package_enrollment_id', enrollment_id, student_id, 'PAYMENT', f"Payment for Package: {name}")
+
+    print("Linking product sales...")
+    for sale_id, student_id, name, quantity, date in cursor.execute("""
+        SELECT s.id, s.student_id, p.name, s.quantity, s.date FROM product_sale s JOIN product p ON p.id = s.product_id ORDER BY s.id
+    """).fetchall():
+        linked += link_first_unlinked(cursor, 'product_sale_id', sale_id, student_id, 'FEE', f"Purchase: {name} (Qty: {quantity})", date)
+        linked += link_first_unlinked(cursor, 'product_sale_id', sale_id, student_id, 'PAYMENT', f"Payment for {name}", date)
+
+    print(f"Linked {linked} ledger transactions to their source.")
+    conn.commit()
+    conn.close()
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,31 @@
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app import app
+from database import db
+from notifications import generate_notifications
+
+def migrate():
+    """
+    Adds the notification settings columns, creates the notification tables
+    and runs the first daily pass.
+    """
+    with app.app_context():
+        for column, col_type in [('due_alert_threshold', 'FLOAT DEFAULT 5000.0'), ('notifications_generated_ord', 'INTEGER')]:
+            try:
+                db.session.execute(text(f"ALTER TABLE settings ADD COLUMN {column} {col_type}"))
+                db.session.commit()
+                print(f"Added {column} column to settings.")
+            except OperationalError as e:
+                db.session.rollback()
+                if 'duplicate column name' in str(e).lower():
+                    print(f"{column} already exists in settings.")
+                else:
+                    print(f"Error migrating settings: {e}")
+
+        db.create_all()
+        print("Generating today's notifications...")
+        generate_notifications()
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,51 @@
+import sqlite3
+import os
+from database import normalize_phone
+
+def migrate():
+    db_path = 'instance/dance_academy.db'
+    if not os.path.exists(db_path):
+        if os.path.exists('dance_academy.db'):
+            db_path = 'dance_academy.db'
+        else:
+            print("Database not found.")
+            return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    for column in ['phone_digits', 'phone_digits_rev']:
+        try:
+            cursor.execute(f"ALTER TABLE student ADD COLUMN {column} VARCHAR(20)")
+            print(f"Added {column} column to student.")
+        except sqlite3.OperationalError as e:
+            if 'duplicate column name' in str(e).lower():
+                print(f"{column} already exists in student.")
+            else:
+                print(f"Error migrating student: {e}")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_student_phone_digits ON student (phone_digits)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_student_phone_digits_rev ON student (phone_digits_rev)")
+
+    # Backfill the normalized keys from whatever was typed into phone
+    rows = cursor.execute("SELECT id, phone FROM student").fetchall()
+    updates = []
+    for student_id, phone in rows:
+        digits = normalize_phone(phone)
+        updates.append((digits, digits[::-1] if digits else None, student_id))
+    cursor.executemany("UPDATE student SET phone_digits = ?, phone_digits_rev = ? WHERE id = ?", updates)
+    print(f"Normalized phones for {sum(1 for u in updates if u[0])} of {len(rows)} students.")
+
+    shared = cursor.execute(
+        "SELECT phone_digits, COUNT(*) FROM student WHERE phone_digits IS NOT NULL "
+        "GROUP BY phone_digits HAVING COUNT(*) > 1"
+    ).fetchall()
+    if shared:
+        print(f"{len(shared)} phone numbers are shared by more than one student (e.g. siblings).")
+
+    conn.commit()
+    conn.close()
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,20 @@
+from app import app
+from database import db, rebuild_search_index
+
+def migrate():
+    """
+    Creates the FTS5 search tables and their sync triggers, then indexes every
+    student, class and ledger row. Safe to re-run; it rebuilds from scratch.
+    Run migrate_phone_digits.py first: phones are indexed by Student.phone_digits.
+    """
+    with app.app_context():
+        db.create_all()
+        print("Building full-text search index...")
+        rebuild_search_index()
+        for fts in ('student_fts', 'class_fts', 'ledger_fts'):
+            count = db.session.execute(db.text(f"SELECT count(*) FROM {fts}")).scalar()
+            print(f"{fts}: {count} rows indexed.")
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
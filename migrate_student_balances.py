@@ -0,0 +1,17 @@
+from app import app
+from database import db, StudentBalance, rebuild_student_balances
+
+def migrate():
+    """
+    Creates the student_balance table (if missing) and rebuilds it from the ledger.
+    Safe to re-run any time the materialized balances need regenerating.
+    """
+    with app.app_context():
+        db.create_all()
+        print("Rebuilding student balances from ledger...")
+        rebuild_student_balances()
+        print(f"Stored balances for {StudentBalance.query.count()} students.")
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
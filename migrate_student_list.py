@@ -0,0 +1,25 @@
+import sqlite3
+import os
+
+def migrate():
+    db_path = 'instance/dance_academy.db'
+    if not os.path.exists(db_path):
+        if os.path.exists('dance_academy.db'):
+            db_path = 'dance_academy.db'
+        else:
+            print("Database not found.")
+            return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    # (name, id) keyset order of the paginated student list
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_student_name ON student (name, id)")
+    cursor.execute("ANALYZE student")
+
+    conn.commit()
+    conn.close()
+    print("Migration complete.")
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,210 @@
+"""
+Persisted notification feed.
+
+Notification rows back the alert bell (/api/alerts) and the dashboard's absence
+and dues panels, so reading alerts is one indexed query. They are kept current by:
+
+- generate_notifications(): an idempotent pass over every kind, run once per BS
+  day (generate_notifications.py from cron, or lazily on the first read of the day);
+- a flush hook that refreshes dues, absence streaks and admission renewals for the
+  students a ledger, attendance or student write touched, in the same transaction.
+
+Every row has a stable dedupe key. Re-running only updates text and flips `active`;
+a notification that clears and is later raised again loses its dismissals.
+"""
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import (db, Notification, NotificationDismissal, Student, StudentBalance, AbsenceStreak,
+                      Package, PackageEnrollment, Settings, LedgerTransaction, Attendance)
+from bs_calendar import parse_bs, from_ordinal, ymd_to_ordinal, days_in_month, today_ordinal, MAXYEAR
+from birthdays import upcoming_birthdays
+
+PACKAGE_EXPIRY_DAYS = 7
+
+def _thresholds(connection):
+    row = connection.execute(
+        db.select(Settings.absence_alert_threshold, Settings.due_alert_threshold).order_by(Settings.id).limit(1)
+    ).first()
+    absence = (row.absence_alert_threshold if row else None) or 3
+    due = (row.due_alert_threshold if row else None) or 5000.0
+    return absence, due
+
+def _scoped(query, column, student_ids):
+    return query if student_ids is None else query.where(column.in_(student_ids))
+
+# --- Candidates per kind: {key: column values} of what should be active right now ---
+
+def _due_candidates(connection, student_ids, today_ord):
+    _, threshold = _thresholds(connection)
+    rows = connection.execute(_scoped(
+        db.select(Student.id, Student.name, StudentBalance.balance)
+        .join(StudentBalance, StudentBalance.student_id == Student.id)
+        .where(Student.status == 'Active', StudentBalance.balance > threshold),
+        Student.id, student_ids))
+    return {
+        f"due:{sid}": dict(student_id=sid, ref_id=None, title='High Balance Alert',
+                           message=f'{name} owes Rs {balance:,.0f}', value=balance, finance_only=True)
+        for sid, name, balance in rows
+    }
+
+def _absence_candidates(connection, student_ids, today_ord):
+    threshold, _ = _thresholds(connection)
+    rows = connection.execute(_scoped(
+        db.select(Student.id, Student.name, AbsenceStreak.streak, AbsenceStreak.last_class_id)
+        .join(AbsenceStreak, AbsenceStreak.student_id == Student.id)
+        .where(Student.status == 'Active', AbsenceStreak.class_id == None, AbsenceStreak.streak >= threshold),
+        Student.id, student_ids))
+    return {
+        f"absence:{sid}": dict(student_id=sid, ref_id=class_id, title='Attendance Caution',
+                               message=f'{name} missed {streak} classes.', value=streak, finance_only=False)
+        for sid, name, streak, class_id in rows
+    }
+
+def _admission_candidates(connection, student_ids, today_ord):
+    rows = connection.execute(_scoped(
+        db.select(Student.id, Student.name, Student.last_admission_date)
+        .where(Student.status == 'Active', Student.last_admission_date != None),
+        Student.id, student_ids))
+    candidates = {}
+    for sid, name, last_admission in rows:
+        parsed = parse_bs(last_admission)
+        if not parsed or parsed[0] >= MAXYEAR:
+            continue
+        year, month, day = parsed[0] + 1, parsed[1], parsed[2]
+        if ymd_to_ordinal(year, month, min(day, days_in_month(year, month))) <= today_ord:
+            candidates[f"admission:{sid}:{last_admission}"] = dict(
+                student_id=sid, ref_id=None, title='Admission Renewal Due',
+                message=f'{name} was admitted on {last_admission}.', value=None, finance_only=True)
+    return candidates
+
+def _birthday_candidates(connection, student_ids, today_ord):
+    today = from_ordinal(today_ord)
+    return {
+        f"birthday:{s.id}:{today}": dict(student_id=s.id, ref_id=None, title=f"Today is {s.name}'s Birthday! 🎂",
+                                         message="Don't forget to wish them!", value=None, finance_only=False)
+        for s in upcoming_birthdays(0, today_ord)
+        if student_ids is None or s.id in student_ids
+    }
+
+def _package_expiry_candidates(connection, student_ids, today_ord):
+    rows = connection.execute(_scoped(
+        db.select(PackageEnrollment.id, PackageEnrollment.package_id, PackageEnrollment.end_date,
+                  PackageEnrollment.end_ord, Student.id, Student.name, Package.name)
+        .join(Student, Student.id == PackageEnrollment.student_id)
+        .join(Package, Package.id == PackageEnrollment.package_id)
+        .where(Student.status == 'Active',
+               PackageEnrollment.end_ord.between(today_ord, today_ord + PACKAGE_EXPIRY_DAYS)),
+        Student.id, student_ids))
+    return {
+        f"package_expiry:{enrollment_id}": dict(
+            student_id=sid, ref_id=package_id, title='Package Ending Soon',
+            message=f"{name}'s {package_name} package ends on {end_date}.", value=end_ord - today_ord,
+            finance_only=False)
+        for enrollment_id, package_id, end_date, end_ord, sid, name, package_name in rows
+    }
+
+CANDIDATES = {
+    'birthday': _birthday_candidates,
+    'absence': _absence_candidates,
+    'due': _due_candidates,
+    'package_expiry': _package_expiry_candidates,
+    'admission_renewal': _admission_candidates,
+}
+# Kinds that change with ledger/attendance/student writes rather than with the date
+EVENT_KINDS = ('due', 'absence', 'admission_renewal')
+
+def sync_notifications(connection, kind, today_ord, student_ids=None):
+    """
+    Makes the active `kind` notifications (for student_ids, or everyone) match the
+    current candidates: inserts new ones, refreshes changed text, deactivates the rest.
+    """
+    candidates = CANDIDATES[kind](connection, student_ids, today_ord)
+    existing = connection.execute(_scoped(
+        db.select(Notification.id, Notification.key, Notification.active, Notification.title,
+                  Notification.message, Notification.value).where(Notification.kind == kind),
+        Notification.student_id, student_ids)).all()
+    by_key = {row.key: row for row in existing}
+
+    inserts, reraised = [], []
+    for key, fields in candidates.items():
+        row = by_key.get(key)
+        if row is None:
+            inserts.append(dict(kind=kind, key=key, active=True, created_ord=today_ord, **fields))
+        elif not row.active:
+            reraised.append(row.id)
+            connection.execute(db.update(Notification).where(Notification.id == row.id)
+                               .values(active=True, created_ord=today_ord, **fields))
+        elif (row.title, row.message, row.value) != (fields['title'], fields['message'], fields['value']):
+            connection.execute(db.update(Notification).where(Notification.id == row.id).values(**fields))
+    if inserts:
+        connection.execute(db.insert(Notification), inserts)
+    if reraised:
+        connection.execute(db.delete(NotificationDismissal).where(NotificationDismissal.notification_id.in_(reraised)))
+
+    stale = [row.id for row in existing if row.active and row.key not in candidates]
+    if stale:
+        connection.execute(db.update(Notification).where(Notification.id.in_(stale)).values(active=False))
+
+def refresh_student_notifications(connection, student_ids, today_ord=None):
+    """Event-driven refresh of dues, absences and renewals for the given students."""
+    ids = sorted(set(student_ids))
+    today_ord = today_ord or today_ordinal()
+    for i in range(0, len(ids), 500):
+        for kind in EVENT_KINDS:
+            sync_notifications(connection, kind, today_ord, ids[i:i + 500])
+
+def generate_notifications(today_ord=None):
+    """The daily pass: every kind for every student. Idempotent; commits."""
+    from routes.settings import get_settings
+    today_ord = today_ord or today_ordinal()
+    connection = db.session.connection()
+    for kind in CANDIDATES:
+        sync_notifications(connection, kind, today_ord)
+    get_settings().notifications_generated_ord = today_ord
+    db.session.commit()
+
+def ensure_daily_notifications():
+    """Runs the daily pass if it hasn't run yet today (BS)."""
+    from routes.settings import get_settings
+    if get_settings().notifications_generated_ord == today_ordinal():
+        return
+    try:
+        generate_notifications()
+    except IntegrityError:
+        # Another request generated the same rows concurrently
+        db.session.rollback()
+
+def active_notifications(kinds=None, user_id=None, include_finance=True):
+    """
+    Active notifications, oldest first. With a user_id, hides the ones that user
+    dismissed; include_finance=False hides dues and renewals.
+    """
+    query = Notification.query.filter(Notification.active == True)
+    if kinds:
+        query = query.filter(Notification.kind.in_(kinds))
+    if not include_finance:
+        query = query.filter(Notification.finance_only == False)
+    if user_id is not None:
+        query = query.filter(~db.exists().where(
+            NotificationDismissal.notification_id == Notification.id,
+            NotificationDismissal.user_id == user_id
+        ))
+    return query.order_by(Notification.created_ord, Notification.id).all()
+
+def dismiss(notification_id, user_id):
+    if not NotificationDismissal.query.get((notification_id, user_id)):
+        db.session.add(NotificationDismissal(notification_id=notification_id, user_id=user_id))
+    db.session.commit()
+
+@event.listens_for(Session, 'after_flush')
+def _refresh_notifications_after_flush(session, flush_context):
+    # Registered after the balance and streak hooks in database.py, so it sees their results
+    touched = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (LedgerTransaction, Attendance)) and obj.student_id is not None:
+            touched.add(obj.student_id)
+        elif isinstance(obj, Student) and obj.id is not None and obj not in session.deleted:
+            touched.add(obj.id)
+    if touched:
+        refresh_student_notifications(session.connection(), touched)
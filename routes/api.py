@@ -1,7 +1,14 @@
-from flask import Blueprint, jsonify, request, url_for
+from flask import Blueprint, jsonify, request, url_for, Response, stream_with_context
 from flask_login import login_required, current_user
-from database import db, Student, Class, LedgerTransaction, Attendance
-import nepali_datetime
+from routes.auth import permission_required
+from database import db, Student, Class, LedgerTransaction, Notification
+import hashlib
+import json
+import time
+import cache
+from bs_calendar import today_ordinal
+from notifications import active_notifications, ensure_daily_notifications, dismiss
+from search import search_students, search_classes, search_transactions, lookup_students
 from datetime import datetime
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
@@ -16,10 +23,7 @@ def search():
     results = []
 
     # 1. Search Students (Name or Phone)
-    students = Student.query.filter(
-        (Student.name.ilike(f'%{query}%')) | 
-        (Student.phone.ilike(f'%{query}%'))
-    ).limit(5).all()
+    students = search_students(query, limit=5)
     for s in students:
         results.append({
             'type': 'Student',
@@ -30,7 +34,7 @@ def search():
         })
 
     # 2. Search Classes
-    classes = Class.query.filter(Class.name.ilike(f'%{query}%')).limit(3).all()
+    classes = search_classes(query, limit=3)
     for c in classes:
         results.append({
             'type': 'Class',
@@ -45,7 +49,7 @@ def search():
     if query.isdigit():
         txns = LedgerTransaction.query.filter(LedgerTransaction.id == int(query)).limit(3).all()
     else:
-        txns = LedgerTransaction.query.filter(LedgerTransaction.description.ilike(f'%{query}%')).limit(3).all()
+        txns = search_transactions(query, limit=3)
     
     for t in txns:
         results.append({
@@ -58,65 +62,206 @@ def search():
 
     return jsonify({'results': results})
 
-@api_bp.route('/alerts')
+@api_bp.route('/students/lookup')
 @login_required
-def alerts():
-    # Similar logic to dashboard but returns JSON
-    today_bs = nepali_datetime.date.today()
-    active_students = Student.query.filter_by(status='Active').all()
-    
-    notifications = []
+def student_lookup():
+    """Front-desk typeahead: ?q= phone digits (start or end of the number) or name prefix."""
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 25)
+    rows = lookup_students(request.args.get('q', ''), limit)
+    return jsonify({'results': [
+        {'id': r.id, 'name': r.name, 'phone': r.phone, 'status': r.status} for r in rows
+    ]})
 
-    # 1. Birthdays
-    for s in active_students:
-        dob_str = s.dob
-        if dob_str and dob_str != 'None':
-            try:
-                parts = dob_str.split('-')
-                dob_month = int(parts[1])
-                dob_day = int(parts[2])
-                if dob_month == today_bs.month and dob_day == today_bs.day:
-                    notifications.append({
-                        'id': f'bday-{s.id}',
-                        'type': 'birthday',
-                        'title': f"Today is {s.name}'s Birthday! 🎂",
-                        'message': "Don't forget to wish them!",
-                        'url': url_for('finance.student_ledger', student_id=s.id),
-                        'icon': 'fas fa-birthday-cake',
-                        'color': '#f43f5e'
-                    })
-            except: continue
-
-    # 2. Absence Alerts
-    for s in active_students:
-        last_3 = Attendance.query.filter_by(student_id=s.id).order_by(Attendance.date.desc()).limit(3).all()
-        if len(last_3) >= 3 and all(a.status == 'Absent' for a in last_3):
-            notifications.append({
-                'id': f'absense-{s.id}',
-                'type': 'caution',
-                'title': 'Attendance Caution',
-                'message': f'{s.name} missed 3 classes.',
-                'url': url_for('attendance.index', class_id=last_3[0].class_id),
-                'icon': 'fas fa-user-clock',
-                'color': '#ef4444'
-            })
-
-    # 3. High Dues
-    if current_user.role == 'Admin' or current_user.can_view_finance:
-        for s in active_students:
-            bal = s.get_balance()
-            if bal > 5000:
-                notifications.append({
-                    'id': f'due-{s.id}',
-                    'type': 'payment',
-                    'title': 'High Balance Alert',
-                    'message': f'{s.name} owes Rs {bal:,.0f}',
-                    'url': url_for('finance.student_ledger', student_id=s.id),
-                    'icon': 'fas fa-exclamation-triangle',
-                    'color': '#f59e0b'
-                })
+@api_bp.route('/students/<int:student_id>/profile')
+@login_required
+@permission_required('can_manage_students')
+def student_profile_json(student_id):
+    """The student 360 profile (see routes.students.student_profile) as JSON."""
+    from routes.students import student_profile
+    data = student_profile(student_id)
+    if data is None:
+        return jsonify({'error': 'Student not found'}), 404
+    return jsonify(data)
+
+# Compact roster behind every student <select>; a committed write to student bumps its version
+cache.depends_on('student_picker', 'student')
+PICKER_PAGE_SIZE = 50
+
+def _picker_roster():
+    """(id, name, phone, match key) of every active student, in name order."""
+    rows = db.session.execute(
+        db.select(Student.id, Student.name, Student.phone, Student.phone_digits)
+        .where(Student.status == 'Active').order_by(Student.name, Student.id)
+    ).all()
+    return tuple((r.id, r.name, r.phone, f"{r.name.lower()} {r.phone_digits or ''}") for r in rows)
+
+@api_bp.route('/students/picker')
+@login_required
+def student_picker():
+    """
+    Search-as-you-type source for the student pickers in forms: active students whose
+    name or phone digits contain every word of ?q=, one page at a time.
+    """
+    words = [''.join(filter(str.isdigit, w)) if any(c.isdigit() for c in w) else w
+             for w in request.args.get('q', '').lower().split()]
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', PICKER_PAGE_SIZE, type=int), 1), 200)
 
+    roster = cache.get_or_compute('student_picker', 'active', _picker_roster, ttl=60)
+    matches = [s for s in roster if all(w in s[3] for w in words)]
+    start = (page - 1) * per_page
     return jsonify({
-        'count': len(notifications),
-        'alerts': notifications
+        'version': cache.version('student_picker'),
+        'page': page,
+        'has_more': len(matches) > start + per_page,
+        'results': [{'id': s[0], 'name': s[1], 'phone': s[2]} for s in matches[start:start + per_page]],
     })
+
+# Alert list is rebuilt only after a commit touches one of these tables (or the day changes)
+cache.depends_on('alerts', 'notification', 'notification_dismissal', 'student', 'ledger_transaction', 'attendance', 'settings')
+ALERT_STREAM_SECONDS = 600 # Clients reconnect after this; keeps worker threads from being held forever
+
+# kind -> (type, icon, color) for the bell dropdown
+ALERT_STYLES = {
+    'birthday': ('birthday', 'fas fa-birthday-cake', '#f43f5e'),
+    'absence': ('caution', 'fas fa-user-clock', '#ef4444'),
+    'due': ('payment', 'fas fa-exclamation-triangle', '#f59e0b'),
+    'package_expiry': ('package', 'fas fa-box-open', '#8b5cf6'),
+    'admission_renewal': ('admission', 'fas fa-id-card', '#0ea5e9'),
+}
+
+def _alert_url(n):
+    if n.kind == 'absence':
+        return url_for('attendance.index', class_id=n.ref_id)
+    if n.kind == 'package_expiry':
+        return url_for('packages.view', id=n.ref_id)
+    return url_for('finance.student_ledger', student_id=n.student_id)
+
+def _viewer():
+    """(user id, can see finance alerts) of the logged-in user."""
+    return current_user.id, current_user.role == 'Admin' or current_user.can_view_finance
+
+def _build_alerts(user_id, include_finance):
+    """(json body, etag) of the user's undismissed notifications: one indexed read."""
+    ensure_daily_notifications()
+    notifications = []
+    for n in active_notifications(user_id=user_id, include_finance=include_finance):
+        alert_type, icon, color = ALERT_STYLES[n.kind]
+        notifications.append({
+            'id': n.id,
+            'type': alert_type,
+            'title': n.title,
+            'message': n.message,
+            'url': _alert_url(n),
+            'icon': icon,
+            'color': color
+        })
+
+    body = json.dumps({'count': len(notifications), 'alerts': notifications})
+    return body, hashlib.sha1(body.encode()).hexdigest()[:16]
+
+def current_alerts(user_id, include_finance):
+    """Cached (body, etag); one entry per user per day."""
+    return cache.get_or_compute('alerts', (today_ordinal(), user_id, include_finance),
+                                lambda: _build_alerts(user_id, include_finance))
+
+@api_bp.route('/alerts')
+@login_required
+def alerts():
+    body, etag = current_alerts(*_viewer())
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True # Revalidate every time; unchanged alerts come back as 304
+    return response.make_conditional(request)
+
+@api_bp.route('/alerts/stream')
+@login_required
+def alerts_stream():
+    """Server-Sent Events: pushes the alert list whenever it changes."""
+    last_etag = request.headers.get('Last-Event-ID')
+    viewer = _viewer()
+
+    def events():
+        nonlocal last_etag
+        deadline = time.monotonic() + ALERT_STREAM_SECONDS
+        yield "retry: 5000\n\n"
+        while time.monotonic() < deadline:
+            seen = cache.version('alerts')
+            body, etag = current_alerts(*viewer)
+            db.session.remove() # Don't hold a connection while waiting
+            if etag != last_etag:
+                last_etag = etag
+                yield f"id: {etag}\nevent: alerts\ndata: {body}\n\n"
+            else:
+                yield ": keepalive\n\n"
+            cache.wait_for_change('alerts', seen, timeout=30)
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_bp.route('/alerts/<int:id>/dismiss', methods=['POST'])
+@login_required
+def dismiss_alert(id):
+    Notification.query.get_or_404(id)
+    dismiss(id, current_user.id)
+    return jsonify({'status': 'ok'})
+
+# Rate pages are short-lived: dropped on any attendance/roster change and after a minute regardless
+cache.depends_on('attendance_rates', 'attendance', 'student', 'class', 'instructor')
+ATTENDANCE_RATES_TTL = 60
+
+@api_bp.route('/attendance/rates/<group>')
+@login_required
+@permission_required('can_view_reports')
+def attendance_rates(group):
+    """
+    Attendance rate per student, class or instructor over a BS date range
+    (start_date/end_date, default this month), paginated and lowest rate first.
+    """
+    from attendance_stats import attendance_rates as compute_rates
+    from bs_calendar import ordinal_to_ymd, ymd_to_ordinal, from_ordinal, to_ordinal
+    today = today_ordinal()
+    year, month, _ = ordinal_to_ymd(today)
+    start_ord, end_ord = ymd_to_ordinal(year, month, 1), today
+    if request.args.get('start_date'):
+        start_ord = to_ordinal(request.args['start_date'])
+    if request.args.get('end_date'):
+        end_ord = to_ordinal(request.args['end_date'])
+    if start_ord is None or end_ord is None:
+        return jsonify({'error': 'Dates must be valid BS dates (YYYY-MM-DD).'}), 400
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 200)
+    sort = request.args.get('sort', 'rate')
+    min_records = max(request.args.get('min_records', 1, type=int), 1)
+
+    key = (group, start_ord, end_ord, page, per_page, sort, min_records)
+    try:
+        result = cache.get_or_compute('attendance_rates', key, lambda: compute_rates(*key), ttl=ATTENDANCE_RATES_TTL)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(dict(result, group=group, start_date=from_ordinal(start_ord), end_date=from_ordinal(end_ord)))
+
+@api_bp.route('/attendance', methods=['POST'])
+@login_required
+@permission_required('can_view_attendance')
+def save_attendance():
+    """
+    Saves several class rosters in one request, all or nothing:
+    {"rosters": [{"class_id": 1, "date": "2081-05-01",
+                  "records": [{"student_id": 3, "status": "Present", "remarks": ""}]}]}
+    """
+    from routes.attendance import save_rosters
+    payload = request.get_json(silent=True) or {}
+    rosters = payload.get('rosters')
+    if not isinstance(rosters, list) or not rosters:
+        return jsonify({'error': 'Expected a non-empty "rosters" list.'}), 400
+    try:
+        result = save_rosters(rosters)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    return jsonify(result)
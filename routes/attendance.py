@@ -1,12 +1,90 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required
-from database import db, Class, Attendance, Enrollment
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import db, Class, Attendance, Enrollment, AbsenceStreak, sync_absence_streaks, sync_attendance_months, bs_period
 from routes.auth import admin_required, permission_required
 import nepali_datetime
 from datetime import datetime
+from bs_calendar import to_ordinal, from_ordinal, today_ordinal, parse_bs
+from notifications import refresh_student_notifications
+from attendance_stats import month_rates, class_month_heatmap
 
 attendance_bp = Blueprint('attendance', __name__)
 
+def get_absence_threshold():
+    from routes.settings import get_settings
+    return get_settings().absence_alert_threshold or 3
+
+ATTENDANCE_STATUSES = ('Present', 'Late', 'Absent')
+
+def save_rosters(rosters):
+    """
+    Saves attendance for one or more class rosters:
+    [{'class_id': 1, 'date': '2081-05-01', 'records': [{'student_id': 3, 'status': 'Present', 'remarks': ''}]}]
+
+    Existing rows for all the (class, date) pairs are read in one query, and every new or
+    changed record is written by a single INSERT ... ON CONFLICT upsert. Records for students
+    not enrolled in the class are skipped. Raises ValueError for an invalid or future date,
+    an unknown class or status. Does not commit.
+    Returns {'saved': n, 'unchanged': n, 'skipped': n}.
+    """
+    today_ord = today_ordinal()
+    wanted = {} # (class_id, student_id, date_ord) -> (status, remarks)
+    for roster in rosters:
+        date_ord = to_ordinal(roster.get('date'))
+        if date_ord is None:
+            raise ValueError(f"Invalid date: {roster.get('date')!r}")
+        if date_ord > today_ord:
+            raise ValueError(f"Cannot save attendance for future date ({roster.get('date')}).")
+        try:
+            class_id = int(roster.get('class_id'))
+            records = [(int(r['student_id']), r.get('status'), r.get('remarks') or '') for r in roster.get('records', [])]
+        except (TypeError, ValueError, KeyError):
+            raise ValueError("Each roster needs a class_id and records with a student_id.")
+        for student_id, status, remarks in records:
+            if status not in ATTENDANCE_STATUSES:
+                raise ValueError(f"Invalid status {status!r} for student {student_id}.")
+            wanted[(class_id, student_id, date_ord)] = (status, remarks)
+
+    class_ids = {key[0] for key in wanted}
+    unknown = class_ids - {cid for (cid,) in db.session.query(Class.id).filter(Class.id.in_(class_ids))}
+    if unknown:
+        raise ValueError(f"Unknown class: {min(unknown)}")
+    enrolled = set(db.session.query(Enrollment.class_id, Enrollment.student_id).filter(Enrollment.class_id.in_(class_ids)))
+    pairs = {(class_id, date_ord) for class_id, _, date_ord in wanted}
+    existing = {
+        (r.class_id, r.student_id, r.date_ord): (r.status, r.remarks or '')
+        for r in db.session.query(Attendance.class_id, Attendance.student_id, Attendance.date_ord,
+                                  Attendance.status, Attendance.remarks)
+        .filter(tuple_(Attendance.class_id, Attendance.date_ord).in_(pairs))
+    } if pairs else {}
+
+    rows, skipped, unchanged = [], 0, 0
+    for (class_id, student_id, date_ord), (status, remarks) in wanted.items():
+        if (class_id, student_id) not in enrolled:
+            skipped += 1
+        elif existing.get((class_id, student_id, date_ord)) == (status, remarks):
+            unchanged += 1
+        else:
+            rows.append(dict(class_id=class_id, student_id=student_id, date=from_ordinal(date_ord),
+                             date_ord=date_ord, status=status, remarks=remarks))
+
+    if rows:
+        # Bulk statements skip the flush hooks, so refresh streaks and alerts here
+        stmt = sqlite_insert(Attendance)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['class_id', 'student_id', 'date'],
+            set_=dict(status=stmt.excluded.status, remarks=stmt.excluded.remarks, date_ord=stmt.excluded.date_ord)
+        )
+        db.session.execute(stmt, rows)
+        touched = {row['student_id'] for row in rows}
+        connection = db.session.connection()
+        sync_absence_streaks(connection, touched)
+        sync_attendance_months(connection, {(row['student_id'], row['class_id'], bs_period(row['date'])) for row in rows})
+        refresh_student_notifications(connection, touched)
+    return {'saved': len(rows), 'unchanged': unchanged, 'skipped': skipped}
+
 @attendance_bp.route('/attendance', methods=['GET', 'POST'])
 @login_required
 @permission_required('can_view_attendance')
@@ -14,6 +92,7 @@ def index():
     classes = Class.query.all()
     selected_class = None
     students = []
+    heatmap = []
     today_bs = nepali_datetime.date.today()
     date_str = today_bs.strftime('%Y-%m-%d')
     is_future = False
@@ -24,14 +103,10 @@ def index():
         date = date_str
         
         # Validation: Check if future date
-        try:
-            y, m, d = map(int, date_str.split('-'))
-            selected_date = nepali_datetime.date(y, m, d)
-            if selected_date > today_bs:
-                is_future = True
-                flash(f"Error: Cannot take attendance for future date ({date_str}).", "warning")
-        except:
-            pass
+        selected_ord = to_ordinal(date_str)
+        if selected_ord and selected_ord > today_ordinal():
+            is_future = True
+            flash(f"Error: Cannot take attendance for future date ({date_str}).", "warning")
             
         if class_id and not is_future:
             selected_class = Class.query.get(class_id)
@@ -41,8 +116,15 @@ def index():
                 student_ids = [e.student_id for e in enrollments]
                 
                 # Fetch existing attendance for this date
-                existing_records = Attendance.query.filter_by(class_id=selected_class.id, date=date).all()
+                existing_records = Attendance.query.filter_by(class_id=selected_class.id, date_ord=to_ordinal(date)).all()
                 attendance_map = {r.student_id: {'status': r.status, 'remarks': r.remarks} for r in existing_records}
+                # Current absence streaks in this class
+                streaks = dict(db.session.query(AbsenceStreak.student_id, AbsenceStreak.streak).filter_by(class_id=selected_class.id))
+                # This month's attendance rate per student, from the bitmap store
+                rates = month_rates(selected_class.id, bs_period(date))
+                # Day-by-day turnout for the month, from the same store
+                year, month, _ = parse_bs(date) or (today_bs.year, today_bs.month, today_bs.day)
+                heatmap = class_month_heatmap(selected_class.id, year, month)
                 
                 # Build list of student objects with their status
                 for enroll in enrollments:
@@ -50,46 +132,37 @@ def index():
                     record = attendance_map.get(s.id, {})
                     s.attendance_status = record.get('status', 'Absent')
                     s.attendance_remarks = record.get('remarks', '')
+                    s.absence_streak = streaks.get(s.id, 0)
+                    s.month_rate = rates.get(s.id)
                     students.append(s)
 
-    return render_template('attendance/index.html', classes=classes, selected_class=selected_class, students=students, date=date_str, is_future=is_future)
+    return render_template('attendance/index.html', classes=classes, selected_class=selected_class, students=students, date=date_str, is_future=is_future, absence_threshold=get_absence_threshold(), heatmap=heatmap)
 
 @attendance_bp.route('/attendance/mark', methods=['POST'])
 @login_required
 def mark():
     class_id = request.form['class_id']
     date_str = request.form['date']
-    date = date_str
     
     # Server-side validation again just in case
-    today_bs = nepali_datetime.date.today()
-    try:
-        y, m, d = map(int, date_str.split('-'))
-        selected_date = nepali_datetime.date(y, m, d)
-        if selected_date > today_bs:
-            flash("Error: Cannot save attendance for future dates.", "danger")
-            return redirect(url_for('attendance.index', class_id=class_id, date=date_str))
-    except:
-        pass
+    selected_ord = to_ordinal(date_str)
+    if selected_ord and selected_ord > today_ordinal():
+        flash("Error: Cannot save attendance for future dates.", "danger")
+        return redirect(url_for('attendance.index', class_id=class_id, date=date_str))
 
-    selected_class = Class.query.get(class_id)
-    enrollments = Enrollment.query.filter_by(class_id=selected_class.id).all()
-    
-    for enroll in enrollments:
-        student_id = enroll.student.id
-        status = request.form.get(f'status_{student_id}')
-        remarks = request.form.get(f'remarks_{student_id}')
-        
-        if status:
-            # Check if exists
-            record = Attendance.query.filter_by(class_id=class_id, student_id=student_id, date=date).first()
-            if record:
-                record.status = status
-                record.remarks = remarks
-            else:
-                new_record = Attendance(class_id=class_id, student_id=student_id, date=date, status=status, remarks=remarks)
-                db.session.add(new_record)
-    
+    # One status_<student id> / remarks_<student id> pair per roster row
+    records = []
+    for key, status in request.form.items():
+        student_id = key[len('status_'):]
+        if key.startswith('status_') and student_id.isdigit() and status:
+            records.append({'student_id': student_id, 'status': status,
+                            'remarks': request.form.get(f'remarks_{student_id}')})
+    try:
+        save_rosters([{'class_id': class_id, 'date': date_str, 'records': records}])
+    except ValueError as e:
+        db.session.rollback()
+        flash(f"Error: {e}", "danger")
+        return redirect(url_for('attendance.index', class_id=class_id, date=date_str))
     db.session.commit()
     flash('Attendance updated successfully.')
     return redirect(url_for('attendance.index', class_id=class_id, date=date_str))
@@ -1,7 +1,9 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required
+from sqlalchemy.orm import selectinload
 from routes.auth import admin_required, permission_required
 from database import Class, Instructor, Student, Enrollment, db
+from timetable import sync_sessions, find_conflicts, weekly_grid, format_slot, DAY_NAMES
 
 class_bp = Blueprint('classes', __name__)
 
@@ -9,11 +11,24 @@ class_bp = Blueprint('classes', __name__)
 @login_required
 @permission_required('can_manage_classes')
 def index():
-    classes = Class.query.all()
+    classes = Class.query.options(selectinload(Class.sessions)).all()
     instructors = Instructor.query.all()
-    # Fetch active students for enrollment dropdown
-    students = Student.query.filter_by(status='Active').order_by(Student.name).all()
-    return render_template('classes/index.html', classes=classes, instructors=instructors, students=students)
+    # The enrollment dropdown loads students from /api/students/picker
+    return render_template('classes/index.html', classes=classes, instructors=instructors)
+
+@class_bp.route('/classes/timetable')
+@login_required
+@permission_required('can_manage_classes')
+def timetable():
+    instructor_id = request.args.get('instructor_id', type=int)
+    instructors = Instructor.query.order_by(Instructor.name).all()
+    return render_template('classes/timetable.html', grid=weekly_grid(instructor_id),
+                           instructors=instructors, instructor_id=instructor_id, format_slot=format_slot)
+
+def _warn_conflicts(cls):
+    for session, other, reason in find_conflicts(cls):
+        flash(f"Schedule conflict on {DAY_NAMES[session.weekday]}: {format_slot(session)} overlaps "
+              f"{other.class_info.name} ({format_slot(other)}, {reason}).", 'warning')
 
 # --- Instructor Management ---
 @class_bp.route('/instructors/add', methods=['POST'])
@@ -86,11 +101,14 @@ def add_class():
         name=name,
         instructor_id=instructor_id,
         schedule=schedule,
-        capacity=int(capacity) if capacity else None
+        capacity=int(capacity) if capacity else None,
+        room=request.form.get('room') or None
     )
+    sync_sessions(new_class)
     db.session.add(new_class)
     db.session.commit()
     flash('Class created successfully!')
+    _warn_conflicts(new_class)
     return redirect(url_for('classes.index'))
 
 @class_bp.route('/classes/edit/<int:id>', methods=['POST'])
@@ -108,9 +126,12 @@ def edit_class(id):
     
     capacity = request.form.get('capacity')
     cls.capacity = int(capacity) if capacity else None
+    cls.room = request.form.get('room') or None
+    sync_sessions(cls)
     
     db.session.commit()
     flash('Class updated successfully!')
+    _warn_conflicts(cls)
     return redirect(url_for('classes.index'))
 
 @class_bp.route('/classes/delete/<int:id>')
@@ -171,14 +192,19 @@ def unenroll_student(enrollment_id):
 @login_required
 @admin_required
 def delete_all():
-    from database import Enrollment, Attendance
+    from database import Enrollment, Attendance, AbsenceStreak, AttendanceMonth, ClassSession, Notification
     
     count = Class.query.count()
     
     # Cascade delete enrollments and attendance for all classes
     Enrollment.query.delete()
     Attendance.query.delete()
+    AbsenceStreak.query.delete()
+    AttendanceMonth.query.delete()
+    ClassSession.query.delete()
     Class.query.delete()
+    # Absence alerts came from the streaks cleared above; retire them now, not at the next daily pass
+    Notification.query.filter_by(kind='absence', active=True).update({'active': False})
     
     db.session.commit()
     flash(f'All {count} classes and related records (Enrollments, Attendance) have been deleted.', 'success')
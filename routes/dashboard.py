@@ -0,0 +1,120 @@
+from flask import Blueprint, jsonify, abort, current_app
+from flask_login import login_required
+from urllib.parse import quote
+from datetime import datetime
+import time
+import cache
+from bs_calendar import today_ordinal, ordinal_to_ymd, add_months
+
+dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/api/dashboard')
+
+# The dashboard page is an empty shell; each panel fetches one of these sections.
+SECTIONS = {} # name -> (builder, ttl seconds)
+
+def section(name, ttl, *tables):
+    """Registers a section builder, cached per BS day until a commit writes one of `tables`."""
+    def register(builder):
+        SECTIONS[name] = (builder, ttl)
+        cache.depends_on(f'dashboard.{name}', *tables)
+        return builder
+    return register
+
+def _whatsapp(phone, message):
+    return f"https://wa.me/{phone}?text={quote(message)}"
+
+@section('counts', 300, 'student', 'class')
+def counts(today_ord):
+    from database import Student, Class
+    return {
+        'students': Student.query.filter_by(status='Active').count(),
+        'classes': Class.query.count(),
+    }
+
+@section('schedule', 300, 'class', 'class_session')
+def schedule(today_ord):
+    from timetable import sessions_on, format_slot
+    return {'sessions': [
+        {'class': s.class_info.name, 'time': format_slot(s), 'room': s.room}
+        for s in sessions_on(datetime.now().weekday())
+    ]}
+
+@section('birthdays', 3600, 'student')
+def birthdays(today_ord):
+    from birthdays import upcoming_birthdays
+    return {'students': [{'name': s.name, 'dob': s.dob} for s in upcoming_birthdays(30, today_ord)]}
+
+@section('absences', 300, 'notification', 'attendance', 'student', 'settings')
+def absences(today_ord):
+    from notifications import active_notifications, ensure_daily_notifications
+    from routes.settings import get_settings
+    ensure_daily_notifications()
+    alerts = sorted(active_notifications(kinds=('absence',)), key=lambda n: -n.value)
+    return {
+        'threshold': get_settings().absence_alert_threshold or 3,
+        'alerts': [{
+            'name': n.student.name,
+            'phone': n.student.phone,
+            'streak': int(n.value),
+            'whatsapp': _whatsapp(n.student.phone, f"Namaste, we noticed {n.student.name} has missed {int(n.value)} "
+                                                   "classes. Is everything okay? Hope to see them back soon!"),
+        } for n in alerts],
+    }
+
+@section('dues', 300, 'notification', 'ledger_transaction', 'student', 'settings')
+def dues(today_ord):
+    from notifications import active_notifications, ensure_daily_notifications
+    from routes.settings import get_settings
+    ensure_daily_notifications()
+    return {
+        'threshold': get_settings().due_alert_threshold or 5000.0,
+        'students': [{
+            'name': n.student.name,
+            'balance': n.value,
+            'whatsapp': _whatsapp(n.student.phone, f"Hello {n.student.name}, this is a reminder from Dance Academy "
+                                                   f"that your dues of Rs {n.value} are pending. Please pay at your "
+                                                   "earliest convenience."),
+        } for n in active_notifications(kinds=('due',))],
+    }
+
+# The rollup is written by flush hooks, so depend on the tables that feed it
+@section('finance', 300, 'monthly_finance_summary', 'ledger_transaction', 'expense', 'workshop_enrollment')
+def finance(today_ord):
+    """Income vs expenses for the last 6 BS months: one range read over the monthly rollup."""
+    from database import MonthlyFinanceSummary
+    year, month, _ = ordinal_to_ymd(today_ord)
+    months = [add_months(year, month, -i) for i in range(5, -1, -1)]
+    periods = [y * 100 + m for y, m in months]
+    summaries = {row.period: row for row in MonthlyFinanceSummary.query.filter(
+        MonthlyFinanceSummary.period.between(periods[0], periods[-1])
+    )}
+    income, expenses = [], []
+    for period in periods:
+        row = summaries.get(period)
+        income.append((row.ledger_credit + row.guest_income) if row else 0.0)
+        expenses.append(row.expense_total if row else 0.0)
+    return {'labels': [f"{y}-{m:02d}" for y, m in months], 'income': income, 'expenses': expenses}
+
+@dashboard_bp.route('/<name>')
+@login_required
+def get_section(name):
+    if name not in SECTIONS:
+        abort(404)
+    builder, ttl = SECTIONS[name]
+    today_ord = today_ordinal()
+    computed = []
+
+    def compute():
+        computed.append(True)
+        return builder(today_ord)
+
+    started = time.perf_counter()
+    data = cache.get_or_compute(f'dashboard.{name}', today_ord, compute, ttl=ttl)
+    elapsed = (time.perf_counter() - started) * 1000
+    status = 'computed' if computed else 'cached'
+    current_app.logger.info("dashboard section %s: %.1f ms (%s)", name, elapsed, status)
+
+    response = jsonify(data)
+    response.headers['Server-Timing'] = f'{name};dur={elapsed:.1f};desc="{status}"'
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
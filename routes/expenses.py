@@ -12,7 +12,7 @@ expenses_bp = Blueprint('expenses', __name__)
 @permission_required('can_manage_expenses')
 def index():
     from database import Instructor
-    expenses = Expense.query.order_by(Expense.date.desc()).all()
+    expenses = Expense.query.order_by(Expense.date_ord.desc(), Expense.id.desc()).all()
     instructors = Instructor.query.all()
     date_str = nepali_datetime.date.today().strftime('%Y-%m-%d')
     return render_template('expenses/index.html', expenses=expenses, instructors=instructors, date_str=date_str)
@@ -1,23 +1,29 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required
-from database import db, Student, LedgerTransaction
+from database import db, Student, LedgerTransaction, StudentBalance, sync_student_balances, sync_monthly_summaries
+from notifications import refresh_student_notifications
 from routes.auth import admin_required, permission_required
 import nepali_datetime
+from bs_calendar import parse_bs, to_ordinal, days_in_month, year_end
 
 finance_bp = Blueprint('finance', __name__)
 
 # --- Core Ledger Logic ---
-def add_transaction(student_id, description, debit=0.0, credit=0.0, txn_type='FEE'):
+def add_transaction(student_id, description, debit=0.0, credit=0.0, txn_type='FEE', fee_kind=None, period=None,
+                    workshop_enrollment_id=None, package_enrollment_id=None, product_sale_id=None):
     """
     Adds a transaction and updates the running balance.
     txn_type: FEE, PAYMENT, ADJUSTMENT
+    fee_kind: MONTHLY, ADMISSION, PACKAGE, WORKSHOP, PRODUCT (FEE rows only)
+    period: (bs_year, bs_month) billed, for MONTHLY fees
+    *_id: the enrollment or sale this row belongs to, if any
     """
     student = Student.query.get(student_id)
     if not student:
         return False
         
-    last_txn = LedgerTransaction.query.filter_by(student_id=student_id, is_void=False).order_by(LedgerTransaction.date.desc(), LedgerTransaction.id.desc()).first()
-    previous_balance = last_txn.balance_after if last_txn else 0.0
+    # Materialized balance == balance_after of the latest non-void transaction
+    previous_balance = db.session.query(StudentBalance.balance).filter_by(student_id=student_id).scalar() or 0.0
     
     new_balance = previous_balance + debit - credit
     
@@ -32,24 +38,28 @@ def add_transaction(student_id, description, debit=0.0, credit=0.0, txn_type='FE
         balance_after=new_balance,
         date=today_bs,
         txn_type=txn_type,
-        is_void=False
+        is_void=False,
+        fee_kind=fee_kind,
+        period_year=period[0] if period else None,
+        period_month=period[1] if period else None,
+        workshop_enrollment_id=workshop_enrollment_id,
+        package_enrollment_id=package_enrollment_id,
+        product_sale_id=product_sale_id
     )
     db.session.add(new_txn)
     db.session.commit()
     return new_txn
 
-def get_days_in_bs_month(year, month):
-    """Helper to get days in a Nepali month"""
-    # Try finding the last valid day from 32 down to 29
-    for d in range(32, 28, -1):
-        try:
-            nepali_datetime.date(year, month, d)
-            return d
-        except ValueError:
-            continue
-    return 30 # Fallback
+def monthly_fee_query(year, month):
+    """Non-void MONTHLY fees for a BS billing period (served by ix_ledger_fee_period)."""
+    return LedgerTransaction.query.filter(
+        LedgerTransaction.fee_kind == 'MONTHLY',
+        LedgerTransaction.period_year == year,
+        LedgerTransaction.period_month == month,
+        LedgerTransaction.is_void == False
+    )
 
-def calculate_prorata_fee(monthly_fee, admission_date_str):
+def calculate_prorata_fee(monthly_fee, admission_date_str, today_bs=None):
     """
     Calculates pro-rata fee if the admission date is in the current month.
     Returns (amount_to_charge, description_suffix)
@@ -57,27 +67,103 @@ def calculate_prorata_fee(monthly_fee, admission_date_str):
     if not admission_date_str:
         return monthly_fee, ""
         
-    try:
-        today_bs = nepali_datetime.date.today()
-        # Parse admission date
-        adm_parts = [int(p) for p in admission_date_str.split('-')]
-        adm_date = nepali_datetime.date(adm_parts[0], adm_parts[1], adm_parts[2])
+    today_bs = today_bs or nepali_datetime.date.today()
+    admission = parse_bs(admission_date_str)
+    if not admission:
+        print(f"Error calculating pro-rata: invalid admission date {admission_date_str!r}")
+        return monthly_fee, ""
+
+    adm_year, adm_month, adm_day = admission
+    # Check if joined THIS month/year
+    if adm_year == today_bs.year and adm_month == today_bs.month:
+        total_days = days_in_month(today_bs.year, today_bs.month)
+        days_active = max(total_days - adm_day + 1, 1)
         
-        # Check if joined THIS month/year
-        if adm_date.year == today_bs.year and adm_date.month == today_bs.month:
-            total_days = get_days_in_bs_month(today_bs.year, today_bs.month)
-            days_active = total_days - adm_date.day + 1
-            
-            if days_active < 1: days_active = 1
-            
-            pro_rata_fee = (monthly_fee / total_days) * days_active
-            return round(pro_rata_fee), f" (Pro-Rata: Joined {admission_date_str})"
-            
-    except Exception as e:
-        print(f"Error calculating pro-rata: {e}")
+        pro_rata_fee = (monthly_fee / total_days) * days_active
+        return round(pro_rata_fee), f" (Pro-Rata: Joined {admission_date_str})"
         
     return monthly_fee, ""
 
+ADMISSION_FEE_TYPES = ('Normal', 'Scholarship', 'Percentage', 'Fixed')
+
+def admission_fee(fee_type, discount_percent, custom_fee, base_admission):
+    """Admission fee for a student's fee type: the default, discounted, a fixed amount, or nothing."""
+    if fee_type == 'Normal':
+        return base_admission
+    if fee_type == 'Percentage':
+        return base_admission * (1 - (discount_percent or 0) / 100)
+    if fee_type == 'Fixed':
+        return custom_fee or 0.0
+    return 0.0 # Scholarship
+
+def bill_monthly_fees(today_bs=None):
+    """
+    Set-based monthly billing for all ACTIVE students.
+    Looks up already-billed and package-covered students with one query each,
+    then inserts every fee row in a single batch and transaction.
+    Returns {'billed': [...], 'skipped': [...]} with one dict per student.
+    """
+    from database import PackageEnrollment, Package
+
+    today_bs = today_bs or nepali_datetime.date.today()
+    today_str = today_bs.strftime('%Y-%m-%d')
+    month_name = today_bs.strftime("%B")
+    search_term = f"{month_name} {today_bs.year}"
+
+    active_students = db.session.query(
+        Student.id, Student.name, Student.custom_monthly_fee, Student.last_admission_date
+    ).filter(Student.status == 'Active').order_by(Student.id).all()
+
+    # Exact period key catches both Enrollment and standard monthly fees
+    already_billed = {row.student_id for row in monthly_fee_query(today_bs.year, today_bs.month).with_entities(
+        LedgerTransaction.student_id
+    ).distinct()}
+
+    # --- Package Protection ---
+    package_covered = dict(db.session.query(PackageEnrollment.student_id, Package.name).join(Package).filter(
+        PackageEnrollment.start_ord <= today_bs.toordinal(),
+        PackageEnrollment.end_ord >= today_bs.toordinal()
+    ).all())
+
+    balances = dict(db.session.query(StudentBalance.student_id, StudentBalance.balance).all())
+
+    billed, skipped, rows = [], [], []
+    for s in active_students:
+        if s.id in already_billed:
+            skipped.append({'student_id': s.id, 'name': s.name, 'reason': 'Already billed', 'detail': search_term})
+            continue
+        if s.id in package_covered:
+            skipped.append({'student_id': s.id, 'name': s.name, 'reason': 'Active package', 'detail': package_covered[s.id]})
+            continue
+
+        amount_to_charge, suffix = calculate_prorata_fee(s.custom_monthly_fee, s.last_admission_date, today_bs)
+        balance_after = balances.get(s.id, 0.0) + amount_to_charge
+        rows.append({
+            'student_id': s.id,
+            'description': f"Monthly Fee - {search_term}{suffix}",
+            'debit': amount_to_charge,
+            'credit': 0.0,
+            'balance_after': balance_after,
+            'date': today_str,
+            'date_ord': today_bs.toordinal(),
+            'txn_type': 'FEE',
+            'is_void': False,
+            'fee_kind': 'MONTHLY',
+            'period_year': today_bs.year,
+            'period_month': today_bs.month
+        })
+        billed.append({'student_id': s.id, 'name': s.name, 'amount': amount_to_charge})
+
+    if rows:
+        db.session.execute(db.insert(LedgerTransaction), rows)
+        # Core inserts skip the flush hook, so refresh the materialized tables explicitly
+        sync_student_balances(db.session.connection(), [r['student_id'] for r in rows])
+        sync_monthly_summaries(db.session.connection(), [today_bs.year * 100 + today_bs.month])
+        refresh_student_notifications(db.session.connection(), [r['student_id'] for r in rows])
+    db.session.commit()
+
+    return {'billed': billed, 'skipped': skipped}
+
 # --- Routes ---
 @finance_bp.route('/finance')
 @login_required
@@ -87,12 +173,7 @@ def index():
     recent_transactions = LedgerTransaction.query.order_by(LedgerTransaction.date.desc()).limit(20).all()
     
     # Calculate total stats
-    total_due = 0
-    students = Student.query.all()
-    for s in students:
-        bal = s.get_balance()
-        if bal > 0:
-            total_due += bal
+    total_due = db.session.query(db.func.sum(StudentBalance.balance)).filter(StudentBalance.balance > 0).scalar() or 0
             
     return render_template('finance/index.html', transactions=recent_transactions, total_due=total_due)
 
@@ -118,13 +199,9 @@ def pay(student_id):
         month_name = today_bs.strftime("%B")
         fee_description = f"Monthly Fee - {month_name} {today_bs.year}"
         
-        # Search for any non-voided FEE transaction containing the current month and year
-        search_term = f"{month_name} {today_bs.year}"
-        fee_exists = LedgerTransaction.query.filter(
-            LedgerTransaction.student_id == student.id,
-            LedgerTransaction.is_void == False,
-            LedgerTransaction.txn_type == 'FEE',
-            LedgerTransaction.description.contains(search_term)
+        # Look for a non-voided MONTHLY fee for the current billing period
+        fee_exists = monthly_fee_query(today_bs.year, today_bs.month).filter(
+            LedgerTransaction.student_id == student.id
         ).first()
 
         if not fee_exists:
@@ -133,12 +210,12 @@ def pay(student_id):
             from database import PackageEnrollment
             active_package = PackageEnrollment.query.filter(
                 PackageEnrollment.student_id == student.id,
-                PackageEnrollment.start_date <= today_bs.strftime('%Y-%m-%d'),
-                PackageEnrollment.end_date >= today_bs.strftime('%Y-%m-%d')
+                PackageEnrollment.start_ord <= today_bs.toordinal(),
+                PackageEnrollment.end_ord >= today_bs.toordinal()
             ).first()
             
             if not active_package:
-                add_transaction(student.id, description=fee_description, debit=student.custom_monthly_fee, credit=0, txn_type='FEE')
+                add_transaction(student.id, description=fee_description, debit=student.custom_monthly_fee, credit=0, txn_type='FEE', fee_kind='MONTHLY', period=(today_bs.year, today_bs.month))
                 db.session.commit() # Ensure the fee exists before the payment txn is created
                 flash(f"Monthly fee for {month_name} was automatically billed.")
             else:
@@ -163,16 +240,24 @@ def student_ledger(student_id):
     
     query = LedgerTransaction.query.filter_by(student_id=student.id)
     
-    if start_date:
-        query = query.filter(LedgerTransaction.date >= start_date)
-    if end_date:
-        query = query.filter(LedgerTransaction.date <= end_date)
+    # An unparseable bound is reported and dropped, so the filter shows what was applied
+    start_ord, end_ord = to_ordinal(start_date), to_ordinal(end_date)
+    if start_date and start_ord is None:
+        flash(f"Invalid start date: {start_date}. Showing the ledger without a start date.", "warning")
+        start_date = None
+    if end_date and end_ord is None:
+        flash(f"Invalid end date: {end_date}. Showing the ledger without an end date.", "warning")
+        end_date = None
+    if start_ord:
+        query = query.filter(LedgerTransaction.date_ord >= start_ord)
+    if end_ord:
+        query = query.filter(LedgerTransaction.date_ord <= end_ord)
         
     transactions = query.order_by(LedgerTransaction.date.desc()).all()
     
     import nepali_datetime
     today_bs = nepali_datetime.date.today()
-    return render_template('finance/ledger.html', student=student, transactions=transactions, start_date=start_date, end_date=end_date, current_year_bs=today_bs.year)
+    return render_template('finance/ledger.html', student=student, transactions=transactions, start_date=start_date, end_date=end_date, current_year_bs=today_bs.year, year_end=year_end)
 
 @finance_bp.route('/finance/generate', methods=['POST'])
 @login_required
@@ -181,43 +266,17 @@ def generate_fees():
     """
     Generates monthly fees for all ACTIVE students.
     """
-    # Use Nepali Month Name
     today_bs = nepali_datetime.date.today()
-    month_name = today_bs.strftime("%B") # nepali_datetime might support %B for nepali months
-    
-    count = 0
-    active_students = Student.query.filter_by(status='Active').all()
+    month_name = today_bs.strftime("%B")
 
-    for s in active_students:
-        description = f"Monthly Fee - {month_name} {today_bs.year}"
-        
-        # Calculate Pro-Rata using helper
-        amount_to_charge, suffix = calculate_prorata_fee(s.custom_monthly_fee, s.last_admission_date)
-        description += suffix
-
-        # Check dupes using substring (Month Year) to catch Enrollment vs standard fees
-        search_term = f"{month_name} {today_bs.year}"
-        exists = LedgerTransaction.query.filter(
-            LedgerTransaction.student_id == s.id,
-            LedgerTransaction.is_void == False,
-            LedgerTransaction.txn_type == 'FEE',
-            LedgerTransaction.description.contains(search_term)
-        ).first()
+    summary = bill_monthly_fees(today_bs)
 
-        if not exists:
-            # --- Package Protection ---
-            from database import PackageEnrollment
-            active_package = PackageEnrollment.query.filter(
-                PackageEnrollment.student_id == s.id,
-                PackageEnrollment.start_date <= today_bs.strftime('%Y-%m-%d'),
-                PackageEnrollment.end_date >= today_bs.strftime('%Y-%m-%d')
-            ).first()
-            
-            if not active_package:
-                add_transaction(s.id, description=description, debit=amount_to_charge, credit=0, txn_type='FEE')
-                count += 1
-            
-    flash(f"Generated fees for {count} active students ({month_name}).")
+    flash(f"Generated fees for {len(summary['billed'])} active students ({month_name}).")
+    if summary['skipped']:
+        reasons = {}
+        for entry in summary['skipped']:
+            reasons[entry['reason']] = reasons.get(entry['reason'], 0) + 1
+        flash("Skipped " + ", ".join(f"{count} ({reason})" for reason, count in reasons.items()) + ".")
     return redirect(url_for('finance.index'))
 
 @finance_bp.route('/finance/renew-admission', methods=['POST'])
@@ -236,33 +295,28 @@ def renew_admissions():
     
     active_students = Student.query.filter_by(status='Active').all()
     for s in active_students:
-        if not s.last_admission_date:
+        # last_admission_date is YYYY-MM-DD
+        last_date = parse_bs(s.last_admission_date)
+        if not last_date:
             continue
+        last_year, last_month, last_day = last_date
             
         try:
-            # last_admission_date is YYYY-MM-DD
-            parts = [int(p) for p in s.last_admission_date.split('-')]
-            last_date = nepali_datetime.date(parts[0], parts[1], parts[2])
             # Check if exactly one year or more has passed
-            # A simple way: if current year > last_date.year AND (current month > last_month OR (current month == last month AND current day >= last day))
+            # A simple way: if current year > last year AND (current month > last_month OR (current month == last month AND current day >= last day))
             is_due = False
-            if today_bs.year > last_date.year:
-                if today_bs.month > last_date.month:
+            if today_bs.year > last_year:
+                if today_bs.month > last_month:
                     is_due = True
-                elif today_bs.month == last_date.month and today_bs.day >= last_date.day:
+                elif today_bs.month == last_month and today_bs.day >= last_day:
                     is_due = True
             
             if is_due:
-                fee_to_charge = 0.0
-                if s.admission_fee_type == 'Normal':
-                    fee_to_charge = base_admission
-                elif s.admission_fee_type == 'Percentage':
-                    fee_to_charge = base_admission * (1 - s.admission_discount_percent / 100)
-                elif s.admission_fee_type == 'Fixed':
-                    fee_to_charge = s.custom_admission_fee
+                fee_to_charge = admission_fee(s.admission_fee_type, s.admission_discount_percent,
+                                              s.custom_admission_fee, base_admission)
                 
                 if fee_to_charge > 0:
-                    add_transaction(s.id, description=f"Annual Admission Renewal ({today_bs.year})", debit=fee_to_charge, credit=0, txn_type='FEE')
+                    add_transaction(s.id, description=f"Annual Admission Renewal ({today_bs.year})", debit=fee_to_charge, credit=0, txn_type='FEE', fee_kind='ADMISSION')
                     s.last_admission_date = today_bs.strftime('%Y-%m-%d')
                     count += 1
         except Exception as e:
@@ -271,17 +325,133 @@ def renew_admissions():
     db.session.commit()
     flash(f"Admission renewed for {count} students.")
     return redirect(url_for('finance.index'))
-def recalculate_balances(student_id):
+
+def _supports_window_update():
+    """UPDATE ... FROM needs SQLite 3.33+, window functions 3.25+."""
+    import sqlite3
+    return db.engine.dialect.name == 'sqlite' and sqlite3.sqlite_version_info >= (3, 33, 0)
+
+def _running_balance_update(student_filter, opening=0.0):
+    """
+    Single window-function UPDATE rewriting balance_after for the rows matched by
+    student_filter, partitioned per student and starting from `opening`.
+    """
+    net = db.case((LedgerTransaction.is_void == True, 0.0),
+                  else_=db.func.coalesce(LedgerTransaction.debit, 0.0) - db.func.coalesce(LedgerTransaction.credit, 0.0))
+    running = db.select(
+        LedgerTransaction.id,
+        db.func.sum(net).over(
+            partition_by=LedgerTransaction.student_id,
+            order_by=(LedgerTransaction.date, LedgerTransaction.id)
+        ).label('running')
+    ).where(student_filter).subquery()
+
+    db.session.execute(
+        db.update(LedgerTransaction)
+        .where(LedgerTransaction.id == running.c.id)
+        .values(balance_after=opening + running.c.running)
+        .execution_options(synchronize_session=False)
+    )
+
+def recalculate_balances(student_id, from_date=None, from_id=0):
     """
     Helper to ensure the running balance is accurate after any change.
+    from_date/from_id: ledger position (date, id) of the earliest changed row.
+    Only rows from that position onward are rewritten, starting from the
+    balance just before it. Omit to recompute the student's whole ledger.
+    """
+    db.session.flush()
+
+    suffix = LedgerTransaction.student_id == student_id
+    opening = 0.0
+    if from_date is not None:
+        suffix = db.and_(suffix, db.or_(
+            LedgerTransaction.date > from_date,
+            db.and_(LedgerTransaction.date == from_date, LedgerTransaction.id >= from_id)
+        ))
+        previous = LedgerTransaction.query.filter(
+            LedgerTransaction.student_id == student_id,
+            db.or_(
+                LedgerTransaction.date < from_date,
+                db.and_(LedgerTransaction.date == from_date, LedgerTransaction.id < from_id)
+            )
+        ).order_by(LedgerTransaction.date.desc(), LedgerTransaction.id.desc()).first()
+        # Void rows carry the running balance too, so the previous row is always a valid start
+        opening = previous.balance_after if previous else 0.0
+
+    if _supports_window_update():
+        _running_balance_update(suffix, opening)
+        # Core UPDATE bypasses the flush hook
+        sync_student_balances(db.session.connection(), [student_id])
+        refresh_student_notifications(db.session.connection(), [student_id])
+    else:
+        running_balance = opening
+        for t in LedgerTransaction.query.filter(suffix).order_by(LedgerTransaction.date.asc(), LedgerTransaction.id.asc()):
+            if not t.is_void:
+                running_balance += t.debit - t.credit
+            t.balance_after = running_balance
+    db.session.commit()
+
+def removal_note(source, source_id):
+    """Suffix recorded on a ledger description when its linked enrollment or sale is deleted."""
+    return f" [{source} #{source_id} removed]"
+
+def linked_description(link_column, source):
+    """SQL form of a description plus removal_note(), for bulk deletes that clear link_column."""
+    note = db.literal(f" [{source} #") + db.cast(link_column, db.String) + db.literal(" removed]")
+    return db.func.substr(LedgerTransaction.description + note, 1, 200)
+
+def void_linked_transactions(ledger_entries, source=None, source_id=None):
+    """
+    Voids the ledger rows linked to an enrollment or sale that is being removed,
+    then recalculates each affected student's balance from the earliest one.
+    With a source, the removal is also noted on each row, since deleting the
+    source clears the link.
+    """
+    first_voided = {}
+    for txn in ledger_entries:
+        if source:
+            txn.description = (txn.description + removal_note(source, source_id))[:200]
+        if txn.is_void:
+            continue
+        txn.is_void = True
+        position = (txn.date, txn.id)
+        if txn.student_id not in first_voided or position < first_voided[txn.student_id]:
+            first_voided[txn.student_id] = position
+
+    for student_id, position in first_voided.items():
+        recalculate_balances(student_id, *position)
+    return len(first_voided)
+
+def recalculate_balances_bulk(student_ids):
+    """Recomputes complete ledgers for many students in one pass."""
+    student_ids = list(set(student_ids))
+    if not student_ids:
+        return
+    db.session.flush()
+
+    if _supports_window_update():
+        for i in range(0, len(student_ids), 500):
+            _running_balance_update(LedgerTransaction.student_id.in_(student_ids[i:i + 500]))
+        sync_student_balances(db.session.connection(), student_ids)
+        refresh_student_notifications(db.session.connection(), student_ids)
+        db.session.commit()
+    else:
+        for student_id in student_ids:
+            recalculate_balances(student_id)
+
+@finance_bp.route('/finance/recalculate', methods=['POST'])
+@login_required
+@admin_required
+def recalculate_all():
     """
-    all_txns = LedgerTransaction.query.filter_by(student_id=student_id).order_by(LedgerTransaction.date.asc(), LedgerTransaction.id.asc()).all()
-    running_balance = 0.0
-    for t in all_txns:
-        if not t.is_void:
-            running_balance += t.debit - t.credit
-        t.balance_after = running_balance
+    Rebuilds every student's running balances, e.g. after ledger rows were edited outside the app.
+    """
+    student_ids = [student_id for (student_id,) in db.session.query(Student.id).order_by(Student.id)]
+    recalculate_balances_bulk(student_ids)
     db.session.commit()
+    flash(f"Balances recalculated for {len(student_ids)} students.")
+    return redirect(url_for('finance.index'))
 
 @finance_bp.route('/finance/transaction/void/<int:id>')
 @login_required
@@ -294,7 +464,7 @@ def void_transaction(id):
     transaction.is_void = True
     db.session.commit()
     
-    recalculate_balances(transaction.student_id)
+    recalculate_balances(transaction.student_id, transaction.date, transaction.id)
     
     flash(f"Transaction ID {id} has been VOIDED.")
     return redirect(url_for('finance.student_ledger', student_id=transaction.student_id))
@@ -308,10 +478,11 @@ def delete_transaction(id):
     """
     transaction = LedgerTransaction.query.get_or_404(id)
     student_id = transaction.student_id
+    position = (transaction.date, transaction.id)
     db.session.delete(transaction)
     db.session.commit()
     
-    recalculate_balances(student_id)
+    recalculate_balances(student_id, *position)
     
     flash(f"Transaction ID {id} has been PERMANENTLY DELETED.")
     return redirect(url_for('finance.student_ledger', student_id=student_id))
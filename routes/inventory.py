@@ -50,7 +50,6 @@ def edit(id):
 @permission_required('can_manage_inventory')
 def sell():
     products = Product.query.filter(Product.stock > 0).all()
-    students = Student.query.filter_by(status='Active').all()
     
     if request.method == 'POST':
         product_id = request.form['product_id']
@@ -73,13 +72,14 @@ def sell():
             date=today_bs
         )
         db.session.add(sale)
+        db.session.flush() # Need sale.id to link ledger rows
         
         # Deduct stock
         product.stock -= quantity
         
         # Charge student ledger
         description_debit = f"Purchase: {product.name} (Qty: {quantity})"
-        debit_txn = add_transaction(student_id, description=description_debit, debit=price_sold, credit=0, txn_type='FEE')
+        debit_txn = add_transaction(student_id, description=description_debit, debit=price_sold, credit=0, txn_type='FEE', fee_kind='PRODUCT', product_sale_id=sale.id)
         
         # Handle Immediate Payment
         pay_now = request.form.get('pay_now') == 'on'
@@ -87,7 +87,7 @@ def sell():
         if pay_now:
             amount_paid = float(request.form.get('amount_paid', price_sold))
             description_credit = f"Payment for {product.name}"
-            credit_txn = add_transaction(student_id, description=description_credit, debit=0, credit=amount_paid, txn_type='PAYMENT')
+            credit_txn = add_transaction(student_id, description=description_credit, debit=0, credit=amount_paid, txn_type='PAYMENT', product_sale_id=sale.id)
         
         db.session.commit()
         
@@ -99,7 +99,7 @@ def sell():
              
         return redirect(url_for('inventory.index'))
         
-    return render_template('inventory/sell.html', products=products, students=students)
+    return render_template('inventory/sell.html', products=products)
 
 @inventory_bp.route('/inventory/receipt/<int:sale_id>')
 @login_required
@@ -109,13 +109,11 @@ def view_receipt(sale_id):
     student = Student.query.get(sale.student_id)
     product = Product.query.get(sale.product_id)
     
-    # Check for linked payment (heuristic: same date, same amount, credit txn)
-    # Ideally link them via key, but for now we search for recent credit txn
+    # Payment recorded against this sale, if any
     payment_txn = LedgerTransaction.query.filter_by(
-        student_id=student.id, 
-        credit=sale.price_sold, 
-        date=sale.date,
-        txn_type='PAYMENT'
+        product_sale_id=sale.id,
+        txn_type='PAYMENT',
+        is_void=False
     ).order_by(LedgerTransaction.id.desc()).first()
     
     return render_template('inventory/receipt.html', sale=sale, student=student, product=product, payment=payment_txn)
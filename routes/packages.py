@@ -2,8 +2,8 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required
 from database import db, Package, PackageEnrollment, Student, LedgerTransaction
 from routes.auth import admin_required, permission_required
-from routes.finance import add_transaction
-import nepali_datetime
+from routes.finance import add_transaction, monthly_fee_query, void_linked_transactions, linked_description
+from bs_calendar import parse_bs, add_months, add_months_to_date
 
 packages_bp = Blueprint('packages', __name__)
 
@@ -12,9 +12,8 @@ packages_bp = Blueprint('packages', __name__)
 @permission_required('can_manage_packages')
 def index():
     packages = Package.query.all()
-    # Pass students for the Enrollment Modal
-    students = Student.query.filter_by(status='Active').all()
-    return render_template('packages/index.html', packages=packages, students=students)
+    # The Enrollment Modal loads students from /api/students/picker
+    return render_template('packages/index.html', packages=packages)
 
 @packages_bp.route('/api/packages/<int:id>/members')
 @login_required
@@ -75,7 +74,6 @@ def edit(id):
 @permission_required('can_manage_packages')
 def enroll(id):
     package = Package.query.get_or_404(id)
-    students = Student.query.filter_by(status='Active').all()
     
     if request.method == 'POST':
         student_id = request.form.get('student_id')
@@ -93,23 +91,12 @@ def enroll(id):
             flash(f'Student {student.name} must pay admission fee before enrolling in a package.', 'warning')
             return redirect(url_for('students.edit', id=student.id))
 
-        # Calculate end date (crude approximation for BS months)
-        try:
-            parts = [int(p) for p in start_date_str.split('-')]
-            start_date = nepali_datetime.date(parts[0], parts[1], parts[2])
-            # Add duration_months
-            new_month = start_date.month + package.duration_months
-            new_year = start_date.year + (new_month - 1) // 12
-            new_month = (new_month - 1) % 12 + 1
-            # Adjust day if needed (e.g. if day 32 and target month has 31)
-            try:
-                end_date = nepali_datetime.date(new_year, new_month, start_date.day)
-            except ValueError:
-                end_date = nepali_datetime.date(new_year, new_month, 30) # Safe bet for BS
-            
-            end_date_str = end_date.strftime('%Y-%m-%d')
-        except Exception:
-            end_date_str = start_date_str # Fallback
+        # End date: same day duration_months later, clamped to that month's length (e.g. day 32 -> 31)
+        start_date = parse_bs(start_date_str)
+        if not start_date:
+            flash('Invalid start date.', 'danger')
+            return redirect(url_for('packages.enroll', id=id))
+        end_date_str = add_months_to_date(start_date_str, package.duration_months)
 
         enrollment = PackageEnrollment(
             package_id=id,
@@ -121,52 +108,41 @@ def enroll(id):
             payment_deadline=deadline
         )
         db.session.add(enrollment)
+        db.session.flush() # Need enrollment.id to link ledger rows
         
-        add_transaction(student_id, description=f"Package: {package.name} ({package.duration_months} Months)", debit=package.price, credit=0, txn_type='FEE')
+        add_transaction(student_id, description=f"Package: {package.name} ({package.duration_months} Months)", debit=package.price, credit=0, txn_type='FEE', fee_kind='PACKAGE', package_enrollment_id=enrollment.id)
         if amount_paid > 0:
-            add_transaction(student_id, description=f"Payment for Package: {package.name}", debit=0, credit=amount_paid, txn_type='PAYMENT')
+            add_transaction(student_id, description=f"Payment for Package: {package.name}", debit=0, credit=amount_paid, txn_type='PAYMENT', package_enrollment_id=enrollment.id)
             
         # --- Package Fee Adjustment ---
         if request.form.get('skip_monthly') == 'yes':
             void_count = 0
+            first_voided = None
             # Loop through each month of the package duration
             for i in range(package.duration_months):
-                # Calculate target month/year
-                # Add i months to start_date
-                target_month_idx = start_date.month + i
-                target_year = start_date.year + (target_month_idx - 1) // 12
-                target_month_num = (target_month_idx - 1) % 12 + 1
-                
-                # Get Month Name from nepali_datetime might be tricky if not built-in for number->name
-                # Let's rely on constructing a date and getting strftime
-                # We need a valid day (1 is safe)
-                target_date = nepali_datetime.date(target_year, target_month_num, 1)
-                search_month = target_date.strftime('%B')
-                search_year = target_date.year
+                # Add i months to the start month
+                target_year, target_month_num = add_months(start_date[0], start_date[1], i)
                 
-                search_pattern = f"%Monthly Fee% - {search_month} {search_year}"
-                
-                overlapping_fees = LedgerTransaction.query.filter(
-                    LedgerTransaction.student_id == student_id,
-                    LedgerTransaction.description.like(search_pattern),
-                    LedgerTransaction.is_void == False,
-                    LedgerTransaction.txn_type == 'FEE'
+                overlapping_fees = monthly_fee_query(target_year, target_month_num).filter(
+                    LedgerTransaction.student_id == student_id
                 ).all()
                 
                 for fee in overlapping_fees:
                     fee.is_void = True
                     void_count += 1
+                    if first_voided is None or (fee.date, fee.id) < first_voided:
+                        first_voided = (fee.date, fee.id)
             
             if void_count > 0:
                 from routes.finance import recalculate_balances
-                recalculate_balances(student_id)
+                recalculate_balances(student_id, *first_voided)
                 flash(f"Automatically waived {void_count} overlapping monthly fees for package duration.")
 
         db.session.commit()
         flash('Package enrollment successful!')
         return redirect(url_for('packages.index'))
         
-    return render_template('packages/enroll.html', package=package, students=students)
+    return render_template('packages/enroll.html', package=package)
 
 @packages_bp.route('/packages/view/<int:id>')
 @login_required
@@ -183,17 +159,8 @@ def delete_enrollment(id):
     enrollment = PackageEnrollment.query.get_or_404(id)
     package_id = enrollment.package_id
     
-    # Void ledger transactions
-    from database import LedgerTransaction
-    search_term = f"%Package: {enrollment.package.name}%"
-    txns = LedgerTransaction.query.filter(
-        LedgerTransaction.student_id == enrollment.student_id,
-        LedgerTransaction.description.like(search_term),
-        LedgerTransaction.is_void == False
-    ).all()
-    
-    for txn in txns:
-        txn.is_void = True
+    # Void ledger transactions linked to this enrollment
+    void_linked_transactions(enrollment.ledger_entries, 'package enrollment', enrollment.id)
         
     db.session.delete(enrollment)
     db.session.commit()
@@ -224,6 +191,10 @@ def delete_all():
     # Similar to classes/workshops, we just delete the records.
     # Ideally should void transactions, but for mass delete, we prioritize cleanup.
     
+    LedgerTransaction.query.filter(LedgerTransaction.package_enrollment_id != None).update({
+        'description': linked_description(LedgerTransaction.package_enrollment_id, 'package enrollment'),
+        'package_enrollment_id': None,
+    }, synchronize_session=False)
     PackageEnrollment.query.delete()
     Package.query.delete()
     
@@ -1,54 +1,106 @@
-from flask import Blueprint, render_template, request, Response, redirect, url_for, flash
+from flask import Blueprint, render_template, request, Response, redirect, url_for, flash, stream_with_context
 from flask_login import login_required
 from routes.auth import permission_required
-from database import db, Student, LedgerTransaction, Enrollment, Attendance, Class
+from database import db, Student, LedgerTransaction, Enrollment, Attendance, Class, StudentBalance
 import csv
 import io
+import zlib
 import nepali_datetime
 from datetime import datetime, timedelta
+from bs_calendar import ordinal_to_ymd, to_ordinal, add_months, month_bounds, parse_bs, year_end
 
 reports_bp = Blueprint('reports', __name__)
 
+def _range_totals(start_ord, end_ord):
+    """Direct indexed sums over an inclusive BS day-ordinal range (used for partial months)."""
+    from database import WorkshopEnrollment, Expense
+
+    income = db.session.query(db.func.sum(LedgerTransaction.credit)).filter(
+        LedgerTransaction.date_ord.between(start_ord, end_ord), LedgerTransaction.is_void == False).scalar() or 0.0
+    guest = db.session.query(db.func.sum(WorkshopEnrollment.amount_paid)).filter(
+        WorkshopEnrollment.date_ord.between(start_ord, end_ord), WorkshopEnrollment.student_id == None).scalar() or 0.0
+    expense = db.session.query(db.func.sum(Expense.amount)).filter(
+        Expense.date_ord.between(start_ord, end_ord), Expense.is_void == False).scalar() or 0.0
+    return income + guest, expense
+
+def summarize_finances(start_ord, end_ord):
+    """
+    (total_income, total_expense) for an inclusive BS day-ordinal range.
+    Whole months come from the MonthlyFinanceSummary rollup in one range read;
+    only the partial months at either end are summed from the source tables.
+    """
+    from database import MonthlyFinanceSummary
+
+    sy, sm, _ = ordinal_to_ymd(start_ord)
+    ey, em, _ = ordinal_to_ymd(end_ord)
+
+    # First and last months fully inside the range
+    if start_ord > month_bounds(sy, sm)[0]:
+        sy, sm = add_months(sy, sm, 1)
+    if end_ord < month_bounds(ey, em)[1]:
+        ey, em = add_months(ey, em, -1)
+    if sy * 100 + sm > ey * 100 + em:
+        return _range_totals(start_ord, end_ord)
+
+    income, expense = db.session.query(
+        db.func.sum(MonthlyFinanceSummary.ledger_credit + MonthlyFinanceSummary.guest_income),
+        db.func.sum(MonthlyFinanceSummary.expense_total)
+    ).filter(MonthlyFinanceSummary.period.between(sy * 100 + sm, ey * 100 + em)).one()
+    income, expense = income or 0.0, expense or 0.0
+
+    # Partial months at the edges
+    full_low = month_bounds(sy, sm)[0]
+    full_high = month_bounds(ey, em)[1]
+    for low, high in [(start_ord, full_low - 1), (full_high + 1, end_ord)]:
+        if low <= high:
+            edge_income, edge_expense = _range_totals(low, high)
+            income += edge_income
+            expense += edge_expense
+    return income, expense
+
 @reports_bp.route('/reports')
 @login_required
 @permission_required('can_view_reports')
 def index():
     # --- Defaulters List Logic ---
     # Students with Positive Balance (> 0)
-    all_students = Student.query.filter_by(status='Active').all()
-    defaulters = [s for s in all_students if s.get_balance() > 0]
+    defaulters = Student.query.join(StudentBalance).filter(
+        Student.status == 'Active',
+        StudentBalance.balance > 0
+    ).all()
     
     # --- Income Report Logic ---
     # Default to current month (BS)
     today_bs = nepali_datetime.date.today()
     first_day_bs = nepali_datetime.date(today_bs.year, today_bs.month, 1)
     
-    start_date_str = request.args.get('start_date', first_day_bs.strftime('%Y-%m-%d'))
-    end_date_str = request.args.get('end_date', today_bs.strftime('%Y-%m-%d'))
+    default_start = first_day_bs.strftime('%Y-%m-%d')
+    default_end = today_bs.strftime('%Y-%m-%d')
+    start_date_str = request.args.get('start_date') or default_start
+    end_date_str = request.args.get('end_date') or default_end
     
-    start_date = start_date_str
-    end_date = end_date_str
+    # Indexed ordinal range; an unparseable date is reported and replaced by its default
+    start_ord, end_ord = to_ordinal(start_date_str), to_ordinal(end_date_str)
+    if start_ord is None:
+        flash(f"Invalid start date: {start_date_str}. Showing from {default_start}.", "warning")
+        start_date_str, start_ord = default_start, to_ordinal(first_day_bs)
+    if end_ord is None:
+        flash(f"Invalid end date: {end_date_str}. Showing up to {default_end}.", "warning")
+        end_date_str, end_ord = default_end, to_ordinal(today_bs)
     
     # Fetch CREDIT transactions (Payments) within range
     income_txns = LedgerTransaction.query.filter(
-        LedgerTransaction.date >= start_date,
-        LedgerTransaction.date <= end_date,
+        LedgerTransaction.date_ord.between(start_ord, end_ord),
         LedgerTransaction.credit > 0
-    ).order_by(LedgerTransaction.date.desc()).all()
-    
-    total_income_ledger = sum(t.credit for t in income_txns)
+    ).order_by(LedgerTransaction.date_ord.desc(), LedgerTransaction.id.desc()).all()
     
     # Fetch Guest Workshop Payments (not in ledger)
     from database import WorkshopEnrollment
     guest_payments = WorkshopEnrollment.query.filter(
         WorkshopEnrollment.student_id == None,
-        WorkshopEnrollment.date >= start_date,
-        WorkshopEnrollment.date <= end_date,
+        WorkshopEnrollment.date_ord.between(start_ord, end_ord),
         WorkshopEnrollment.amount_paid > 0
     ).all()
-    
-    total_guest_income = sum(p.amount_paid for p in guest_payments)
-    total_income = total_income_ledger + total_guest_income
 
     # Unify for template
     unified_income = []
@@ -79,11 +131,11 @@ def index():
     # --- Expense Logic ---
     from database import Expense
     expenses = Expense.query.filter(
-        Expense.date >= start_date,
-        Expense.date <= end_date
-    ).order_by(Expense.date.desc()).all()
+        Expense.date_ord.between(start_ord, end_ord)
+    ).order_by(Expense.date_ord.desc(), Expense.id.desc()).all()
     
-    total_expense = sum(e.amount for e in expenses)
+    # Totals exclude voided rows (which stay listed for audit)
+    total_income, total_expense = summarize_finances(start_ord, end_ord)
     net_profit = total_income - total_expense
     
     return render_template('reports/index.html', 
@@ -95,89 +147,136 @@ def index():
                            net_profit=net_profit,
                            start_date=start_date_str,
                            end_date=end_date_str,
+                           current_year_bs=today_bs.year,
+                           year_end=year_end)
+
+@reports_bp.route('/reports/attendance')
+@login_required
+@permission_required('can_view_reports')
+def attendance_rates():
+    # The table loads from /api/attendance/rates/<group>; this only sets the default range (this BS month)
+    today_bs = nepali_datetime.date.today()
+    return render_template('reports/attendance.html',
+                           start_date=request.args.get('start_date', today_bs.strftime('%Y-%m-01')),
+                           end_date=request.args.get('end_date', today_bs.strftime('%Y-%m-%d')),
                            current_year_bs=today_bs.year)
 
+EXPORT_CHUNK_SIZE = 1000 # Rows fetched from the cursor and written per streamed chunk
+
+def stream_csv(header, query, filename, compress=False):
+    """
+    Streaming CSV download of a select's rows, fetched EXPORT_CHUNK_SIZE at a time.
+    With compress=True the chunks go through one gzip stream (filename gets .gz).
+    """
+    def rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        result = db.session.execute(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        for chunk in result.partitions():
+            writer.writerows(chunk)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        if buffer.tell():
+            yield buffer.getvalue() # Header only, when nothing matched
+
+    def gzipped():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) # gzip container
+        for text in rows():
+            data = compressor.compress(text.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
+
+    if compress:
+        return Response(stream_with_context(gzipped()), mimetype="application/gzip",
+                        headers={"Content-Disposition": f"attachment;filename={filename}.gz"})
+    return Response(stream_with_context(rows()), mimetype="text/csv",
+                    headers={"Content-Disposition": f"attachment;filename={filename}"})
+
 @reports_bp.route('/reports/export/income')
 @login_required
+@permission_required('can_view_reports')
 def export_income():
-    start_date_str = request.args.get('start_date')
-    end_date_str = request.args.get('end_date')
-    
-    start_date = start_date_str
-    end_date = end_date_str
-    
-    # Unify for CSV
-    unified_entries = []
-    for txn in income_txns:
-        unified_entries.append([txn.date, txn.student.name if txn.student else "Unknown", txn.description, txn.credit])
-        
-    # Guest Workshop Payments
-    from database import WorkshopEnrollment
-    guest_payments = WorkshopEnrollment.query.filter(
-        WorkshopEnrollment.student_id == None,
-        WorkshopEnrollment.date >= start_date,
-        WorkshopEnrollment.date <= end_date,
-        WorkshopEnrollment.amount_paid > 0
-    ).all()
-    
-    for p in guest_payments:
-        unified_entries.append([p.date, f"{p.guest_name} (Guest)", f"Workshop: {p.workshop.name}", p.amount_paid])
-    
-    # Sort by date
-    unified_entries.sort(key=lambda x: x[0], reverse=True)
+    """
+    Streams non-void ledger payments and guest workshop payments in the BS date range
+    (default this month), newest first, as one UNION ALL query. gzip=1 compresses it.
+    """
+    from database import WorkshopEnrollment, Workshop
 
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Date', 'Name', 'Description', 'Amount'])
-    
-    for row in unified_entries:
-        writer.writerow(row)
-        
-    output.seek(0)
-    
-    return Response(
-        output,
-        mimetype="text/csv",
-        headers={"Content-Disposition": f"attachment;filename=income_report_{start_date_str}_to_{end_date_str}.csv"}
+    today_bs = nepali_datetime.date.today()
+    start_date_str = request.args.get('start_date') or today_bs.strftime('%Y-%m-01')
+    end_date_str = request.args.get('end_date') or today_bs.strftime('%Y-%m-%d')
+    start_ord, end_ord = to_ordinal(start_date_str), to_ordinal(end_date_str)
+    if start_ord is None or end_ord is None:
+        flash("Invalid date range for the income export.", "warning")
+        return redirect(url_for('reports.index'))
+
+    ledger = (
+        db.select(LedgerTransaction.date_ord.label('date_ord'), LedgerTransaction.id.label('id'),
+                  LedgerTransaction.date.label('date'),
+                  db.func.coalesce(Student.name, 'Unknown').label('name'),
+                  LedgerTransaction.description.label('description'), LedgerTransaction.credit.label('amount'))
+        .outerjoin(Student, Student.id == LedgerTransaction.student_id)
+        .where(LedgerTransaction.date_ord.between(start_ord, end_ord),
+               LedgerTransaction.credit > 0, LedgerTransaction.is_void == False)
+    )
+    guests = (
+        db.select(WorkshopEnrollment.date_ord, WorkshopEnrollment.id, WorkshopEnrollment.date,
+                  WorkshopEnrollment.guest_name + ' (Guest)', 'Workshop: ' + Workshop.name,
+                  WorkshopEnrollment.amount_paid)
+        .join(Workshop, Workshop.id == WorkshopEnrollment.workshop_id)
+        .where(WorkshopEnrollment.student_id == None, WorkshopEnrollment.date_ord.between(start_ord, end_ord),
+               WorkshopEnrollment.amount_paid > 0)
     )
+    merged = db.union_all(ledger, guests).subquery()
+    query = (db.select(merged.c.date, merged.c.name, merged.c.description, merged.c.amount)
+             .order_by(merged.c.date_ord.desc(), merged.c.id.desc()))
+
+    return stream_csv(['Date', 'Name', 'Description', 'Amount'], query,
+                      f"income_report_{start_date_str}_to_{end_date_str}.csv",
+                      compress=request.args.get('gzip') == '1')
 
 @reports_bp.route('/reports/export/attendance')
 @login_required
+@permission_required('can_view_attendance') # Linked from the attendance page
 def export_attendance():
-    # Export attendance for all classes for a specific month? Or all time?
-    # Let's do a simple dump for now, or maybe filter by class/date if params provided.
-    # Request said "Implement CSV Export for Attendance".
-    
-    class_id = request.args.get('class_id')
+    """
+    Streams attendance as CSV from one joined query, fetched and written in chunks so
+    memory stays flat for a full-history export. Optional filters: class_id, date
+    (one BS day) and month (BS 'YYYY-MM'); gzip=1 compresses it.
+    """
+    class_id = request.args.get('class_id', type=int)
     date_str = request.args.get('date')
-    
-    query = Attendance.query
-    filename = "attendance_report.csv"
-    
-    if class_id:
-        query = query.filter_by(class_id=class_id)
-        filename = f"attendance_class_{class_id}.csv"
-        
-    if date_str:
-        date = date_str
-        query = query.filter_by(date=date)
-        filename = f"attendance_{date_str}.csv"
-        
-    records = query.order_by(Attendance.date.desc()).all()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Date', 'Class', 'Student Name', 'Status'])
-    
-    for r in records:
-        # Resolve class name and student name lazily if not joined, but basic is fine
-         if r.student and r.student.name: # checking relationships
-            class_name = Class.query.get(r.class_id).name if r.class_id else "Unknown"
-            writer.writerow([r.date, class_name, r.student.name, r.status])
-            
-    output.seek(0)
-    return Response(
-        output,
-        mimetype="text/csv",
-        headers={"Content-Disposition": f"attachment;filename={filename}"}
+    month_str = request.args.get('month')
+
+    query = (
+        db.select(Attendance.date, db.func.coalesce(Class.name, 'Unknown'), Student.name, Attendance.status)
+        .join(Student, Student.id == Attendance.student_id)
+        .outerjoin(Class, Class.id == Attendance.class_id)
+        .order_by(Attendance.date_ord.desc(), Attendance.id.desc())
     )
+    filename_parts = ['attendance']
+
+    if class_id:
+        query = query.where(Attendance.class_id == class_id)
+        filename_parts.append(f"class_{class_id}")
+
+    if month_str:
+        parsed = parse_bs(f"{month_str}-01")
+        if not parsed:
+            flash(f"Invalid month: {month_str}. Use YYYY-MM (BS).", "warning")
+            return redirect(url_for('attendance.index', class_id=class_id))
+        query = query.where(Attendance.date_ord.between(*month_bounds(parsed[0], parsed[1])))
+        filename_parts.append(f"{parsed[0]}-{parsed[1]:02d}")
+    elif date_str:
+        date_ord = to_ordinal(date_str)
+        if date_ord is None:
+            flash(f"Invalid date: {date_str}.", "warning")
+            return redirect(url_for('attendance.index', class_id=class_id))
+        query = query.where(Attendance.date_ord == date_ord)
+        filename_parts.append(date_str)
+
+    return stream_csv(['Date', 'Class', 'Student Name', 'Status'], query, f"{'_'.join(filename_parts)}.csv",
+                      compress=request.args.get('gzip') == '1')
@@ -27,6 +27,8 @@ def index():
         settings.contact = request.form.get('contact')
         settings.default_admission_fee = float(request.form.get('default_admission_fee', 1000.0))
         settings.default_monthly_fee = float(request.form.get('default_monthly_fee', 5000.0))
+        settings.absence_alert_threshold = max(request.form.get('absence_alert_threshold', 3, type=int) or 3, 1)
+        settings.due_alert_threshold = request.form.get('due_alert_threshold', 5000.0, type=float)
         
         # Handle Logo Upload
         if 'logo' in request.files:
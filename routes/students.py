@@ -1,25 +1,107 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort
 from flask_login import login_required
 from routes.auth import admin_required, permission_required
-from database import db, Student
+from database import db, Student, StudentBalance, Enrollment, Class, normalize_phone
+from routes.finance import ADMISSION_FEE_TYPES, admission_fee
 from datetime import datetime
 import os
+import io
+import csv
+import json
+import base64
 from werkzeug.utils import secure_filename
+from bs_calendar import today_ordinal, parse_bs, format_bs
+from search import matching_students
 
 student_bp = Blueprint('students', __name__)
 
+STUDENTS_PER_PAGE = 50
+
+def encode_cursor(name, student_id):
+    return base64.urlsafe_b64encode(json.dumps([name, student_id]).encode()).decode()
+
+def decode_cursor(token):
+    """(name, id) from a page cursor, or None when it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        name, student_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return str(name), int(student_id)
+    except (ValueError, TypeError):
+        return None
+
+def student_page(status=None, class_id=None, min_balance=None, max_balance=None, search=None,
+                 after=None, before=None, per_page=STUDENTS_PER_PAGE):
+    """
+    One page of the student list in (name, id) order, seeking past the `after` (or back
+    before the `before`) cursor on ix_student_name instead of counting an OFFSET. Rows
+    carry only the listed columns plus the materialized balance, joined in the same query.
+    Returns (rows, total, next_cursor, prev_cursor).
+    """
+    balance = db.func.coalesce(StudentBalance.balance, 0.0)
+    conditions = []
+    if status:
+        conditions.append(Student.status == status)
+    if class_id:
+        conditions.append(Student.id.in_(db.select(Enrollment.student_id).where(Enrollment.class_id == class_id)))
+    if min_balance is not None:
+        conditions.append(balance >= min_balance)
+    if max_balance is not None:
+        conditions.append(balance <= max_balance)
+    if search:
+        conditions.append(Student.id.in_(matching_students(search)))
+
+    total = db.session.execute(
+        db.select(db.func.count()).select_from(Student)
+        .outerjoin(StudentBalance, StudentBalance.student_id == Student.id).where(*conditions)
+    ).scalar()
+
+    query = (
+        db.select(Student.id, Student.name, Student.phone, Student.status, Student.dob, Student.guardian_name,
+                  Student.emergency_contact, Student.photo_path, Student.custom_monthly_fee,
+                  Student.last_admission_date, balance.label('balance'))
+        .outerjoin(StudentBalance, StudentBalance.student_id == Student.id)
+        .where(*conditions)
+        .limit(per_page + 1) # One extra row tells whether another page follows
+    )
+    key = db.tuple_(Student.name, Student.id)
+    if before:
+        rows = db.session.execute(
+            query.where(key < before).order_by(Student.name.desc(), Student.id.desc())
+        ).all()
+        has_prev, has_next = len(rows) > per_page, True
+        rows = rows[:per_page][::-1]
+    else:
+        if after:
+            query = query.where(key > after)
+        rows = db.session.execute(query.order_by(Student.name, Student.id)).all()
+        has_prev, has_next = after is not None, len(rows) > per_page
+        rows = rows[:per_page]
+
+    next_cursor = encode_cursor(rows[-1].name, rows[-1].id) if rows and has_next else None
+    prev_cursor = encode_cursor(rows[0].name, rows[0].id) if rows and has_prev else None
+    return rows, total, next_cursor, prev_cursor
+
 @student_bp.route('/students')
 @login_required
 @permission_required('can_manage_students')
 def index():
-    search = request.args.get('search', '')
-    if search:
-        students = Student.query.filter(
-            (Student.name.contains(search)) | (Student.phone.contains(search))
-        ).all()
-    else:
-        students = Student.query.all()
-    return render_template('students/index.html', students=students, search=search)
+    filters = {
+        'search': request.args.get('search', '').strip(),
+        'status': request.args.get('status', ''),
+        'class_id': request.args.get('class_id', type=int),
+        'min_balance': request.args.get('min_balance', type=float),
+        'max_balance': request.args.get('max_balance', type=float),
+    }
+    students, total, next_cursor, prev_cursor = student_page(
+        after=decode_cursor(request.args.get('after')),
+        before=decode_cursor(request.args.get('before')),
+        **filters
+    )
+    classes = db.session.execute(db.select(Class.id, Class.name).order_by(Class.name)).all()
+    return render_template('students/index.html', students=students, total=total, classes=classes,
+                           next_cursor=next_cursor, prev_cursor=prev_cursor, search=filters['search'],
+                           filters={k: v for k, v in filters.items() if v not in (None, '')})
 
 @student_bp.route('/students/add', methods=['GET', 'POST'])
 @login_required
@@ -39,6 +121,22 @@ def add():
         
         # dob is now a string (BS date)
         if dob == 'None': dob = None
+
+        # Validate before anything is saved or charged
+        if fee < 0:
+            flash("Error: Monthly fee cannot be negative.", "danger")
+            return redirect(url_for('students.add'))
+
+        if phone:
+            # Remove any spaces, dashes or +977 prefix
+            clean_phone = normalize_phone(phone) or ''
+            if len(clean_phone) != 10:
+                flash("Error: Phone number must be exactly 10 digits.", "warning")
+                return redirect(url_for('students.add'))
+            phone = clean_phone # Save cleaned version
+            sharing = Student.query.filter_by(phone_digits=phone).first()
+            if sharing:
+                flash(f"Note: {sharing.name} is already registered with this phone number.", "info")
         
         # Handle photo upload
         photo = request.files.get('photo')
@@ -75,24 +173,12 @@ def add():
         from routes.finance import add_transaction, calculate_prorata_fee
         
         settings = Settings.query.first()
-        # Default to 1000 if not provided in form (though form has value="1000")
-        admission_to_charge = float(request.form.get('custom_admission_fee', 1000))
+        base_admission = settings.default_admission_fee if settings else 1000.0
+        admission_to_charge = admission_fee(admission_type, admission_discount, admission_custom, base_admission)
         
         if admission_to_charge > 0:
-            add_transaction(new_student.id, description="Admission Fee", debit=admission_to_charge, credit=0, txn_type='FEE')
+            add_transaction(new_student.id, description="Admission Fee", debit=admission_to_charge, credit=0, txn_type='FEE', fee_kind='ADMISSION')
 
-        if fee < 0:
-            flash("Error: Monthly fee cannot be negative.", "danger")
-            return redirect(url_for('students.add'))
-            
-        if phone:
-            # Remove any spaces or dashes
-            clean_phone = ''.join(filter(str.isdigit, phone))
-            if len(clean_phone) != 10:
-                flash("Error: Phone number must be exactly 10 digits.", "warning")
-                return redirect(url_for('students.add'))
-            phone = clean_phone # Save cleaned version
-            
         today_bs = nepali_datetime.date.today()
         month_name = today_bs.strftime('%B')
         description = f"Monthly Fee (Enrollment) - {month_name} {today_bs.year}"
@@ -102,11 +188,194 @@ def add():
         fee_to_charge, suffix = calculate_prorata_fee(fee, today_bs.strftime('%Y-%m-%d'))
         description += suffix
         
-        add_transaction(new_student.id, description=description, debit=fee_to_charge, credit=0, txn_type='FEE')
+        add_transaction(new_student.id, description=description, debit=fee_to_charge, credit=0, txn_type='FEE', fee_kind='MONTHLY', period=(today_bs.year, today_bs.month))
         
         flash('Student added and first month fee charged!')
         return redirect(url_for('students.index'))
-    return render_template('students/form.html', student=None)
+    return render_template('students/form.html', student=None, fee_types=ADMISSION_FEE_TYPES)
+
+IMPORT_COLUMNS = ['name', 'phone', 'dob', 'guardian_name', 'emergency_contact', 'monthly_fee',
+                  'admission_fee_type', 'admission_discount_percent', 'custom_admission_fee', 'admission_date']
+
+def _import_amount(row, column, errors, default=0.0, upper=None):
+    value = (row.get(column) or '').strip()
+    if not value:
+        return default
+    try:
+        amount = float(value)
+    except ValueError:
+        errors.append(f"{column} is not a number: {value!r}")
+        return default
+    if amount < 0 or (upper is not None and amount > upper):
+        errors.append(f"{column} out of range: {value}")
+    return amount
+
+def _validate_import_row(row, base_admission, default_fee):
+    """(student values, errors) for one CSV row; values is None when the row is rejected."""
+
+    errors = []
+    name = (row.get('name') or '').strip()
+    if not name:
+        errors.append("name is required")
+    phone = normalize_phone(row.get('phone'))
+    if not phone or len(phone) != 10:
+        errors.append(f"phone must be 10 digits: {row.get('phone')!r}")
+
+    dates = {}
+    for column in ('dob', 'admission_date'):
+        value = (row.get(column) or '').strip()
+        parsed = parse_bs(value) if value else None
+        if value and not parsed:
+            errors.append(f"{column} is not a valid BS date: {value!r}")
+        dates[column] = format_bs(*parsed) if parsed else None
+
+    fee_type = (row.get('admission_fee_type') or '').strip().capitalize() or 'Normal'
+    if fee_type not in ADMISSION_FEE_TYPES:
+        errors.append(f"admission_fee_type must be one of {', '.join(ADMISSION_FEE_TYPES)}: {fee_type!r}")
+    monthly_fee = _import_amount(row, 'monthly_fee', errors, default=default_fee)
+    discount = _import_amount(row, 'admission_discount_percent', errors, upper=100)
+    custom_admission = _import_amount(row, 'custom_admission_fee', errors)
+    if errors:
+        return None, errors
+
+    dob_parsed = parse_bs(dates['dob'])
+    return {
+        'name': name,
+        'phone': phone,
+        'phone_digits': phone,
+        'phone_digits_rev': phone[::-1],
+        'dob': dates['dob'],
+        'dob_month': dob_parsed[1] if dob_parsed else None,
+        'dob_day': dob_parsed[2] if dob_parsed else None,
+        'guardian_name': (row.get('guardian_name') or '').strip() or None,
+        'emergency_contact': (row.get('emergency_contact') or '').strip() or None,
+        'status': 'Active',
+        'custom_monthly_fee': monthly_fee,
+        'base_monthly_fee': monthly_fee,
+        'admission_fee_type': fee_type,
+        'admission_discount_percent': discount,
+        'custom_admission_fee': custom_admission,
+        'last_admission_date': dates['admission_date'],
+        'admission_charge': admission_fee(fee_type, discount, custom_admission, base_admission),
+    }, []
+
+def import_students(lines, dry_run=False, today_bs=None):
+    """
+    Imports students from CSV text lines (header row first, see IMPORT_COLUMNS).
+
+    Rows are validated as they stream in; a row is rejected for a bad phone, date, fee
+    type or amount, or when its normalized phone and name match an existing student or
+    an earlier row. Accepted students go in with one batched insert, then their
+    admission and pro-rata first-month fees with one batched ledger insert, in a single
+    transaction. dry_run validates and reports without writing.
+
+    Returns {'imported': [...], 'rejected': [{'row', 'name', 'errors'}], 'total_charged'}.
+    Raises ValueError when the header lacks the name or phone column.
+    """
+    import nepali_datetime
+    from database import Settings, LedgerTransaction, sync_student_balances, sync_monthly_summaries
+    from notifications import refresh_student_notifications
+    from routes.finance import calculate_prorata_fee
+
+    reader = csv.DictReader(lines)
+    header = [column.strip().lower() for column in (reader.fieldnames or [])]
+    if 'name' not in header or 'phone' not in header:
+        raise ValueError("The CSV needs at least 'name' and 'phone' columns.")
+    reader.fieldnames = header
+
+    today_bs = today_bs or nepali_datetime.date.today()
+    today_str = today_bs.strftime('%Y-%m-%d')
+    settings = Settings.query.first()
+    base_admission = settings.default_admission_fee if settings else 1000.0
+    default_fee = settings.default_monthly_fee if settings else 5000.0
+
+    accepted, rejected, seen = [], [], {}
+    for row_number, row in enumerate(reader, start=2): # Row 1 is the header
+        values, errors = _validate_import_row(row, base_admission, default_fee)
+        if values:
+            key = (values['phone'], values['name'].lower())
+            if key in seen:
+                errors = [f"duplicate of row {seen[key]}"]
+            else:
+                seen[key] = row_number
+                accepted.append((row_number, values))
+        if errors:
+            rejected.append({'row': row_number, 'name': (row.get('name') or '').strip(), 'errors': errors})
+
+    # Same phone and name as a student already on file (one indexed lookup per chunk)
+    phones = sorted({values['phone'] for _, values in accepted})
+    existing = set()
+    for i in range(0, len(phones), 500):
+        existing.update((digits, name.lower()) for digits, name in db.session.execute(
+            db.select(Student.phone_digits, Student.name).where(Student.phone_digits.in_(phones[i:i + 500]))
+        ))
+    kept = []
+    for row_number, values in accepted:
+        if (values['phone'], values['name'].lower()) in existing:
+            rejected.append({'row': row_number, 'name': values['name'], 'errors': ["already registered with this phone"]})
+        else:
+            kept.append(values)
+    rejected.sort(key=lambda r: r['row'])
+
+    imported, ledger_rows = [], []
+    for values in kept:
+        values['last_admission_date'] = values['last_admission_date'] or today_str
+        monthly_charge, suffix = calculate_prorata_fee(values['custom_monthly_fee'], values['last_admission_date'], today_bs)
+        imported.append({'name': values['name'], 'phone': values['phone'],
+                         'admission_fee': values['admission_charge'], 'monthly_fee': monthly_charge,
+                         'description': f"Monthly Fee (Enrollment) - {today_bs.strftime('%B')} {today_bs.year}{suffix}"})
+    result = {
+        'imported': imported,
+        'rejected': rejected,
+        'total_charged': sum(i['admission_fee'] + i['monthly_fee'] for i in imported),
+    }
+    if dry_run or not kept:
+        return result
+
+    student_ids = db.session.execute(
+        db.insert(Student).returning(Student.id, sort_by_parameter_order=True),
+        [{k: v for k, v in values.items() if k != 'admission_charge'} for values in kept]
+    ).scalars().all()
+
+    fee_row = {'credit': 0.0, 'date': today_str, 'date_ord': today_bs.toordinal(), 'txn_type': 'FEE', 'is_void': False}
+    for student_id, item in zip(student_ids, imported):
+        balance = 0.0
+        if item['admission_fee'] > 0:
+            balance += item['admission_fee']
+            ledger_rows.append(dict(fee_row, student_id=student_id, description="Admission Fee", debit=item['admission_fee'],
+                                    balance_after=balance, fee_kind='ADMISSION', period_year=None, period_month=None))
+        balance += item['monthly_fee']
+        ledger_rows.append(dict(fee_row, student_id=student_id, description=item['description'], debit=item['monthly_fee'],
+                                balance_after=balance, fee_kind='MONTHLY', period_year=today_bs.year, period_month=today_bs.month))
+    db.session.execute(db.insert(LedgerTransaction), ledger_rows)
+
+    # Bulk inserts skip the flush hooks, so refresh the materialized tables here
+    connection = db.session.connection()
+    sync_student_balances(connection, student_ids)
+    sync_monthly_summaries(connection, [today_bs.year * 100 + today_bs.month])
+    refresh_student_notifications(connection, student_ids)
+    db.session.commit()
+    return result
+
+@student_bp.route('/students/import', methods=['GET', 'POST'])
+@login_required
+@permission_required('can_manage_students')
+def import_csv():
+    report = dry_run = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash("Choose a CSV file to import.", "warning")
+            return redirect(url_for('students.import_csv'))
+        dry_run = request.form.get('dry_run') == 'yes'
+        try:
+            report = import_students(io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline=''), dry_run=dry_run)
+        except (ValueError, csv.Error) as e: # UnicodeDecodeError is a ValueError
+            flash(f"Could not read the CSV: {e}", "danger")
+            return redirect(url_for('students.import_csv'))
+        if not dry_run and report['imported']:
+            flash(f"Imported {len(report['imported'])} students and posted their first fees.", "success")
+    return render_template('students/import.html', report=report, dry_run=dry_run, columns=IMPORT_COLUMNS)
 
 @student_bp.route('/students/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -120,7 +389,7 @@ def edit(id):
             new_admission_date = None
         
         # 10-digit validation
-        clean_phone = ''.join(filter(str.isdigit, phone))
+        clean_phone = normalize_phone(phone) or ''
         if len(clean_phone) != 10:
             flash("Error: Phone number must be exactly 10 digits.", "warning")
             return redirect(url_for('students.edit', id=id))
@@ -169,16 +438,10 @@ def edit(id):
                 base_admission = settings.default_admission_fee if settings else 2000.0
                 
                 # Re-admission is 50% of what they would normally pay for admission
-                fee_to_charge = 0.0
-                if admission_type == 'Normal':
-                    fee_to_charge = base_admission * 0.5
-                elif admission_type == 'Percentage':
-                    fee_to_charge = (base_admission * (1 - admission_discount / 100)) * 0.5
-                elif admission_type == 'Fixed':
-                    fee_to_charge = admission_custom * 0.5
+                fee_to_charge = 0.5 * admission_fee(admission_type, admission_discount, admission_custom, base_admission)
                 
                 if fee_to_charge > 0:
-                    add_transaction(student.id, description="Re-admission Fee (50%)", debit=fee_to_charge, credit=0, txn_type='FEE')
+                    add_transaction(student.id, description="Re-admission Fee (50%)", debit=fee_to_charge, credit=0, txn_type='FEE', fee_kind='ADMISSION')
                     flash(f"Re-admission fee of Rs {fee_to_charge} charged.")
 
         dob = request.form.get('dob')
@@ -203,28 +466,144 @@ def edit(id):
         db.session.commit()
         flash('Student updated successfully!')
         return redirect(url_for('students.index'))
-    return render_template('students/form.html', student=student)
+    return render_template('students/form.html', student=student, fee_types=ADMISSION_FEE_TYPES)
 @student_bp.route('/students/delete/<int:id>')
 @login_required
 @admin_required
 def delete(id):
-    from database import Enrollment, Attendance, LedgerTransaction, WorkshopEnrollment, PackageEnrollment, ProductSale, ProgressReport
+    from database import Enrollment, Attendance, LedgerTransaction, WorkshopEnrollment, PackageEnrollment, ProductSale, ProgressReport, StudentBalance, AbsenceStreak, AttendanceMonth, Notification, NotificationDismissal, bs_period, sync_monthly_summaries
     student = Student.query.get_or_404(id)
     
+    # Months whose finance rollup loses this student's ledger rows
+    periods = {bs_period(d) for (d,) in db.session.query(LedgerTransaction.date).filter_by(student_id=id).distinct()}
+    
     # Cascade delete related records manually
     Enrollment.query.filter_by(student_id=id).delete()
     Attendance.query.filter_by(student_id=id).delete()
     LedgerTransaction.query.filter_by(student_id=id).delete()
+    StudentBalance.query.filter_by(student_id=id).delete()
+    AbsenceStreak.query.filter_by(student_id=id).delete()
+    AttendanceMonth.query.filter_by(student_id=id).delete()
+    notification_ids = db.session.query(Notification.id).filter_by(student_id=id)
+    NotificationDismissal.query.filter(NotificationDismissal.notification_id.in_(notification_ids.scalar_subquery())).delete(synchronize_session=False)
+    Notification.query.filter_by(student_id=id).delete()
     WorkshopEnrollment.query.filter_by(student_id=id).delete()
     PackageEnrollment.query.filter_by(student_id=id).delete()
     ProductSale.query.filter_by(student_id=id).delete()
     ProgressReport.query.filter_by(student_id=id).delete()
     
+    sync_monthly_summaries(db.session.connection(), periods)
+    
     db.session.delete(student)
     db.session.commit()
     flash(f'Student {student.name} and all related records deleted.')
     return redirect(url_for('students.index'))
 
+PROFILE_RECENT_TRANSACTIONS = 20
+
+def student_profile(student_id):
+    """
+    Everything about one student as plain data: classes with attendance, packages,
+    workshops, purchases, progress reports and recent ledger rows. Each relationship
+    is eager-loaded with its own SELECT ... IN, so the query count stays fixed however
+    much history the student has. Returns None for an unknown id.
+    """
+    from sqlalchemy.orm import joinedload, selectinload
+    from database import (ProgressReport, PackageEnrollment, WorkshopEnrollment, ProductSale,
+                          LedgerTransaction, AttendanceMonth)
+    from attendance_stats import summarize, attendance_streaks
+    from timetable import format_slot, DAY_NAMES
+
+    student = Student.query.options(
+        selectinload(Student.enrollments).joinedload(Enrollment.class_info).options(
+            joinedload(Class.instructor), selectinload(Class.sessions)),
+        selectinload(Student.progress_reports),
+        selectinload(Student.package_enrollments).joinedload(PackageEnrollment.package),
+        selectinload(Student.workshop_enrollments).joinedload(WorkshopEnrollment.workshop),
+        selectinload(Student.product_sales).joinedload(ProductSale.product),
+    ).filter_by(id=student_id).first()
+    if student is None:
+        return None
+
+    months_by_class = {}
+    for row in AttendanceMonth.query.filter_by(student_id=student_id):
+        months_by_class.setdefault(row.class_id, []).append(row)
+    transactions = (LedgerTransaction.query.filter_by(student_id=student_id)
+                    .order_by(LedgerTransaction.date_ord.desc(), LedgerTransaction.id.desc())
+                    .limit(PROFILE_RECENT_TRANSACTIONS).all())
+    today_ord = today_ordinal()
+
+    return {
+        'student': {
+            'id': student.id,
+            'name': student.name,
+            'phone': student.phone,
+            'status': student.status,
+            'dob': student.dob,
+            'guardian_name': student.guardian_name,
+            'emergency_contact': student.emergency_contact,
+            'photo_path': student.photo_path,
+            'monthly_fee': student.custom_monthly_fee,
+            'admission_fee_type': student.admission_fee_type,
+            'last_admission_date': student.last_admission_date,
+            'balance': student.get_balance(),
+        },
+        'attendance': summarize([row for rows in months_by_class.values() for row in rows]),
+        'classes': [{
+            'id': e.class_info.id,
+            'name': e.class_info.name,
+            'instructor': e.class_info.instructor.name if e.class_info.instructor else None,
+            'sessions': [f"{DAY_NAMES[s.weekday]} {format_slot(s)}" for s in e.class_info.sessions],
+            'enrolled_date': e.enrolled_date,
+            'attendance': summarize(months_by_class.get(e.class_id, [])),
+            'streaks': attendance_streaks(months_by_class.get(e.class_id, [])),
+        } for e in student.enrollments if e.class_info],
+        'packages': [{
+            'name': p.package.name,
+            'start_date': p.start_date,
+            'end_date': p.end_date,
+            'total_price': p.total_price,
+            'amount_paid': p.amount_paid,
+            'active': p.start_ord is not None and p.start_ord <= today_ord <= (p.end_ord or p.start_ord),
+        } for p in sorted(student.package_enrollments, key=lambda p: p.start_ord or 0, reverse=True)],
+        'workshops': [{
+            'name': w.workshop.name,
+            'date': w.date,
+            'fee': w.workshop.fee,
+            'amount_paid': w.amount_paid,
+        } for w in sorted(student.workshop_enrollments, key=lambda w: w.date_ord or 0, reverse=True)],
+        'purchases': [{
+            'product': sale.product.name,
+            'date': sale.date,
+            'quantity': sale.quantity,
+            'price_sold': sale.price_sold,
+        } for sale in sorted(student.product_sales, key=lambda sale: sale.date or '', reverse=True)],
+        'progress': [{
+            'date': r.date,
+            'rating': r.rating,
+            'note': r.note,
+            'instructor_name': r.instructor_name,
+        } for r in sorted(student.progress_reports, key=lambda r: r.date or '', reverse=True)],
+        'recent_transactions': [{
+            'id': t.id,
+            'date': t.date,
+            'description': t.description,
+            'debit': t.debit,
+            'credit': t.credit,
+            'balance_after': t.balance_after,
+            'is_void': t.is_void,
+        } for t in transactions],
+    }
+
+@student_bp.route('/students/<int:id>/profile')
+@login_required
+@permission_required('can_manage_students')
+def profile(id):
+    data = student_profile(id)
+    if data is None:
+        abort(404)
+    return render_template('students/profile.html', profile=data)
+
 @student_bp.route('/students/progress/<int:id>', methods=['GET', 'POST'])
 @login_required
 def progress(id):
@@ -258,7 +637,7 @@ def progress(id):
 @login_required
 @admin_required
 def delete_all():
-    from database import Enrollment, Attendance, LedgerTransaction, WorkshopEnrollment, PackageEnrollment, ProductSale, ProgressReport
+    from database import Enrollment, Attendance, LedgerTransaction, WorkshopEnrollment, PackageEnrollment, ProductSale, ProgressReport, StudentBalance, AbsenceStreak, AttendanceMonth, Notification, NotificationDismissal, sync_monthly_summaries
     
     # Get count for confirmation message
     student_count = Student.query.count()
@@ -267,6 +646,11 @@ def delete_all():
     Enrollment.query.delete()
     Attendance.query.delete()
     LedgerTransaction.query.delete()
+    StudentBalance.query.delete()
+    AbsenceStreak.query.delete()
+    AttendanceMonth.query.delete()
+    NotificationDismissal.query.delete()
+    Notification.query.delete()
     WorkshopEnrollment.query.delete()
     PackageEnrollment.query.delete()
     ProductSale.query.delete()
@@ -274,6 +658,7 @@ def delete_all():
     
     # Delete all students
     Student.query.delete()
+    sync_monthly_summaries(db.session.connection())
     
     db.session.commit()
     flash(f'Successfully deleted all {student_count} students and their related records.', 'success')
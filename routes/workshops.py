@@ -1,9 +1,10 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required
-from database import db, Workshop, WorkshopEnrollment, Student, LedgerTransaction
+from database import db, Workshop, WorkshopEnrollment, LedgerTransaction
 from routes.auth import admin_required, permission_required
-from routes.finance import add_transaction
+from routes.finance import add_transaction, monthly_fee_query, void_linked_transactions, linked_description
 import nepali_datetime
+from bs_calendar import parse_bs, iter_months
 
 workshops_bp = Blueprint('workshops', __name__)
 
@@ -11,7 +12,7 @@ workshops_bp = Blueprint('workshops', __name__)
 @login_required
 @permission_required('can_manage_workshops')
 def index():
-    workshops = Workshop.query.order_by(Workshop.start_date.desc()).all()
+    workshops = Workshop.query.order_by(Workshop.start_ord.desc(), Workshop.id.desc()).all()
     return render_template('workshops/index.html', workshops=workshops)
 
 @workshops_bp.route('/workshops/add', methods=['GET', 'POST'])
@@ -60,7 +61,6 @@ def edit(id):
 @permission_required('can_manage_workshops')
 def enroll(id):
     workshop = Workshop.query.get_or_404(id)
-    students = Student.query.filter_by(status='Active').all()
     
     if request.method == 'POST':
         student_id = request.form.get('student_id')
@@ -79,71 +79,48 @@ def enroll(id):
             date=today_bs
         )
         db.session.add(enrollment)
+        db.session.flush() # Need enrollment.id to link ledger rows
         
         # If it's a student, charge their ledger and record payment
         if student_id:
             # Charge full workshop fee
-            add_transaction(student_id, description=f"Workshop: {workshop.name}", debit=workshop.fee, credit=0, txn_type='FEE')
+            add_transaction(student_id, description=f"Workshop: {workshop.name}", debit=workshop.fee, credit=0, txn_type='FEE', fee_kind='WORKSHOP', workshop_enrollment_id=enrollment.id)
             # If they paid something, record as payment
             if amount_paid > 0:
-                add_transaction(student_id, description=f"Payment for Workshop: {workshop.name}", debit=0, credit=amount_paid, txn_type='PAYMENT')
+                add_transaction(student_id, description=f"Payment for Workshop: {workshop.name}", debit=0, credit=amount_paid, txn_type='PAYMENT', workshop_enrollment_id=enrollment.id)
             
             # --- Smart Monthly Fee Waiver Logic ---
             if request.form.get('skip_monthly') == 'yes':
-                try:
-                    # Parse start and end dates
-                    s_parts = [int(x) for x in workshop.start_date.split('-')]
-                    e_parts = [int(x) for x in workshop.end_date.split('-')]
-                    
-                    s_date = nepali_datetime.date(s_parts[0], s_parts[1], s_parts[2])
-                    e_date = nepali_datetime.date(e_parts[0], e_parts[1], e_parts[2])
-                    
-                    # Iterate through months from start to end
-                    # Simple iteration: Start at s_date, increment month until > e_date
-                    curr_date = nepali_datetime.date(s_date.year, s_date.month, 1)
-                    end_month_date = nepali_datetime.date(e_date.year, e_date.month, 1)
-                    
+                s_date = parse_bs(workshop.start_date)
+                e_date = parse_bs(workshop.end_date)
+                if s_date and e_date:
                     void_count = 0
+                    first_voided = None
                     
-                    while curr_date <= end_month_date:
-                        month_name = curr_date.strftime("%B")
-                        year = curr_date.year
-                        
-                        search_pattern = f"%Monthly Fee% - {month_name} {year}"
-                        
-                        overlapping_fees = LedgerTransaction.query.filter(
-                            LedgerTransaction.student_id == student_id,
-                            LedgerTransaction.description.like(search_pattern),
-                            LedgerTransaction.is_void == False,
-                            LedgerTransaction.txn_type == 'FEE'
+                    # Every month from the start month to the end month
+                    for year, month in iter_months(s_date[:2], e_date[:2]):
+                        overlapping_fees = monthly_fee_query(year, month).filter(
+                            LedgerTransaction.student_id == student_id
                         ).all()
                         
                         for fee in overlapping_fees:
                             fee.is_void = True
                             void_count += 1
-                        
-                        # Move to next month
-                        next_month = curr_date.month + 1
-                        next_year = curr_date.year
-                        if next_month > 12:
-                            next_month = 1
-                            next_year += 1
-                        curr_date = nepali_datetime.date(next_year, next_month, 1)
+                            if first_voided is None or (fee.date, fee.id) < first_voided:
+                                first_voided = (fee.date, fee.id)
                         
                     if void_count > 0:
                         from routes.finance import recalculate_balances
-                        recalculate_balances(student_id)
+                        recalculate_balances(student_id, *first_voided)
                         flash(f"Automatically waived {void_count} monthly fees for workshop duration.")
-                        
-                except Exception as e:
-                    print(f"Error in waiver logic: {e}")
+                else:
                     flash("Could not calculate fee waiver duration automatically.", "warning")
         
         db.session.commit()
         flash('Enrollment successful!')
         return redirect(url_for('workshops.view', id=id))
         
-    return render_template('workshops/enroll.html', workshop=workshop, students=students)
+    return render_template('workshops/enroll.html', workshop=workshop)
 
 @workshops_bp.route('/workshops/view/<int:id>')
 @login_required
@@ -174,26 +151,14 @@ def delete_enrollment(id):
     enrollment = WorkshopEnrollment.query.get_or_404(id)
     workshop_id = enrollment.workshop_id
     
-    # If it was a student, we should void the ledger transactions
+    # If it was a student, void the ledger transactions linked to this enrollment
     if enrollment.student_id:
-        from database import LedgerTransaction
-        # Find transactions related to this workshop for this student
-        # Looking for descriptions like "Workshop: [Name]" or "Payment for Workshop: [Name]"
-        search_term = f"%Workshop: {enrollment.workshop.name}%"
-        txns = LedgerTransaction.query.filter(
-            LedgerTransaction.student_id == enrollment.student_id,
-            LedgerTransaction.description.like(search_term),
-            LedgerTransaction.is_void == False
-        ).all()
-        
-        for txn in txns:
-            txn.is_void = True
+        void_linked_transactions(enrollment.ledger_entries, 'workshop enrollment', enrollment.id)
         
+    # Deleting the enrollment clears workshop_enrollment_id on its (now void) ledger rows
     db.session.delete(enrollment)
     db.session.commit()
     flash('Participant removed from workshop.')
-    db.session.commit()
-    flash('Participant removed from workshop.')
     return redirect(url_for('workshops.view', id=workshop_id))
 
 @workshops_bp.route('/workshops/delete-all', methods=['POST'])
@@ -207,8 +172,15 @@ def delete_all():
     # For now, we'll just delete the enrollment records. Ledger history remains (as "Workshop X") 
     # but the workshop object is gone. Ideally we should keep ledger integrity.
     
+    LedgerTransaction.query.filter(LedgerTransaction.workshop_enrollment_id != None).update({
+        'description': linked_description(LedgerTransaction.workshop_enrollment_id, 'workshop enrollment'),
+        'workshop_enrollment_id': None,
+    }, synchronize_session=False)
     WorkshopEnrollment.query.delete()
     Workshop.query.delete()
+    # Guest payments leave the monthly rollup
+    from database import sync_monthly_summaries
+    sync_monthly_summaries(db.session.connection())
     
     db.session.commit()
     flash(f'All {count} workshops and their enrollments have been deleted.', 'success')
@@ -0,0 +1,95 @@
+"""
+Global search over the FTS5 indexes in database.py (student_fts, class_fts, ledger_fts).
+
+Every word of a query is a prefix match ("ani sha" finds "Anita Sharma"). A query made
+only of digits and phone punctuation matches the normalized Student.phone_digits key by
+prefix, whatever spacing, dashes or +977 were used when the number was saved. Matches
+come back best-ranked first (bm25), except ledger rows, which come newest first so a
+common word like "fee" stops at the first few hits instead of scoring every row.
+
+lookup_students() is the front-desk typeahead: phone digits match the start or the end
+of the number through the Student.phone_digits / phone_digits_rev indexes.
+"""
+import re
+from sqlalchemy.orm import joinedload
+from database import db, Student, Class, LedgerTransaction, normalize_phone
+
+_WORD = re.compile(r'\w+')
+_PHONE_QUERY = re.compile(r'[\d\s+().-]*\d[\d\s+().-]*')
+
+def match_expression(query, phones=False):
+    """FTS5 MATCH string for raw user input, or None when nothing in it is searchable."""
+    if phones and _PHONE_QUERY.fullmatch(query):
+        return f'phone_digits : "{normalize_phone(query)}"*'
+    words = _WORD.findall(query)
+    return ' '.join(f'"{word}"*' for word in words) or None
+
+def _matching_ids(fts, query, limit=None, phones=False, newest_first=False):
+    expression = match_expression(query, phones)
+    if expression is None:
+        return []
+    sql = f"SELECT rowid FROM {fts} WHERE {fts} MATCH :q ORDER BY {'rowid DESC' if newest_first else 'rank'}"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    return db.session.execute(db.text(sql), {'q': expression}).scalars().all()
+
+def _matching_select(fts, query, phones=False):
+    """The FTS match as a SELECT of rowids, to embed as a subquery instead of a list of ids."""
+    expression = match_expression(query, phones)
+    select = db.select(db.table(fts, db.column('rowid')).c.rowid)
+    if expression is None:
+        return select.where(db.false())
+    return select.where(db.text(f"{fts} MATCH :q").bindparams(q=expression))
+
+def _load_in_order(model, ids, options=()):
+    if not ids:
+        return []
+    by_id = {obj.id: obj for obj in model.query.options(*options).filter(model.id.in_(ids))}
+    return [by_id[i] for i in ids if i in by_id]
+
+def matching_student_ids(query, limit=None):
+    """Ids of students whose name words start with the query words, or whose phone starts with its digits."""
+    return _matching_ids('student_fts', query, limit, phones=True)
+
+def matching_students(query):
+    """matching_student_ids() as a subquery, for filters like Student.id.in_(...)."""
+    return _matching_select('student_fts', query, phones=True)
+
+def search_students(query, limit=None):
+    return _load_in_order(Student, matching_student_ids(query, limit))
+
+def search_classes(query, limit=None):
+    return _load_in_order(Class, _matching_ids('class_fts', query, limit))
+
+def search_transactions(query, limit=None):
+    """Ledger rows whose description matches, newest first."""
+    ids = _matching_ids('ledger_fts', query, limit, newest_first=True)
+    return _load_in_order(LedgerTransaction, ids, [joinedload(LedgerTransaction.student)])
+
+def _prefix_range(column, prefix):
+    # column >= 'abc' AND column < 'abd': an index range seek, unlike LIKE on a BINARY column
+    return db.and_(column >= prefix, column < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+def lookup_students(query, limit=10):
+    """
+    Typeahead matches: by phone start or end when the query is a number (3+ digits),
+    otherwise by name word prefix. Returns (id, name, phone, status) rows, names A-Z.
+    """
+    query = query.strip()
+    if len(query) < 2:
+        return []
+    if _PHONE_QUERY.fullmatch(query):
+        digits = normalize_phone(query)
+        if not digits or len(digits) < 3:
+            return []
+        matches = db.or_(_prefix_range(Student.phone_digits, digits),
+                         _prefix_range(Student.phone_digits_rev, digits[::-1]))
+    else:
+        ids = _matching_ids('student_fts', query, limit)
+        if not ids:
+            return []
+        matches = Student.id.in_(ids)
+    return db.session.execute(
+        db.select(Student.id, Student.name, Student.phone, Student.status)
+        .where(matches).order_by(Student.name).limit(limit)
+    ).all()
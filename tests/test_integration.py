@@ -1,7 +1,8 @@
+import io
 from tests.test_base import BaseTestCase
 from database import db, Student, LedgerTransaction
 from app import app
-from routes.finance import recalculate_balances
+from routes.finance import recalculate_balances, recalculate_balances_bulk
 
 class IntegrationTestCase(BaseTestCase):
     def test_recalculate_balances_integration(self):
@@ -34,6 +35,87 @@ class IntegrationTestCase(BaseTestCase):
             self.assertEqual(re_t2.balance_after, 2000.0)
             self.assertEqual(s.get_balance(), 2000.0)
 
+    def test_suffix_recalculation_keeps_prefix(self):
+        """Integration Test: Recalculating from a position leaves earlier rows untouched"""
+        with app.app_context():
+            s = Student(name="Suffix Student", phone="9811111112")
+            db.session.add(s)
+            db.session.commit()
+
+            rows = [
+                LedgerTransaction(student_id=s.id, date="2081-01-01", description="Fee 1", debit=1000.0, balance_after=1000.0),
+                LedgerTransaction(student_id=s.id, date="2081-02-01", description="Fee 2", debit=2000.0, balance_after=3000.0),
+                LedgerTransaction(student_id=s.id, date="2081-03-01", description="Payment", credit=500.0, balance_after=2500.0),
+            ]
+            db.session.add_all(rows)
+            db.session.commit()
+
+            # Corrupt the prefix so a full rewrite would be detectable
+            rows[0].balance_after = 999.0
+            rows[1].is_void = True
+            db.session.commit()
+
+            recalculate_balances(s.id, rows[1].date, rows[1].id)
+
+            balances = [t.balance_after for t in LedgerTransaction.query.filter_by(student_id=s.id).order_by(LedgerTransaction.id)]
+            self.assertEqual(balances, [999.0, 999.0, 499.0])
+            self.assertEqual(s.get_balance(), 499.0)
+
+            recalculate_balances_bulk([s.id])
+            balances = [t.balance_after for t in LedgerTransaction.query.filter_by(student_id=s.id).order_by(LedgerTransaction.id)]
+            self.assertEqual(balances, [1000.0, 1000.0, 500.0])
+            self.assertEqual(s.get_balance(), 500.0)
+
+            rows[2].balance_after = 0.0
+            db.session.commit()
+            student_id, payment_id = s.id, rows[2].id
+
+        # The admin recalculate route rebuilds every ledger through the bulk variant
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+        self.app.post('/finance/recalculate')
+        with app.app_context():
+            self.assertEqual(db.session.get(LedgerTransaction, payment_id).balance_after, 500.0)
+            self.assertEqual(db.session.get(Student, student_id).get_balance(), 500.0)
+
+    def test_linked_rows_voided_with_enrollment(self):
+        """Integration Test: Only rows linked to the removed enrollment are voided"""
+        from database import Workshop, WorkshopEnrollment
+        from routes.finance import add_transaction, void_linked_transactions
+        with app.app_context():
+            s = Student(name="Linked Student", phone="9811111113")
+            workshop = Workshop(name="Hip Hop", start_date="2081-01-01", end_date="2081-01-05", fee=1500.0)
+            db.session.add_all([s, workshop])
+            db.session.commit()
+
+            first = WorkshopEnrollment(workshop_id=workshop.id, student_id=s.id)
+            second = WorkshopEnrollment(workshop_id=workshop.id, student_id=s.id)
+            db.session.add_all([first, second])
+            db.session.flush()
+            add_transaction(s.id, description="Workshop: Hip Hop", debit=1500.0, workshop_enrollment_id=first.id)
+            add_transaction(s.id, description="Workshop: Hip Hop", debit=1500.0, workshop_enrollment_id=second.id)
+
+            void_linked_transactions(second.ledger_entries)
+
+            self.assertFalse(first.ledger_entries[0].is_void)
+            self.assertTrue(second.ledger_entries[0].is_void)
+            self.assertEqual(s.get_balance(), 1500.0)
+
+            # Deleting the enrollment unlinks its voided row and notes the removal, so an
+            # enrollment that reuses the freed id does not inherit it
+            second_id, voided_id = second.id, second.ledger_entries[0].id
+            void_linked_transactions(second.ledger_entries, 'workshop enrollment', second_id)
+            db.session.delete(second)
+            db.session.commit()
+            voided = db.session.get(LedgerTransaction, voided_id)
+            self.assertIsNone(voided.workshop_enrollment_id)
+            self.assertEqual(voided.description, f"Workshop: Hip Hop [workshop enrollment #{second_id} removed]")
+            third = WorkshopEnrollment(workshop_id=workshop.id, student_id=s.id)
+            db.session.add(third)
+            db.session.commit()
+            self.assertEqual(third.id, second_id)
+            self.assertEqual(third.ledger_entries, [])
+
     def test_payment_and_auto_billing_flow(self):
         """Integration Test: Simulating adding a student and their first fee"""
         # This tests the interaction between Student creation and Ledger
@@ -50,3 +132,500 @@ class IntegrationTestCase(BaseTestCase):
             
             self.assertEqual(LedgerTransaction.query.filter_by(student_id=s.id).count(), 1)
             self.assertEqual(s.get_balance(), 5000.0)
+
+    def test_bulk_monthly_billing(self):
+        """Integration Test: Batch billing skips billed and package students"""
+        import nepali_datetime
+        from database import Package, PackageEnrollment
+        from routes.finance import add_transaction, bill_monthly_fees
+        with app.app_context():
+            today_bs = nepali_datetime.date.today()
+            today_str = today_bs.strftime('%Y-%m-%d')
+            fresh = Student(name="Fresh", phone="9833333331", custom_monthly_fee=3000.0)
+            billed = Student(name="Billed", phone="9833333332", custom_monthly_fee=3000.0)
+            packaged = Student(name="Packaged", phone="9833333333", custom_monthly_fee=3000.0)
+            package = Package(name="Quarter", duration_months=3, price=8000.0)
+            db.session.add_all([fresh, billed, packaged, package])
+            db.session.commit()
+
+            add_transaction(fresh.id, description="Admission Fee", debit=1000.0)
+            add_transaction(billed.id, description=f"Monthly Fee - {today_bs.strftime('%B')} {today_bs.year}", debit=3000.0,
+                            fee_kind='MONTHLY', period=(today_bs.year, today_bs.month))
+            db.session.add(PackageEnrollment(package_id=package.id, student_id=packaged.id, start_date=today_str, end_date=today_str, total_price=8000.0))
+            db.session.commit()
+
+            summary = bill_monthly_fees(today_bs)
+
+            self.assertEqual([b['student_id'] for b in summary['billed']], [fresh.id])
+            reasons = {s['student_id']: s['reason'] for s in summary['skipped']}
+            self.assertEqual(reasons, {billed.id: 'Already billed', packaged.id: 'Active package'})
+            self.assertEqual(fresh.get_balance(), 4000.0)
+            self.assertEqual(billed.get_balance(), 3000.0)
+
+            # Running again bills nobody
+            self.assertEqual(bill_monthly_fees(today_bs)['billed'], [])
+
+    def test_absence_streaks_follow_attendance(self):
+        """Integration Test: Absence streaks track trailing absents overall and per class and drive the absence alert"""
+        from database import Attendance, AbsenceStreak, Class, Notification, Settings
+        from notifications import refresh_student_notifications
+        with app.app_context():
+            s = Student(name="Absentee", phone="9844444441")
+            jazz, hiphop = Class(name="Jazz"), Class(name="Hip Hop")
+            db.session.add_all([s, jazz, hiphop])
+            db.session.commit()
+
+            db.session.add_all([
+                Attendance(student_id=s.id, class_id=jazz.id, date="2081-04-01", status="Present"),
+                Attendance(student_id=s.id, class_id=jazz.id, date="2081-04-03", status="Absent"),
+                Attendance(student_id=s.id, class_id=hiphop.id, date="2081-04-04", status="Absent"),
+                Attendance(student_id=s.id, class_id=jazz.id, date="2081-04-05", status="Absent"),
+            ])
+            db.session.commit()
+
+            overall = AbsenceStreak.query.filter_by(student_id=s.id, class_id=None).one()
+            self.assertEqual((overall.streak, overall.last_class_id), (3, jazz.id))
+            self.assertEqual(AbsenceStreak.query.filter_by(student_id=s.id, class_id=jazz.id).one().streak, 2)
+
+            # The streak meets the default threshold of 3, so the feed flags the student
+            alert = Notification.query.filter_by(kind='absence', student_id=s.id).one()
+            self.assertEqual((alert.active, alert.value, alert.ref_id), (True, 3, jazz.id))
+            db.session.add(Settings(absence_alert_threshold=4))
+            db.session.commit()
+            refresh_student_notifications(db.session.connection(), [s.id])
+            db.session.commit()
+            self.assertFalse(db.session.get(Notification, alert.id).active)
+
+            # Marking the latest class Present clears the overall and per-class streak
+            latest = Attendance.query.filter_by(student_id=s.id, date="2081-04-05").one()
+            latest.status = "Present"
+            db.session.commit()
+            self.assertIsNone(AbsenceStreak.query.filter_by(student_id=s.id, class_id=None).first())
+            self.assertEqual(AbsenceStreak.query.filter_by(student_id=s.id, class_id=hiphop.id).one().streak, 1)
+
+            # Deleting every class clears the streaks and retires their alerts in the same commit
+            db.session.get(Settings, 1).absence_alert_threshold = 1
+            db.session.add(Attendance(student_id=s.id, class_id=jazz.id, date="2081-04-06", status="Absent"))
+            db.session.commit()
+            self.assertTrue(db.session.get(Notification, alert.id).active)
+            alert_id = alert.id
+
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+        self.app.post('/classes/delete-all')
+        with app.app_context():
+            self.assertEqual(AbsenceStreak.query.count(), 0)
+            self.assertFalse(db.session.get(Notification, alert_id).active)
+
+    def test_notification_feed_generation_and_dismissal(self):
+        """Integration Test: Daily pass is idempotent, hooks track dues, dismissals are per user"""
+        from database import Notification, User
+        from bs_calendar import to_ordinal
+        from routes.finance import add_transaction
+        from notifications import generate_notifications, active_notifications, dismiss
+        with app.app_context():
+            today = to_ordinal("2081-04-10")
+            s = Student(name="Feed Student", phone="9866666661", dob="2070-04-10", last_admission_date="2080-04-01")
+            db.session.add(s)
+            db.session.commit()
+            generate_notifications(today)
+            generate_notifications(today)
+            kinds = sorted(n.kind for n in active_notifications())
+            self.assertEqual(kinds, ['admission_renewal', 'birthday'])
+
+            # Ledger writes raise and clear the due notification in the same transaction
+            add_transaction(s.id, description="Package", debit=8000.0)
+            db.session.commit()
+            due = Notification.query.filter_by(kind='due', student_id=s.id).one()
+            self.assertTrue(due.active)
+            self.assertEqual(due.message, "Feed Student owes Rs 8,000")
+
+            staff = User(username='feed_staff', role='Staff', can_view_finance=False, password_hash='x')
+            db.session.add(staff)
+            db.session.commit()
+            self.assertEqual([n.kind for n in active_notifications(user_id=staff.id, include_finance=False)], ['birthday'])
+
+            dismiss(due.id, self.admin_id)
+            self.assertNotIn(due.id, [n.id for n in active_notifications(user_id=self.admin_id)])
+
+            # Paying off clears it; owing again re-raises it without the old dismissal
+            add_transaction(s.id, description="Payment", credit=8000.0, txn_type='PAYMENT')
+            db.session.commit()
+            self.assertFalse(Notification.query.get(due.id).active)
+            add_transaction(s.id, description="Package", debit=9000.0)
+            db.session.commit()
+            self.assertIn(due.id, [n.id for n in active_notifications(user_id=self.admin_id)])
+
+    def test_class_timetable_sessions(self):
+        """Integration Test: Class form syncs sessions; today's schedule and conflicts query them"""
+        from database import Class, ClassSession, Instructor
+        from timetable import sessions_on, weekly_grid, find_conflicts, sync_sessions
+        with app.app_context():
+            inst = Instructor(name="Asha", phone="9800000020")
+            db.session.add(inst)
+            db.session.commit()
+            inst_id = inst.id
+
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+        self.app.post('/classes/add', data={'name': 'Jazz A', 'instructor_id': inst_id, 'room': 'Studio 1',
+                                            'schedule': 'Sun, Mon 18:00 - 19:30 | Starts 2081-04-01'})
+        response = self.app.post('/classes/add', data={'name': 'Salsa', 'instructor_id': inst_id,
+                                                       'schedule': 'Mon 19:00 - 20:00'}, follow_redirects=True)
+        self.assertIn(b'Schedule conflict on Mon', response.data)
+
+        with app.app_context():
+            monday = sessions_on(0)
+            self.assertEqual([(s.class_info.name, s.start_time) for s in monday], [("Jazz A", "18:00"), ("Salsa", "19:00")])
+            self.assertEqual(monday[0].room, "Studio 1")
+            self.assertEqual([s.class_info.name for _, day in weekly_grid(inst_id) for s in day],
+                             ["Jazz A", "Jazz A", "Salsa"])
+
+            jazz = Class.query.filter_by(name="Jazz A").first()
+            self.assertEqual(len(find_conflicts(jazz)), 1)
+            jazz_id = jazz.id
+
+        self.app.post(f'/classes/edit/{jazz_id}', data={'name': 'Jazz A', 'instructor_id': inst_id,
+                                                        'schedule': 'Wed 6PM'})
+        with app.app_context():
+            self.assertEqual([(s.weekday, s.start_time, s.room) for s in ClassSession.query.filter_by(class_id=jazz_id)],
+                             [(2, "18:00", None)])
+            response = self.app.get('/classes/timetable')
+            self.assertEqual(response.status_code, 200)
+
+        # A schedule without weekdays yields no sessions, but the room stays on the class
+        self.app.post(f'/classes/edit/{jazz_id}', data={'name': 'Jazz A', 'instructor_id': inst_id,
+                                                        'schedule': 'By appointment', 'room': 'Studio 2'})
+        with app.app_context():
+            jazz = db.session.get(Class, jazz_id)
+            self.assertEqual((jazz.room, jazz.sessions), ("Studio 2", []))
+            jazz.schedule = "Fri 17:00 - 18:00"
+            sync_sessions(jazz)
+            self.assertEqual([s.room for s in jazz.sessions], ["Studio 2"])
+
+    def test_attendance_roster_upsert(self):
+        """Integration Test: Roster saves upsert one row per student/class/day and refresh streaks"""
+        from database import Attendance, AbsenceStreak, AttendanceMonth, Class, Enrollment
+        with app.app_context():
+            a, b, outsider = (Student(name="Roster A", phone="9811111101"), Student(name="Roster B", phone="9811111102"),
+                              Student(name="Outsider", phone="9811111103"))
+            jazz, salsa = Class(name="Jazz"), Class(name="Salsa")
+            db.session.add_all([a, b, outsider, jazz, salsa])
+            db.session.commit()
+            db.session.add_all([Enrollment(student_id=a.id, class_id=jazz.id), Enrollment(student_id=b.id, class_id=jazz.id),
+                                Enrollment(student_id=a.id, class_id=salsa.id)])
+            db.session.commit()
+            ids = dict(a=a.id, b=b.id, outsider=outsider.id, jazz=jazz.id, salsa=salsa.id)
+
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+        self.app.post('/attendance/mark', data={'class_id': ids['jazz'], 'date': '2081-04-01',
+                                                f"status_{ids['a']}": 'Absent', f"status_{ids['b']}": 'Present',
+                                                f"remarks_{ids['b']}": 'On time'})
+        response = self.app.post('/api/attendance', json={'rosters': [
+            {'class_id': ids['jazz'], 'date': '2081-4-1', 'records': [
+                {'student_id': ids['a'], 'status': 'Absent'},
+                {'student_id': ids['b'], 'status': 'Late', 'remarks': 'Bus'},
+                {'student_id': ids['outsider'], 'status': 'Present'},
+            ]},
+            {'class_id': ids['salsa'], 'date': '2081-04-02', 'records': [{'student_id': ids['a'], 'status': 'Absent'}]},
+        ]})
+        self.assertEqual(response.get_json(), {'saved': 2, 'unchanged': 1, 'skipped': 1})
+
+        with app.app_context():
+            rows = Attendance.query.filter_by(class_id=ids['jazz']).order_by(Attendance.student_id).all()
+            self.assertEqual([(r.status, r.remarks, r.date) for r in rows],
+                             [('Absent', '', '2081-04-01'), ('Late', 'Bus', '2081-04-01')])
+            self.assertEqual(AbsenceStreak.query.filter_by(student_id=ids['a'], class_id=None).one().streak, 2)
+            month = AttendanceMonth.query.filter_by(student_id=ids['b'], class_id=ids['jazz'], period=208104).one()
+            self.assertEqual((month.present_mask, month.late_mask), (0, 1))
+
+        # A bad roster rejects the whole batch
+        response = self.app.post('/api/attendance', json={'rosters': [
+            {'class_id': ids['salsa'], 'date': '2081-04-03', 'records': [{'student_id': ids['a'], 'status': 'Present'}]},
+            {'class_id': ids['jazz'], 'date': '2081-04-03', 'records': [{'student_id': ids['a'], 'status': 'Here'}]},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        with app.app_context():
+            self.assertEqual(Attendance.query.filter_by(date='2081-04-03').count(), 0)
+
+    def test_full_text_search(self):
+        """Integration Test: FTS5 index follows inserts, updates and deletes and matches prefixes and phone digits"""
+        from database import Class
+        with app.app_context():
+            anita = Student(name="Anita Sharma", phone="980-111 2233")
+            anil = Student(name="Anil Thapa", phone="9812223344")
+            bina = Student(name="Bina Rai", phone="+977-9851234567")
+            db.session.add_all([anita, anil, bina, Class(name="Contemporary Batch")])
+            db.session.commit()
+            db.session.add_all([
+                LedgerTransaction(student_id=anita.id, description="Monthly Fee (Baisakh)", debit=5000.0, balance_after=5000.0),
+                LedgerTransaction(student_id=anita.id, description="Payment Received", credit=5000.0, balance_after=0.0),
+            ])
+            anil.name = "Anil Gurung"
+            db.session.commit()
+            anita_id = anita.id
+
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+
+        def titles(q):
+            return [r['title'] for r in self.app.get(f'/api/search?q={q}').get_json()['results']]
+
+        self.assertEqual(titles('ani sha'), ['Anita Sharma'])
+        self.assertEqual(titles('98011'), ['Anita Sharma'])
+        self.assertEqual(titles('980 111-22'), ['Anita Sharma'])
+        self.assertEqual(titles('9851'), ['Bina Rai'])
+        self.assertEqual(titles('gurung'), ['Anil Gurung'])
+        self.assertEqual(titles('thapa'), [])
+        self.assertEqual(titles('contemp'), ['Contemporary Batch'])
+        self.assertEqual(len(titles('fee')), 1)
+        self.assertEqual(titles('"*'), [])
+
+        response = self.app.get('/students?search=ani')
+        self.assertIn(b'Anita Sharma', response.data)
+        self.assertIn(b'Anil Gurung', response.data)
+
+        with app.app_context():
+            db.session.delete(db.session.get(Student, anita_id))
+            db.session.commit()
+        self.assertEqual(titles('anita'), [])
+        self.assertEqual(titles('payment'), [])
+
+    def test_student_phone_lookup(self):
+        """Integration Test: Phones are normalized on save and the lookup matches phone start, end and name"""
+        with app.app_context():
+            db.session.add_all([
+                Student(name="Bina Rai", phone="+977 980-123 4567"),
+                Student(name="Bikash Rai", phone="9841234999"),
+            ])
+            db.session.commit()
+            self.assertEqual(Student.query.filter_by(name="Bina Rai").one().phone_digits, "9801234567")
+
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+
+        def names(q):
+            return [r['name'] for r in self.app.get(f'/api/students/lookup?q={q}').get_json()['results']]
+
+        self.assertEqual(names('980'), ['Bina Rai'])
+        self.assertEqual(names('4567'), ['Bina Rai'])
+        self.assertEqual(names('98-41'), ['Bikash Rai'])
+        self.assertEqual(names('bi'), ['Bikash Rai', 'Bina Rai'])
+        self.assertEqual(names('7'), [])
+
+        # Invalid phone is rejected before the student is created or charged
+        self.app.post('/students/add', data={'name': 'Bad Phone', 'phone': '12345', 'custom_monthly_fee': '5000'})
+        with app.app_context():
+            self.assertIsNone(Student.query.filter_by(name='Bad Phone').first())
+            self.assertEqual(LedgerTransaction.query.count(), 0)
+
+    def test_student_list_keyset_pages(self):
+        """Integration Test: Student list pages by (name, id) cursor with status, class and balance filters in SQL"""
+        from database import Class, Enrollment
+        from routes.students import student_page, decode_cursor
+        with app.app_context():
+            students = [Student(name=n, phone=f"98000000{i:02d}", status='Inactive' if n == 'Dev' else 'Active')
+                        for i, n in enumerate(['Asha', 'Bibek', 'Chandra', 'Dev', 'Asha'])]
+            ballet = Class(name="Ballet")
+            db.session.add_all(students + [ballet])
+            db.session.commit()
+            db.session.add_all([
+                Enrollment(student_id=students[1].id, class_id=ballet.id),
+                LedgerTransaction(student_id=students[2].id, description="Monthly Fee", debit=3000.0, balance_after=3000.0),
+            ])
+            db.session.commit()
+
+            rows, total, next_cursor, prev_cursor = student_page(per_page=2)
+            self.assertEqual(([r.name for r in rows], total, prev_cursor), (['Asha', 'Asha'], 5, None))
+            rows, _, next_cursor, prev_cursor = student_page(after=decode_cursor(next_cursor), per_page=2)
+            self.assertEqual([r.name for r in rows], ['Bibek', 'Chandra'])
+            self.assertEqual(rows[1].balance, 3000.0)
+            rows, _, _, _ = student_page(before=decode_cursor(prev_cursor), per_page=2)
+            self.assertEqual([r.name for r in rows], ['Asha', 'Asha'])
+
+            self.assertEqual([r.name for r in student_page(status='Inactive')[0]], ['Dev'])
+            self.assertEqual([r.name for r in student_page(class_id=ballet.id)[0]], ['Bibek'])
+            self.assertEqual([r.name for r in student_page(min_balance=1)[0]], ['Chandra'])
+
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+        response = self.app.get('/students?status=Active&max_balance=0')
+        self.assertIn(b'Total: 3', response.data)
+        self.assertNotIn(b'Chandra', response.data)
+
+    def test_student_picker_api(self):
+        """Integration Test: Student picker pages a cached roster of active students and sees new students after commit"""
+        with app.app_context():
+            db.session.add_all([Student(name=f"Picker {i:02d}", phone=f"98100000{i:02d}") for i in range(5)]
+                               + [Student(name="Picker Gone", phone="9810000099", status='Inactive')])
+            db.session.commit()
+
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+
+        data = self.app.get('/api/students/picker?q=picker&per_page=3').get_json()
+        self.assertEqual([s['name'] for s in data['results']], ['Picker 00', 'Picker 01', 'Picker 02'])
+        self.assertTrue(data['has_more'])
+        data = self.app.get('/api/students/picker?q=picker&per_page=3&page=2').get_json()
+        self.assertEqual(([s['name'] for s in data['results']], data['has_more']), (['Picker 03', 'Picker 04'], False))
+        self.assertEqual([s['name'] for s in self.app.get('/api/students/picker?q=981-000 0003').get_json()['results']],
+                         ['Picker 03'])
+
+        version = data['version']
+        with app.app_context():
+            db.session.add(Student(name="Picker New", phone="9810000050"))
+            db.session.commit()
+        data = self.app.get('/api/students/picker?q=new').get_json()
+        self.assertEqual([s['name'] for s in data['results']], ['Picker New'])
+        self.assertGreater(data['version'], version)
+
+        # Forms no longer embed the roster
+        self.assertNotIn(b'Picker 00', self.app.get('/classes').data)
+
+    def test_student_csv_import(self):
+        """Integration Test: CSV import rejects bad and duplicate rows, dry run writes nothing, real run posts fees"""
+        import nepali_datetime
+        from routes.students import import_students
+        today = nepali_datetime.date(2081, 5, 11)
+        csv_text = (
+            "Name,Phone,DOB,Monthly_Fee,Admission_Fee_Type,Custom_Admission_Fee,Admission_Date\n"
+            "Kabita Rai,980-111-2222,2070-01-15,3000,Fixed,500,2081-05-01\n"
+            "Nabin Lama,9801113333,,,Scholarship,,2081-04-10\n"
+            "Bad Phone,12345,,,,,\n"
+            "Bad Date,9801114444,2070-13-01,,Normal,,\n"
+            "Bad Type,9801115555,,,Free,,\n"
+            "kabita rai,9801112222,,,,,\n"
+            "Existing,9809999999,,,,,\n"
+        )
+        with app.app_context():
+            db.session.add(Student(name="Existing", phone="9809999999"))
+            db.session.commit()
+
+            report = import_students(csv_text.splitlines(), dry_run=True, today_bs=today)
+            self.assertEqual([r['row'] for r in report['rejected']], [4, 5, 6, 7, 8])
+            self.assertIn("duplicate of row 2", report['rejected'][3]['errors'])
+            self.assertEqual(Student.query.count(), 1)
+
+            report = import_students(csv_text.splitlines(), today_bs=today)
+            self.assertEqual([i['name'] for i in report['imported']], ['Kabita Rai', 'Nabin Lama'])
+            kabita = Student.query.filter_by(name="Kabita Rai").one()
+            self.assertEqual((kabita.phone, kabita.dob_month, kabita.get_balance()), ('9801112222', 1, 3500.0))
+            fees = [(t.fee_kind, t.debit) for t in LedgerTransaction.query.filter_by(student_id=kabita.id).order_by(LedgerTransaction.id)]
+            self.assertEqual(fees, [('ADMISSION', 500.0), ('MONTHLY', 3000.0)])
+            nabin = Student.query.filter_by(name="Nabin Lama").one()
+            self.assertEqual(nabin.get_balance(), 5000.0) # Scholarship, joined last month
+
+            # Re-importing the same file adds nobody
+            self.assertEqual(import_students(csv_text.splitlines(), today_bs=today)['imported'], [])
+
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+        response = self.app.post('/students/import', data={'dry_run': 'yes', 'file': (io.BytesIO(csv_text.encode()), 'students.csv')},
+                                 content_type='multipart/form-data')
+        self.assertIn(b'7 rejected', response.data) # Everything is on file by now
+
+    def test_admission_renewal_fee_types(self):
+        """Integration Test: Admissions and renewals charge the admission fee for each fee type, tolerating a missing discount"""
+        with app.app_context():
+            students = [Student(name=name, phone=f"98222222{i:02d}", last_admission_date="2079-01-01",
+                                admission_fee_type=fee_type, admission_discount_percent=discount,
+                                custom_admission_fee=custom)
+                        for i, (name, fee_type, discount, custom) in enumerate([
+                            ("Renew Normal", 'Normal', 0.0, 0.0), ("Renew Half", 'Percentage', 50.0, 0.0),
+                            ("Renew Unset", 'Percentage', None, 0.0), ("Renew Fixed", 'Fixed', 0.0, 300.0),
+                            ("Renew Free", 'Scholarship', 0.0, 0.0)])]
+            db.session.add_all(students)
+            db.session.commit()
+
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+        self.app.post('/finance/renew-admission')
+
+        with app.app_context():
+            charged = dict(db.session.query(Student.name, LedgerTransaction.debit).join(LedgerTransaction)
+                           .filter(LedgerTransaction.fee_kind == 'ADMISSION'))
+            self.assertEqual(charged, {"Renew Normal": 1000.0, "Renew Half": 500.0,
+                                       "Renew Unset": 1000.0, "Renew Fixed": 300.0})
+
+        # New admissions from the student form are priced by the same rule
+        for name, fee_type, custom in [("Form Normal", 'Normal', '750'), ("Form Fixed", 'Fixed', '750')]:
+            self.app.post('/students/add', data={'name': name, 'phone': '9822223333', 'custom_monthly_fee': '5000',
+                                                 'admission_fee_type': fee_type, 'custom_admission_fee': custom})
+        with app.app_context():
+            admissions = dict(db.session.query(Student.name, LedgerTransaction.debit).join(LedgerTransaction)
+                              .filter(LedgerTransaction.description == "Admission Fee"))
+            self.assertEqual(admissions, {"Form Normal": 1000.0, "Form Fixed": 750.0})
+
+    def test_student_profile_query_count(self):
+        """Integration Test: Student profile loads in the same number of queries however much history there is"""
+        from sqlalchemy import event
+        from database import (Class, Enrollment, Attendance, ProgressReport, Package, PackageEnrollment,
+                              Workshop, WorkshopEnrollment, Product, ProductSale)
+        from routes.students import student_profile
+        from timetable import sync_sessions
+
+        def add_history(student, n):
+            for i in range(n):
+                cls = Class(name=f"Class {student.name} {i}", schedule="Mon 5-6PM")
+                package = Package(name=f"Package {i}", duration_months=1, price=3000.0)
+                workshop = Workshop(name=f"Workshop {i}", start_date="2081-05-01", end_date="2081-05-02", fee=1000.0)
+                product = Product(name=f"Shoes {i}", price=800.0, stock=5)
+                db.session.add_all([cls, package, workshop, product])
+                db.session.flush()
+                db.session.add_all([
+                    Enrollment(student_id=student.id, class_id=cls.id),
+                    Attendance(student_id=student.id, class_id=cls.id, date=f"2081-05-{i + 1:02d}", status="Present"),
+                    ProgressReport(student_id=student.id, rating=4, date=f"2081-05-{i + 1:02d}"),
+                    PackageEnrollment(student_id=student.id, package_id=package.id, start_date="2081-05-01",
+                                      end_date="2081-05-30", total_price=3000.0),
+                    WorkshopEnrollment(student_id=student.id, workshop_id=workshop.id, date="2081-05-01", amount_paid=500.0),
+                    ProductSale(student_id=student.id, product_id=product.id, price_sold=800.0),
+                    LedgerTransaction(student_id=student.id, description=f"Fee {i}", debit=100.0, balance_after=100.0 * (i + 1)),
+                ])
+            db.session.commit()
+
+        with app.app_context():
+            small, large = Student(name="Small", phone="9800000001"), Student(name="Large", phone="9800000002")
+            db.session.add_all([small, large])
+            db.session.commit()
+            add_history(small, 1)
+            add_history(large, 6)
+            for cls in Class.query.all():
+                sync_sessions(cls)
+            db.session.commit()
+            small_id, large_id = small.id, large.id
+
+            counts = []
+            for student_id in (small_id, large_id):
+                db.session.expunge_all()
+                statements = []
+                listener = lambda *args: statements.append(args[2])
+                event.listen(db.engine, 'before_cursor_execute', listener)
+                try:
+                    profile = student_profile(student_id)
+                finally:
+                    event.remove(db.engine, 'before_cursor_execute', listener)
+                counts.append(len(statements))
+
+            self.assertEqual(counts[0], counts[1])
+            self.assertLessEqual(counts[1], 10)
+            self.assertEqual(len(profile['classes']), 6)
+            self.assertEqual(profile['classes'][0]['sessions'], ['Mon 17:00 - 18:00'])
+            self.assertEqual(profile['attendance']['present'], 6)
+            self.assertEqual(profile['classes'][0]['streaks'],
+                             {'current_attended': 1, 'current_absent': 0, 'longest_attended': 1})
+            self.assertEqual(profile['student']['balance'], 600.0)
+            self.assertEqual((len(profile['packages']), len(profile['workshops']), len(profile['purchases']),
+                              len(profile['progress'])), (6, 6, 6, 6))
+            self.assertIsNone(student_profile(999999))
+
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+        self.assertEqual(self.app.get(f'/api/students/{large_id}/profile').get_json()['student']['name'], 'Large')
+        self.assertIn(b'Class Large 5', self.app.get(f'/students/{large_id}/profile').data)
+        with app.app_context():
+            first_class_id = Class.query.filter_by(name="Class Large 0").one().id
+        response = self.app.get(f'/attendance?class_id={first_class_id}&date=2081-05-02')
+        self.assertIn(b'Day 1: 1 present, 0 late, 0 absent', response.data)
+        self.assertEqual(self.app.get('/api/students/999999/profile').status_code, 404)
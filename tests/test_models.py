@@ -37,3 +37,183 @@ class ModelTestCase(BaseTestCase):
             
             re_fetched = LedgerTransaction.query.get(t.id)
             self.assertTrue(re_fetched.is_void)
+
+    def test_materialized_balance_follows_ledger(self):
+        """Unit Test: StudentBalance tracks inserts, voids and deletes"""
+        from database import StudentBalance, rebuild_student_balances
+        with app.app_context():
+            s = Student(name="Balance Student", phone="9800000001")
+            db.session.add(s)
+            db.session.commit()
+
+            t1 = LedgerTransaction(student_id=s.id, description="Fee", debit=4000.0, balance_after=4000.0)
+            t2 = LedgerTransaction(student_id=s.id, description="Payment", credit=1000.0, balance_after=3000.0)
+            db.session.add_all([t1, t2])
+            db.session.commit()
+            self.assertEqual(StudentBalance.query.get(s.id).balance, 3000.0)
+
+            t2.is_void = True
+            db.session.commit()
+            self.assertEqual(s.get_balance(), 4000.0)
+
+            db.session.delete(t1)
+            db.session.commit()
+            self.assertEqual(s.get_balance(), 0.0)
+            self.assertIsNone(StudentBalance.query.get(s.id))
+
+            # Rebuild regenerates the same rows from scratch
+            t2.is_void = False
+            db.session.commit()
+            StudentBalance.query.delete()
+            db.session.commit()
+            rebuild_student_balances()
+            self.assertEqual(s.get_balance(), 3000.0)
+
+    def test_monthly_summary_follows_writes(self):
+        """Unit Test: MonthlyFinanceSummary tracks ledger and expense writes per BS month"""
+        from database import Expense, MonthlyFinanceSummary, rebuild_monthly_summaries
+        with app.app_context():
+            s = Student(name="Rollup Student", phone="9800000002")
+            db.session.add(s)
+            db.session.commit()
+
+            pay = LedgerTransaction(student_id=s.id, date="2081-04-10", description="Payment", credit=2000.0, balance_after=-2000.0)
+            db.session.add_all([
+                pay,
+                LedgerTransaction(student_id=s.id, date="2081-05-01", description="Fee", debit=3000.0, balance_after=1000.0),
+                Expense(date="2081-04-15", amount=500.0, category="Misc"),
+            ])
+            db.session.commit()
+
+            april = MonthlyFinanceSummary.query.get(208104)
+            self.assertEqual((april.ledger_credit, april.expense_total), (2000.0, 500.0))
+            self.assertEqual(MonthlyFinanceSummary.query.get(208105).ledger_debit, 3000.0)
+
+            # Moving a row to another month updates both months
+            pay.date = "2081-05-02"
+            db.session.commit()
+            self.assertEqual(MonthlyFinanceSummary.query.get(208104).ledger_credit, 0.0)
+            self.assertEqual(MonthlyFinanceSummary.query.get(208105).ledger_credit, 2000.0)
+
+            MonthlyFinanceSummary.query.delete()
+            db.session.commit()
+            rebuild_monthly_summaries()
+            self.assertEqual(MonthlyFinanceSummary.query.get(208105).ledger_credit, 2000.0)
+            self.assertEqual(MonthlyFinanceSummary.query.get(208104).expense_total, 500.0)
+
+    def test_date_ordinals_filled_on_write(self):
+        """Unit Test: Date strings are zero-padded and mirrored into day ordinals"""
+        from database import Attendance, Class
+        with app.app_context():
+            s = Student(name="Ordinal Student", phone="9800000003")
+            c = Class(name="Ordinal Class")
+            db.session.add_all([s, c])
+            db.session.commit()
+
+            # Unpadded dates used to sort after padded ones as strings
+            early = Attendance(student_id=s.id, class_id=c.id, date="2081-4-9", status="Present")
+            late = Attendance(student_id=s.id, class_id=c.id, date="2081-04-10", status="Absent")
+            db.session.add_all([early, late])
+            db.session.commit()
+
+            self.assertEqual(early.date, "2081-04-09")
+            self.assertEqual(late.date_ord - early.date_ord, 1)
+            latest = Attendance.query.filter_by(student_id=s.id).order_by(Attendance.date_ord.desc()).first()
+            self.assertEqual(latest.status, "Absent")
+
+            # Edits keep the ordinal in step
+            early.date = "2081-04-11"
+            db.session.commit()
+            self.assertEqual(early.date_ord - late.date_ord, 1)
+
+    def test_bs_calendar_table_matches_library(self):
+        """Unit Test: Calendar table lookups agree with nepali_datetime"""
+        import nepali_datetime
+        from bs_calendar import (days_in_month, to_ordinal, from_ordinal, to_ad,
+                                 add_months, add_months_to_date, iter_months)
+        for year in (2000, 2080, 2081):
+            for month in range(1, 13):
+                first = nepali_datetime.date(year, month, 1)
+                length = days_in_month(year, month)
+                self.assertEqual(from_ordinal(first.toordinal() + length - 1), f"{year}-{month:02d}-{length:02d}")
+                self.assertEqual(to_ordinal(first.strftime('%Y-%m-%d')), first.toordinal())
+                self.assertEqual(to_ad(first.toordinal()), first.to_datetime_date())
+
+        self.assertEqual(add_months(2081, 11, 3), (2082, 2))
+        self.assertEqual(add_months(2081, 1, -1), (2080, 12))
+        # Day is clamped to the shorter target month
+        self.assertEqual(add_months_to_date("2081-02-32", 1), f"2081-03-{days_in_month(2081, 3):02d}")
+        self.assertEqual(list(iter_months((2081, 12), (2082, 1))), [(2081, 12), (2082, 1)])
+
+    def test_upcoming_birthdays_window(self):
+        """Unit Test: Birthday lookup wraps the year end and handles short months"""
+        from bs_calendar import to_ordinal, days_in_month
+        from birthdays import upcoming_birthdays
+        with app.app_context():
+            today = to_ordinal("2081-12-25")
+            db.session.add_all([
+                Student(name="Year End", phone="9800000010", dob="2060-12-28"),
+                Student(name="New Year", phone="9800000011", dob="2061-01-03"),
+                Student(name="Too Far", phone="9800000012", dob="2062-02-20"),
+                Student(name="Inactive", phone="9800000013", dob="2061-12-26", status="Inactive"),
+                Student(name="No DOB", phone="9800000014"),
+            ])
+            db.session.commit()
+
+            names = [s.name for s in upcoming_birthdays(30, today)]
+            self.assertEqual(names, ["Year End", "New Year"])
+            self.assertEqual(upcoming_birthdays(0, to_ordinal("2081-12-28"))[0].name, "Year End")
+
+            # A day-32 birthday shows on the last day of a shorter month
+            s = Student.query.filter_by(name="Too Far").first()
+            s.dob = "2060-03-32"
+            db.session.commit()
+            self.assertEqual((s.dob_month, s.dob_day), (3, 32))
+            last = to_ordinal(f"2081-03-{days_in_month(2081, 3):02d}")
+            self.assertEqual([x.name for x in upcoming_birthdays(0, last)], ["Too Far"])
+
+    def test_schedule_parsing(self):
+        """Unit Test: Builder output and legacy free-text schedules parse into weekly sessions"""
+        from timetable import parse_schedule
+        self.assertEqual(parse_schedule("Sun, Mon 18:00 - 19:30 | Starts 2081-04-01"),
+                         [(0, "18:00", "19:30"), (6, "18:00", "19:30")])
+        self.assertEqual(parse_schedule("Mon, Wed, Fri 6PM"),
+                         [(0, "18:00", None), (2, "18:00", None), (4, "18:00", None)])
+        self.assertEqual(parse_schedule("Tuesday & Thursday 6-7:30pm"),
+                         [(1, "18:00", "19:30"), (3, "18:00", "19:30")])
+        self.assertEqual(parse_schedule("Sat-Mon 7am to 8am"),
+                         [(0, "07:00", "08:00"), (5, "07:00", "08:00"), (6, "07:00", "08:00")])
+        self.assertEqual(parse_schedule("Batch 2, monthly"), [])
+
+    def test_attendance_month_bitmaps(self):
+        """Unit Test: Attendance writes maintain month bitmasks that rates, streaks and heatmaps read"""
+        from database import Attendance, AttendanceMonth, Class, rebuild_attendance_months
+        from attendance_stats import summarize, attendance_streaks, class_month_heatmap, month_rates
+        with app.app_context():
+            s = Student(name="Bits", phone="9800000030")
+            cls = Class(name="Ballet")
+            db.session.add_all([s, cls])
+            db.session.commit()
+            for day, status in [(1, "Present"), (2, "Late"), (3, "Absent"), (5, "Present"), (32, "Present")]:
+                db.session.add(Attendance(student_id=s.id, class_id=cls.id, date=f"2081-02-{day}", status=status))
+            db.session.add(Attendance(student_id=s.id, class_id=cls.id, date="2081-03-01", status="Absent"))
+            db.session.commit()
+
+            row = AttendanceMonth.query.filter_by(student_id=s.id, period=208102).one()
+            self.assertEqual((row.present_mask, row.late_mask, row.absent_mask), (0b1 | 0b10000 | 1 << 31, 0b10, 0b100))
+            months = AttendanceMonth.query.filter_by(student_id=s.id, class_id=cls.id).all()
+            self.assertEqual(summarize(months)['rate'], round(4 * 100 / 6, 1))
+            self.assertEqual(summarize([row])['marked'], 5)
+            self.assertEqual(attendance_streaks(months),
+                             {'current_attended': 0, 'current_absent': 1, 'longest_attended': 2})
+            self.assertEqual(class_month_heatmap(cls.id, 2081, 2)[1], {'day': 2, 'present': 0, 'late': 1, 'absent': 0, 'rate': 100.0})
+            self.assertEqual(month_rates(cls.id, 208103), {s.id: 0.0})
+
+            # Moving a record to another month updates both months; a rebuild reproduces the store
+            record = Attendance.query.filter_by(student_id=s.id, date="2081-03-01").one()
+            record.date = "2081-02-04"
+            db.session.commit()
+            self.assertIsNone(AttendanceMonth.query.filter_by(student_id=s.id, period=208103).first())
+            before = [(r.period, r.present_mask, r.late_mask, r.absent_mask) for r in AttendanceMonth.query.all()]
+            rebuild_attendance_months()
+            self.assertEqual([(r.period, r.present_mask, r.late_mask, r.absent_mask) for r in AttendanceMonth.query.all()], before)
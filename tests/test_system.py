@@ -52,7 +52,8 @@ class SystemTestCase(BaseTestCase):
     def test_permission_isolation(self):
         """System Test: Verify Staff cannot see Finance by default"""
         with app.app_context():
-            staff = User(username='staff_user', role='Staff', can_view_finance=False, password_hash='hash')
+            staff = User(username='staff_user', role='Staff', can_view_finance=False, can_view_attendance=False,
+                         password_hash='hash')
             db.session.add(staff)
             db.session.commit()
             
@@ -60,3 +61,209 @@ class SystemTestCase(BaseTestCase):
             # but we can test the helper logic
             self.assertFalse(staff.can_view_finance)
             self.assertTrue(staff.can_manage_students) # Default is True
+            staff_id = staff.id
+
+        # Report exports are held to the same permission as the reports page
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(staff_id)
+        for url in ('/reports/export/income', '/reports/export/attendance'):
+            response = self.app.get(url)
+            self.assertEqual(response.status_code, 302)
+            self.assertNotEqual(response.mimetype, 'text/csv')
+
+    def test_alerts_etag_and_invalidation(self):
+        """System Test: /api/alerts answers 304 until a ledger write changes the alert list"""
+        import cache
+        from routes.finance import add_transaction
+        cache.invalidate('alerts')
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+
+        first = self.app.get('/api/alerts')
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers['ETag']
+        self.assertEqual(self.app.get('/api/alerts', headers={'If-None-Match': etag}).status_code, 304)
+
+        with app.app_context():
+            s = Student(name="Big Debtor", phone="9855555555")
+            db.session.add(s)
+            db.session.commit()
+            add_transaction(s.id, description="Package", debit=9000.0)
+            db.session.commit()
+
+        changed = self.app.get('/api/alerts', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn("Big Debtor owes", changed.get_json()['alerts'][0]['message'])
+
+        # The stream opens with the current list, tagged with its ETag
+        stream = self.app.get('/api/alerts/stream')
+        chunks = iter(stream.response)
+        next(chunks) # retry hint
+        event = next(chunks)
+        event = event.decode() if isinstance(event, bytes) else event
+        self.assertIn("id: " + changed.headers['ETag'].strip('"'), event)
+        self.assertIn("Big Debtor owes", event)
+        stream.close()
+
+    def test_dashboard_sections(self):
+        """System Test: Dashboard shell renders alone; each section is cached JSON refreshed by writes"""
+        import cache
+        from routes.dashboard import SECTIONS
+        for name in SECTIONS:
+            cache.invalidate(f'dashboard.{name}')
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+
+        self.assertEqual(self.app.get('/').status_code, 200)
+        for name in SECTIONS:
+            response = self.app.get(f'/api/dashboard/{name}')
+            self.assertEqual(response.status_code, 200, name)
+            self.assertIn('desc="computed"', response.headers['Server-Timing'])
+        self.assertEqual(self.app.get('/api/dashboard/nope').status_code, 404)
+
+        first = self.app.get('/api/dashboard/counts')
+        self.assertIn('desc="cached"', first.headers['Server-Timing'])
+        students = first.get_json()['students']
+
+        with app.app_context():
+            db.session.add(Student(name="New Face", phone="9866666666"))
+            db.session.commit()
+
+        second = self.app.get('/api/dashboard/counts')
+        self.assertIn('desc="computed"', second.headers['Server-Timing'])
+        self.assertEqual(second.get_json()['students'], students + 1)
+
+    def test_attendance_rates_api(self):
+        """System Test: Attendance rates are grouped, sorted and paginated in SQL, then cached until attendance changes"""
+        import cache
+        from database import Attendance, Class, Instructor
+        cache.invalidate('attendance_rates')
+        with app.app_context():
+            inst = Instructor(name="Maya", phone="9800000040")
+            db.session.add(inst)
+            db.session.commit()
+            good, poor = Class(name="Good Class", instructor_id=inst.id), Class(name="Poor Class")
+            a, b = Student(name="Rate A", phone="9800000041"), Student(name="Rate B", phone="9800000042")
+            db.session.add_all([good, poor, a, b])
+            db.session.commit()
+            db.session.add_all([
+                Attendance(student_id=a.id, class_id=good.id, date="2081-05-01", status="Present"),
+                Attendance(student_id=b.id, class_id=good.id, date="2081-05-01", status="Late"),
+                Attendance(student_id=a.id, class_id=poor.id, date="2081-05-02", status="Absent"),
+                Attendance(student_id=b.id, class_id=poor.id, date="2081-05-02", status="Present"),
+                Attendance(student_id=a.id, class_id=poor.id, date="2081-06-01", status="Absent"), # Outside the range
+            ])
+            db.session.commit()
+            poor_id = poor.id
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+
+        params = 'start_date=2081-05-01&end_date=2081-05-20'
+        data = self.app.get(f'/api/attendance/rates/class?{params}').get_json()
+        self.assertEqual(data['total'], 2)
+        self.assertEqual([(r['name'], r['records'], r['rate']) for r in data['rows']],
+                         [("Poor Class", 2, 50.0), ("Good Class", 2, 100.0)])
+
+        page = self.app.get(f'/api/attendance/rates/student?{params}&per_page=1&page=2').get_json()
+        self.assertEqual((page['total'], [r['name'] for r in page['rows']]), (2, ["Rate B"]))
+        instructors = self.app.get(f'/api/attendance/rates/instructor?{params}&sort=name').get_json()['rows']
+        self.assertEqual([(r['name'], r['rate']) for r in instructors], [("Maya", 100.0), ("Unassigned", 50.0)])
+        self.assertEqual(self.app.get('/api/attendance/rates/room').status_code, 400)
+        self.assertEqual(self.app.get('/api/attendance/rates/class?end_date=2081-05-32').status_code, 400)
+
+        # An attendance write drops the cached page
+        with app.app_context():
+            record = Attendance.query.filter_by(class_id=poor_id, date="2081-05-02", status="Absent").one()
+            record.status = "Present"
+            db.session.commit()
+        data = self.app.get(f'/api/attendance/rates/class?{params}').get_json()
+        self.assertEqual(data['rows'][0]['rate'], 100.0)
+        self.assertEqual(self.app.get('/reports/attendance').status_code, 200)
+
+    def test_attendance_export_streams(self):
+        """System Test: Attendance CSV streams joined rows with class and month filters"""
+        from database import Attendance, Class
+        with app.app_context():
+            s = Student(name="Csv Kid", phone="9800000050")
+            jazz, salsa = Class(name="Jazz"), Class(name="Salsa")
+            db.session.add_all([s, jazz, salsa])
+            db.session.commit()
+            db.session.add_all([
+                Attendance(student_id=s.id, class_id=jazz.id, date="2081-05-01", status="Present"),
+                Attendance(student_id=s.id, class_id=jazz.id, date="2081-06-01", status="Absent"),
+                Attendance(student_id=s.id, class_id=salsa.id, date="2081-05-02", status="Late"),
+            ])
+            db.session.commit()
+            jazz_id = jazz.id
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+
+        response = self.app.get('/reports/export/attendance')
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.get_data(as_text=True).splitlines(), [
+            'Date,Class,Student Name,Status',
+            '2081-06-01,Jazz,Csv Kid,Absent',
+            '2081-05-02,Salsa,Csv Kid,Late',
+            '2081-05-01,Jazz,Csv Kid,Present',
+        ])
+
+        response = self.app.get(f'/reports/export/attendance?class_id={jazz_id}&month=2081-05')
+        self.assertIn(f'attendance_class_{jazz_id}_2081-05.csv', response.headers['Content-Disposition'])
+        self.assertEqual(response.get_data(as_text=True).splitlines()[1:], ['2081-05-01,Jazz,Csv Kid,Present'])
+        self.assertEqual(self.app.get('/reports/export/attendance?month=2081-13').status_code, 302)
+
+    def test_income_export_streams(self):
+        """System Test: Income CSV merges ledger and guest workshop payments newest first, optionally gzipped"""
+        import gzip
+        from database import Workshop, WorkshopEnrollment
+        with app.app_context():
+            s = Student(name="Income Kid", phone="9800000060")
+            w = Workshop(name="Hip Hop", start_date="2081-05-01", end_date="2081-05-05", fee=1500.0)
+            db.session.add_all([s, w])
+            db.session.commit()
+            student_id = s.id
+            db.session.add_all([
+                LedgerTransaction(student_id=s.id, date="2081-05-03", description="Fee payment", credit=2000.0, balance_after=-2000.0),
+                LedgerTransaction(student_id=s.id, date="2081-05-04", description="Voided", credit=900.0,
+                                  balance_after=-2900.0, is_void=True),
+                LedgerTransaction(student_id=s.id, date="2081-05-04", description="Monthly fee", debit=3000.0,
+                                  balance_after=100.0),
+                WorkshopEnrollment(workshop_id=w.id, guest_name="Walk In", date="2081-05-02", amount_paid=1500.0),
+                WorkshopEnrollment(workshop_id=w.id, guest_name="Later", date="2081-06-01", amount_paid=1500.0),
+            ])
+            db.session.commit()
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = str(self.admin_id)
+
+        url = '/reports/export/income?start_date=2081-05-01&end_date=2081-05-31'
+        response = self.app.get(url)
+        self.assertTrue(response.is_streamed)
+        expected = [
+            'Date,Name,Description,Amount',
+            '2081-05-03,Income Kid,Fee payment,2000.0',
+            '2081-05-02,Walk In (Guest),Workshop: Hip Hop,1500.0',
+        ]
+        self.assertEqual(response.get_data(as_text=True).splitlines(), expected)
+
+        response = self.app.get(url + '&gzip=1')
+        self.assertEqual(response.mimetype, 'application/gzip')
+        self.assertIn('.csv.gz', response.headers['Content-Disposition'])
+        self.assertEqual(gzip.decompress(response.get_data()).decode('utf-8').splitlines(), expected)
+        self.assertEqual(self.app.get('/reports/export/income?start_date=bad').status_code, 302)
+
+        # The reports page flags a bad date and shows the range it fell back to
+        import nepali_datetime
+        from bs_calendar import year_end
+        today_bs = nepali_datetime.date.today()
+        response = self.app.get('/reports?start_date=2081-05-01&end_date=2081-05-32')
+        self.assertIn(b'Invalid end date: 2081-05-32', response.data)
+        self.assertIn(b'value="2081-05-01"', response.data)
+        self.assertIn(f'value="{today_bs.strftime("%Y-%m-%d")}"'.encode(), response.data)
+        self.assertIn(f'data-this-year-end="{year_end(today_bs.year)}"'.encode(), response.data)
+        self.assertNotIn(b'Invalid', self.app.get(f'/reports?start_date=2081-01-01&end_date={year_end(2081)}').data)
+
+        # So does a student's ledger filter, which then applies only the valid bound
+        response = self.app.get(f'/finance/ledger/{student_id}?start_date=2081-05-04&end_date=2081-13-01')
+        self.assertIn(b'Invalid end date: 2081-13-01', response.data)
+        self.assertIn(b'Monthly fee', response.data)
+        self.assertNotIn(b'Fee payment', response.data)
@@ -0,0 +1,134 @@
+"""
+Weekly class timetable.
+
+Class.schedule stays the human-readable text ("Sun, Mon 18:00 - 19:30 | Starts
+2081-04-01" from the schedule builder, or older free text like "Mon, Wed, Fri 6PM").
+Each class also has one ClassSession row per weekday it meets, indexed by
+(weekday, start_time), which is what today's schedule, the weekly grid and the
+conflict checks query.
+"""
+import re
+from sqlalchemy.orm import joinedload
+from database import Class, ClassSession
+
+# Index = datetime.weekday(); the week is displayed Sunday first
+DAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+WEEK_ORDER = [6, 0, 1, 2, 3, 4, 5]
+
+_DAY = r'(mon|tue|wed|thu|fri|sat|sun)(?:day|sday|nesday|rsday|r|rs|s|urday)?\b\.?'
+_DAYS_RE = re.compile(_DAY + r'(?:\s*(?:-|–|to)\s*' + _DAY + r')?', re.I)
+_TIME_RE = re.compile(r'\b(\d{1,2})(?:[:.](\d{2}))?\s*([ap])?(?:\.?m\.?)?(?![\w:])', re.I)
+_RANGE_SEP_RE = re.compile(r'\s*(?:-|–|to)\s*$', re.I)
+_DATE_RE = re.compile(r'\d{4}-\d{1,2}-\d{1,2}')
+
+def _weekday(name):
+    return DAY_NAMES.index(name[:3].title())
+
+def _parse_days(text):
+    days = set()
+    for match in _DAYS_RE.finditer(text):
+        first = _weekday(match.group(1))
+        if match.group(2):
+            last = _weekday(match.group(2))
+            span = (last - first) % 7
+            days.update((first + i) % 7 for i in range(span + 1))
+        else:
+            days.add(first)
+    return days
+
+def _parse_times(text):
+    tokens = list(_TIME_RE.finditer(text))
+    times = []
+    for i, match in enumerate(tokens):
+        hour, minute, meridiem = int(match.group(1)), match.group(2), match.group(3)
+        if minute is None and meridiem is None:
+            # A bare hour only counts as the start of a range like "6-7PM"
+            following = tokens[i + 1] if i + 1 < len(tokens) else None
+            if not following or not _RANGE_SEP_RE.match(text[match.end():following.start()]):
+                continue
+            if following.group(2) is None and following.group(3) is None:
+                continue
+            meridiem = following.group(3)
+        if meridiem:
+            if hour > 12:
+                continue
+            hour = hour % 12 + (12 if meridiem.lower() == 'p' else 0)
+        minute = int(minute or 0)
+        if hour < 24 and minute < 60:
+            times.append(f"{hour:02d}:{minute:02d}")
+    return times
+
+def parse_schedule(text):
+    """
+    Schedule text -> sorted [(weekday, start_time, end_time)]. Times are 'HH:MM'
+    or None when the text has none; text without recognizable days gives [].
+    """
+    if not text:
+        return []
+    text = _DATE_RE.sub(' ', text.split('|')[0])
+    days = _parse_days(text)
+    times = _parse_times(_DAYS_RE.sub(' ', text))
+    start = times[0] if times else None
+    end = times[1] if len(times) > 1 else None
+    return [(day, start, end) for day in sorted(days)]
+
+def sync_sessions(cls):
+    """Rebuilds the class's sessions from its schedule text, each in the class's room."""
+    cls.sessions = [
+        ClassSession(weekday=day, start_time=start, end_time=end, room=cls.room)
+        for day, start, end in parse_schedule(cls.schedule)
+    ]
+
+def format_slot(session):
+    if session.start_time and session.end_time:
+        return f"{session.start_time} - {session.end_time}"
+    return session.start_time or 'Time not set'
+
+def find_conflicts(cls):
+    """
+    Other classes' sessions that overlap this class's sessions and share its
+    instructor or room -> [(session, other_session, reason)].
+    """
+    timed = [s for s in cls.sessions if s.start_time and s.end_time]
+    if not timed:
+        return []
+    others = (ClassSession.query.join(Class)
+              .options(joinedload(ClassSession.class_info))
+              .filter(ClassSession.weekday.in_({s.weekday for s in timed}),
+                      ClassSession.class_id != cls.id,
+                      ClassSession.start_time != None, ClassSession.end_time != None)
+              .all())
+    conflicts = []
+    for session in timed:
+        for other in others:
+            if other.weekday != session.weekday:
+                continue
+            if not (other.start_time < session.end_time and session.start_time < other.end_time):
+                continue
+            if cls.instructor_id and other.class_info.instructor_id == cls.instructor_id:
+                conflicts.append((session, other, 'same instructor'))
+            elif session.room and other.room and session.room.lower() == other.room.lower():
+                conflicts.append((session, other, f'room {session.room}'))
+    return conflicts
+
+def sessions_on(weekday):
+    """Today's-schedule query: the sessions on one weekday, by start time."""
+    return (ClassSession.query
+            .options(joinedload(ClassSession.class_info).joinedload(Class.instructor))
+            .filter(ClassSession.weekday == weekday)
+            .order_by(ClassSession.start_time, ClassSession.id)
+            .all())
+
+def weekly_grid(instructor_id=None):
+    """
+    [(day name, [sessions])] for the whole week, Sunday first, from one query;
+    optionally only one instructor's classes.
+    """
+    query = (ClassSession.query.join(Class)
+             .options(joinedload(ClassSession.class_info).joinedload(Class.instructor)))
+    if instructor_id:
+        query = query.filter(Class.instructor_id == instructor_id)
+    by_day = {day: [] for day in WEEK_ORDER}
+    for session in query.order_by(ClassSession.weekday, ClassSession.start_time, ClassSession.id):
+        by_day[session.weekday].append(session)
+    return [(DAY_NAMES[day], by_day[day]) for day in WEEK_ORDER]